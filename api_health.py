@@ -0,0 +1,82 @@
+"""Cached API credential health.
+
+Page views and uploads used to verify the Groq key with a live request every
+time. CredentialMonitor runs the check at most once per TTL in a background
+thread and serves the last result immediately. Real API calls feed it too:
+a 401 marks the key invalid at once, and a success counts as a fresh check.
+A rejected key is checked again after `recheck_unauthorized` seconds rather
+than a full TTL, so fixing it does not leave uploads refused for minutes.
+"""
+
+import threading
+import time
+from typing import Callable, Optional, Tuple
+
+# check() -> (is_valid, message)
+HealthCheck = Callable[[], Tuple[bool, str]]
+
+
+class CredentialMonitor:
+    def __init__(self, check: HealthCheck, ttl: float = 300.0, recheck_unauthorized: float = 30.0):
+        self.check = check
+        self.ttl = ttl
+        self.recheck_unauthorized = recheck_unauthorized
+        self._status: Optional[Tuple[bool, str]] = None
+        self._expires_at = 0.0
+        self._lock = threading.Lock()
+        # Notified when a check finishes; callers without any result wait on it
+        self._checked = threading.Condition(self._lock)
+        self._refreshing = False
+
+    def _record(self, status: Tuple[bool, str], ttl: Optional[float] = None):
+        with self._lock:
+            self._status = status
+            self._expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+
+    def _refresh(self):
+        try:
+            self._record(self.check())
+        finally:
+            with self._checked:
+                self._refreshing = False
+                self._checked.notify_all()
+
+    def refresh_async(self):
+        """Start a background check unless one is already running."""
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        threading.Thread(target=self._refresh, name="credential-check", daemon=True).start()
+
+    def status(self) -> Tuple[bool, str]:
+        """Return the cached (is_valid, message).
+
+        Only the first calls, before any result exists, wait for a check,
+        and they all share one; afterwards a stale result is returned while
+        a background check refreshes it.
+        """
+        with self._checked:
+            while self._status is None and self._refreshing:
+                self._checked.wait()
+            status = self._status
+            stale = time.monotonic() >= self._expires_at
+            run_check = status is None
+            if run_check:
+                self._refreshing = True
+
+        if run_check:
+            # If this check raises, the next caller runs its own
+            self._refresh()
+            return self._status
+        if stale:
+            self.refresh_async()
+        return status
+
+    def report_unauthorized(self, message: str):
+        """A real request was rejected with 401: the key is invalid now."""
+        self._record((False, f"API key rejected: {message}"), ttl=self.recheck_unauthorized)
+
+    def report_success(self):
+        """A real request succeeded, which is as good as a health check."""
+        self._record((True, "API key is valid"))
@@ -1,14 +1,41 @@
-from flask import Flask, render_template, request, redirect, url_for, flash
+from flask import Flask, Response, render_template, request, redirect, url_for, flash, jsonify, abort, g
 from werkzeug.utils import secure_filename
-import PyPDF2
-import sqlite3
 import os
+import time
 from datetime import datetime
 import requests
-from typing import List
+from typing import Iterable, List, Union
 from dotenv import load_dotenv  # Added for better env variable handling
 from flask import send_from_directory
-import subprocess
+from markupsafe import Markup, escape
+import uuid
+from backend.podcast import PodcastError, PodcastPipeline
+from api_health import CredentialMonitor
+from instrumentation import CONTENT_TYPE, REQUEST_SECONDS, observe, profiler, render, span, timed_iter
+from chunking import CHUNKING_VERSION, chunk_token_budget, get_token_counter, iter_chunks, resolve_tokenizer
+from db import (
+    MATCH_END,
+    MATCH_START,
+    Database,
+    get_document,
+    insert_document,
+    iter_document_text,
+    list_documents,
+    search_documents,
+)
+from http_client import client
+from jobs import JobQueue
+from pdf_extract import iter_pages
+from summarizer import (
+    DEFAULT_GROQ_API_URL,
+    GROQ_MODEL,
+    GroqAPIError,
+    PROMPT_VERSION,
+    SYSTEM_PROMPT,
+    chunk_prompt,
+    summarize_hierarchical,
+)
+from summary_cache import SummaryCache, file_hash
 
 # Load environment variables from .env file if it exists
 load_dotenv()
@@ -21,7 +48,54 @@ ALLOWED_EXTENSIONS = {"pdf"}
 
 # Groq API configuration
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
-GROQ_API_URL = "https://api.groq.com/openai/v1/chat/completions"
+GROQ_API_URL = os.getenv("GROQ_API_URL", DEFAULT_GROQ_API_URL)
+# Number of chunk summaries requested from Groq in parallel
+GROQ_MAX_CONCURRENCY = int(os.getenv("GROQ_MAX_CONCURRENCY", "4"))
+GROQ_MAX_RETRIES = int(os.getenv("GROQ_MAX_RETRIES", "5"))
+# How many summaries are merged into one at each reduce level
+GROQ_REDUCE_FAN_IN = int(os.getenv("GROQ_REDUCE_FAN_IN", "4"))
+
+# Chunks are sized in tokens: what fits in llama3-70b-8192's context next to
+# the summarization prompt and the 1000-token reply
+CHUNK_TOKENIZER = resolve_tokenizer(os.getenv("CHUNK_TOKENIZER", "auto"))
+count_tokens = get_token_counter(CHUNK_TOKENIZER)
+CHUNK_MAX_TOKENS = chunk_token_budget(count_tokens, SYSTEM_PROMPT + chunk_prompt(""), 8192, 1000)
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "100"))
+
+# Everything besides the file that shapes a document's summary; changing any of
+# it must not serve whole-document summaries made under the old settings
+SUMMARY_SETTINGS = "/".join(
+    str(setting)
+    for setting in (
+        PROMPT_VERSION,
+        CHUNKING_VERSION,
+        CHUNK_TOKENIZER,
+        CHUNK_MAX_TOKENS,
+        CHUNK_OVERLAP_TOKENS,
+        GROQ_REDUCE_FAN_IN,
+    )
+)
+
+# Summaries are cached by content hash so re-uploads skip unchanged chunks
+summary_cache = SummaryCache(
+    os.getenv("SUMMARY_CACHE_PATH", "summary_cache.db"),
+    max_bytes=int(os.getenv("SUMMARY_CACHE_MAX_MB", "256")) * 1024 * 1024,
+)
+
+# One pipeline for the whole process keeps its Groq/ElevenLabs connections warm
+podcast_pipeline = PodcastPipeline(groq_api_key=GROQ_API_KEY, groq_api_url=GROQ_API_URL)
+
+# Pooled, WAL-mode connections shared by the routes and the job workers
+db = Database("pdf_summaries.db", pool_size=int(os.getenv("DB_POOL_SIZE", "8")))
+
+# Uploads are processed by background workers; jobs live in pdf_summaries.db
+job_queue = JobQueue(db, workers=int(os.getenv("JOB_WORKERS", "2")))
+
+# Notes listed per page on the home page and the search page
+DOCUMENTS_PER_PAGE = int(os.getenv("DOCUMENTS_PER_PAGE", "20"))
+
+# PROFILE_REQUESTS=1 starts with slow-request profiling on; kill -USR2 toggles it
+profiler.install_toggle()
 
 # Print API key status for debugging (remove in production)
 print(f"API Key status: {'Configured' if GROQ_API_KEY else 'Not configured'}")
@@ -36,56 +110,17 @@ def allowed_file(filename):
 
 
 def init_db():
-     # Delete the existing database file to reset the documents
-    if os.path.exists("pdf_summaries.db"):
-        os.remove("pdf_summaries.db")
-
-    conn = sqlite3.connect("pdf_summaries.db")
-    c = conn.cursor()
-    c.execute(
-        """
-        CREATE TABLE IF NOT EXISTS documents (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            filename TEXT NOT NULL,
-            original_text TEXT NOT NULL,
-            summary TEXT NOT NULL,
-            upload_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    """
-    )
-    conn.commit()
-    conn.close()
+    # The database is kept across restarts so queued upload jobs are not lost;
+    # migrations only bring its schema up to date
+    db.migrate()
 
 
 def extract_text_from_pdf(file_path):
-    with open(file_path, "rb") as file:
-        pdf_reader = PyPDF2.PdfReader(file)
-        text = ""
-        for page in pdf_reader.pages:
-            text += page.extract_text()
-    return text
-
+    return "".join(iter_pages(file_path))
 
-def chunk_text(text: str, chunk_size: int = 8000) -> List[str]:
-    words = text.split()
-    chunks = []
-    current_chunk = []
-    current_length = 0
 
-    for word in words:
-        word_length = len(word) + 1
-        if current_length + word_length > chunk_size:
-            chunks.append(" ".join(current_chunk))
-            current_chunk = [word]
-            current_length = word_length
-        else:
-            current_chunk.append(word)
-            current_length += word_length
-
-    if current_chunk:
-        chunks.append(" ".join(current_chunk))
-
-    return chunks
+def chunk_text(text: str) -> List[str]:
+    return list(iter_chunks([text], CHUNK_MAX_TOKENS, CHUNK_OVERLAP_TOKENS, count_tokens))
 
 
 def verify_api_key():
@@ -105,86 +140,83 @@ def verify_api_key():
     }
 
     try:
-        response = requests.post(GROQ_API_URL, headers=headers, json=test_payload)
+        response = client.post(GROQ_API_URL, headers=headers, json=test_payload, timeout=10, retries=0, endpoint="groq.health")
         response.raise_for_status()
         return True, "API key is valid"
     except requests.exceptions.RequestException as e:
         return False, f"API key verification failed: {str(e)}"
 
 
-def summarize_with_groq(text: str) -> str:
-    """Summarize text using Groq API."""
-    # Verify API key before proceeding
-    is_valid, message = verify_api_key()
-    if not is_valid:
-        raise ValueError(message)
-
-    headers = {
-        "Authorization": f"Bearer {GROQ_API_KEY}",
-        "Content-Type": "application/json",
-    }
-
-    chunks = chunk_text(text)
-    summaries = []
-
-    for chunk in chunks:
-        prompt = f"""Please provide a concise summary of the following text. Focus on the main points and key information:
-
-{chunk}
-
-Provide the summary in a clear, professional style."""
+# Serves the last verify_api_key() result; re-checked in the background after the TTL
+api_key_monitor = CredentialMonitor(
+    verify_api_key,
+    ttl=float(os.getenv("API_KEY_CHECK_TTL", "300")),
+    # After a 401, check again this soon in case the key has been fixed
+    recheck_unauthorized=float(os.getenv("API_KEY_RECHECK_UNAUTHORIZED", "30")),
+)
 
-        payload = {
-            "messages": [
-                {
-                    "role": "system",
-                    "content": "You are a professional document summarizer. Provide clear, accurate, and concise summaries.",
-                },
-                {"role": "user", "content": prompt},
-            ],
-            "model": "llama3-70b-8192",
-            "temperature": 0.3,
-            "max_tokens": 1000,
-        }
-
-        try:
-            response = requests.post(GROQ_API_URL, headers=headers, json=payload)
-            response.raise_for_status()
-            summary = response.json()["choices"][0]["message"]["content"]
-            summaries.append(summary)
-        except requests.exceptions.RequestException as e:
-            raise Exception(f"Error calling Groq API: {str(e)}")
 
-    if len(summaries) > 1:
-        combined_summary = "\n\n".join(summaries)
+def summarize_with_groq(text: Union[str, Iterable[str]]) -> str:
+    """Summarize text using Groq API.
 
-        if len(combined_summary) > 4000:
-            final_summary_prompt = f"""Please provide a unified summary of these related text segments:
-
-{combined_summary}
-
-Create a coherent, flowing summary that captures the main points from all segments."""
-
-            payload = {
-                "messages": [
-                    {
-                        "role": "system",
-                        "content": "You are a professional document summarizer. Provide clear, accurate, and concise summaries.",
-                    },
-                    {"role": "user", "content": final_summary_prompt},
-                ],
-                "model": "llama3-70b-8192",
-                "temperature": 0.3,
-                "max_tokens": 1000,
-            }
-
-            response = requests.post(GROQ_API_URL, headers=headers, json=payload)
-            response.raise_for_status()
-            return response.json()["choices"][0]["message"]["content"]
+    `text` may also be an iterable of pages; chunks are then sent to Groq as
+    soon as they fill up, while later pages are still being extracted.
+    """
+    # Check the cached API key status before proceeding
+    is_valid, message = api_key_monitor.status()
+    if not is_valid:
+        raise ValueError(message)
 
-        return combined_summary
+    pages = [text] if isinstance(text, str) else text
+    chunks = timed_iter(iter_chunks(pages, CHUNK_MAX_TOKENS, CHUNK_OVERLAP_TOKENS, count_tokens), "chunking")
+    try:
+        summary, levels = summarize_hierarchical(
+            chunks,
+            GROQ_API_KEY,
+            fan_in=GROQ_REDUCE_FAN_IN,
+            max_workers=GROQ_MAX_CONCURRENCY,
+            api_url=GROQ_API_URL,
+            max_retries=GROQ_MAX_RETRIES,
+            cache=summary_cache,
+        )
+    except GroqAPIError as e:
+        if e.status_code == 401:
+            api_key_monitor.report_unauthorized(str(e))
+        raise
+    api_key_monitor.report_success()
+    for level in levels:
+        observe("summarize.map" if level["level"] == 0 else "summarize.reduce", level["seconds"])
+        print(
+            f"Summary level {level['level']}: {level['inputs']} -> {level['outputs']} "
+            f"in {level['seconds']:.2f}s"
+        )
+    # This document's own counts; other jobs share the cache concurrently
+    hits = sum(level["cache_hits"] for level in levels)
+    misses = sum(level["cache_misses"] for level in levels)
+    print(f"Summary cache: {hits} hits, {misses} misses")
+    return summary
+
+def summarize_pdf(file_path: str):
+    """Return (text, summary) for a PDF, reusing the cached result for a file
+    whose exact bytes were summarized before."""
+    document_key = SummaryCache.make_key("document", file_hash(file_path), GROQ_MODEL, SUMMARY_SETTINGS)
+    cached = summary_cache.get_document(document_key)
+    if cached is not None:
+        print(f"Summary cache hit for {file_path}")
+        return cached
+
+    pages = []
+
+    def stream_pages():
+        for page in timed_iter(iter_pages(file_path), "pdf.extract_page"):
+            pages.append(page)
+            yield page
+
+    summary = summarize_with_groq(stream_pages())
+    text = "".join(pages)
+    summary_cache.put_document(document_key, text, summary)
+    return text, summary
 
-    return summaries[0]
 
 def extract_topic(text: str) -> str:
     """Extracts the topic of the text. Defaults to the first sentence."""
@@ -197,28 +229,26 @@ def extract_topic(text: str) -> str:
         print(f"Error extracting topic: {str(e)}")
         return "Unknown Topic"
     
-def generate_podcast_for_uploaded_document(filename):
+def podcast_path(document_id):
+    """Every document gets its own podcast file."""
+    return os.path.join(podcast_pipeline.audio_dir, f"podcast_{document_id}.mp3")
+
+
+def generate_podcast_for_uploaded_document(document_id):
     """Trigger the podcast generation after document is processed."""
-    conn = sqlite3.connect("pdf_summaries.db")
-    c = conn.cursor()
-    c.execute("SELECT id, summary FROM documents WHERE filename = ?", (filename,))
-    document = c.fetchone()
-    conn.close()
+    # By id: the same filename can be uploaded any number of times
+    with span("db.find_document"), db.connect() as conn:
+        document = conn.execute("SELECT id, summary FROM documents WHERE id = ?", (document_id,)).fetchone()
 
     if document:
         summary = document[1]
 
         try:
-            # Run the external script to generate the podcast with the document summary
-            result = subprocess.run(
-                ["python3", "backend/generatePodcast_v2.0.py", summary],
-                text=True,
-                capture_output=True,
-                check=True
-            )
-            print("Podcast generation successful:", result.stdout)  # Optionally log output
-        except subprocess.CalledProcessError as e:
-            print(f"Error generating podcast: {e.stderr}")
+            # Generate the podcast in-process with the document summary
+            output_path = podcast_pipeline.generate(summary, podcast_path(document[0]))
+            print("Podcast generation successful:", output_path)
+        except PodcastError as e:
+            print(f"Error generating podcast: {str(e)}")
             raise Exception(f"Podcast generation failed: {str(e)}")
 
     else:
@@ -226,20 +256,22 @@ def generate_podcast_for_uploaded_document(filename):
 
 @app.route("/")
 def index():
-    # Verify API key status
-    api_status, api_message = verify_api_key()
+    # Cached API key status; never waits on Groq once the first check is done
+    api_status, api_message = api_key_monitor.status()
 
-    conn = sqlite3.connect("pdf_summaries.db")
-    c = conn.cursor()
-    c.execute(
-        "SELECT id, filename, summary, upload_date FROM documents ORDER BY upload_date DESC"
-    )
-    documents = c.fetchall()
-    conn.close()
+    # Keyset pagination: the next page starts after the last (date, id) shown
+    before = None
+    if request.args.get("before_date") and request.args.get("before_id", type=int):
+        before = (request.args["before_date"], request.args.get("before_id", type=int))
+
+    with db.connect() as conn:
+        documents, next_cursor = list_documents(conn, DOCUMENTS_PER_PAGE, before)
 
     return render_template(
         "index.html",
         documents=documents,
+        next_cursor=next_cursor,
+        jobs=job_queue.recent(),
         api_status=api_status,
         api_message=api_message,
     )
@@ -247,8 +279,8 @@ def index():
 
 @app.route("/upload", methods=["POST"])
 def upload_file():
-    # Verify API key first
-    api_status, api_message = verify_api_key()
+    # Check the cached API key status first
+    api_status, api_message = api_key_monitor.status()
     if not api_status:
         flash(f"API Configuration Error: {api_message}")
         return redirect(url_for("index"))
@@ -265,57 +297,144 @@ def upload_file():
     if file and allowed_file(file.filename):
         try:
             filename = secure_filename(file.filename)
-            file_path = os.path.join(app.config["UPLOAD_FOLDER"], filename)
+            # Prefix with a unique id so queued uploads with the same name don't collide
+            file_path = os.path.join(app.config["UPLOAD_FOLDER"], f"{uuid.uuid4().hex}_{filename}")
             file.save(file_path)
 
-            text = extract_text_from_pdf(file_path)
-
-            try:
-                summary = summarize_with_groq(text)
-            except Exception as e:
-                flash(f"Error during summarization: {str(e)}")
-                os.remove(file_path)
-                return redirect(url_for("index"))
-
-            # Insert data into the database, including the topic
-            conn = sqlite3.connect("pdf_summaries.db")
-            c = conn.cursor()
-            c.execute(
-                """
-                INSERT INTO documents (filename, original_text, summary)
-                VALUES (?, ?, ?)
-                """,
-                (filename, text, summary),
-            )
-            conn.commit()
-            conn.close()
-
-            os.remove(file_path)
-
-            flash("File successfully processed and summarized")
-
-            # Call the function to generate podcast after the upload and processing
-            try:
-                # Now call the generate_podcast function or the subprocess
-                generate_podcast_for_uploaded_document(filename)
-            except Exception as e:
-                flash(f"Error generating podcast: {str(e)}")
-
+            job_id = job_queue.submit("upload", {"filename": filename, "file_path": file_path})
         except Exception as e:
             flash(f"Error processing file: {str(e)}")
+            return redirect(url_for("index"))
+
+        if request.accept_mimetypes.best == "application/json":
+            return jsonify({"job_id": job_id, "status_url": url_for("job_status", job_id=job_id)}), 202
+
+        flash("File uploaded; summarization has started")
+        return redirect(url_for("index"))
     else:
         flash("Allowed file type is PDF")
 
     return redirect(url_for("index"))
 
 
+def process_upload_job(payload, report):
+    """Job handler: summarize an uploaded PDF, store it and generate its podcast."""
+    filename = payload["filename"]
+    file_path = payload["file_path"]
+
+    try:
+        report("summarizing", 0.1)
+        text, summary = summarize_pdf(file_path)
+
+        report("saving", 0.6)
+        with db.transaction() as conn:
+            document_id = insert_document(conn, filename, text, summary)
+    finally:
+        if os.path.exists(file_path):
+            os.remove(file_path)
+
+    result = {"document_id": document_id}
+
+    report("generating podcast", 0.7)
+    try:
+        generate_podcast_for_uploaded_document(document_id)
+    except Exception as e:
+        # The summary is already saved; record the podcast failure on the job
+        result["podcast_error"] = str(e)
+
+    return result
+
+
+job_queue.register("upload", process_upload_job)
+
+
+@app.before_request
+def start_job_workers():
+    # Idempotent; starting lazily keeps the reloader's parent process idle
+    job_queue.start()
+
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+    # None unless profiling is on and no other request is being profiled
+    g.profile = profiler.start(f"{request.method} {request.path}")
+
+
+@app.after_request
+def record_request_time(response):
+    # Missing when an earlier before_request handler failed or returned a response
+    start = g.get("request_start")
+    if start is not None:
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        REQUEST_SECONDS.observe(
+            time.perf_counter() - start, method=request.method, route=route, status=response.status_code
+        )
+    return response
+
+
+@app.teardown_request
+def stop_request_profile(exc):
+    if g.get("profile") is not None:
+        g.profile.stop()
+
+
+@app.route("/jobs/<int:job_id>")
+def job_status(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+
+    result = job["result"] or {}
+    return jsonify(
+        {
+            "id": job["id"],
+            "filename": job["payload"].get("filename"),
+            "status": job["status"],
+            "stage": job["stage"],
+            "progress": job["progress"],
+            "error": job["error"],
+            "document_id": result.get("document_id"),
+            "podcast_error": result.get("podcast_error"),
+        }
+    )
+
+
+def highlight_matches(text: str) -> Markup:
+    """Escape search-result text and mark up the matched terms."""
+    return Markup(str(escape(text)).replace(MATCH_START, "<mark>").replace(MATCH_END, "</mark>"))
+
+
+@app.route("/search")
+def search():
+    query = request.args.get("q", "").strip()
+    page = max(request.args.get("page", 1, type=int), 1)
+
+    with db.connect() as conn:
+        rows, has_more = search_documents(
+            conn, query, DOCUMENTS_PER_PAGE, (page - 1) * DOCUMENTS_PER_PAGE
+        )
+    results = [
+        {
+            "id": document_id,
+            "filename": filename,
+            "upload_date": upload_date,
+            "filename_html": highlight_matches(filename_match),
+            "snippet_html": highlight_matches(snippet),
+        }
+        for document_id, filename, upload_date, filename_match, snippet in rows
+    ]
+
+    if request.accept_mimetypes.best == "application/json":
+        return jsonify({"query": query, "page": page, "has_more": has_more, "results": results})
+    return render_template("search.html", query=query, page=page, has_more=has_more, results=results)
+
+
 @app.route("/document/<int:id>")
 def view_document(id):
-    conn = sqlite3.connect("pdf_summaries.db")
-    c = conn.cursor()
-    c.execute("SELECT * FROM documents WHERE id = ?", (id,))
-    document = c.fetchone()
-    conn.close()
+    with db.connect() as conn:
+        # The extracted text stays in document_texts; see view_document_text
+        document = get_document(conn, id)
 
     if document is None:
         flash("Document not found")
@@ -323,10 +442,37 @@ def view_document(id):
     return render_template("document.html", document=document)
 
 
-@app.route('/audio/final_podcast')
-def serve_audio():
-    return send_from_directory('backend/audio', 'final_podcast.mp3')
+@app.route("/document/<int:id>/text")
+def view_document_text(id):
+    """Stream the extracted PDF text, decompressing it as it is sent."""
+    with db.connect() as conn:
+        text = iter_document_text(conn, id)
+    if text is None:
+        abort(404)
+    return Response(text, mimetype="text/plain; charset=utf-8")
+
+
+@app.route("/metrics")
+def metrics():
+    """Stage and request latency histograms in the Prometheus text format."""
+    return Response(render(), content_type=CONTENT_TYPE)
+
+
+@app.route("/metrics/http")
+def http_metrics():
+    """Latency and error counts for every outbound API endpoint."""
+    return jsonify(client.metrics())
+
+
+@app.route('/audio/podcast/<int:id>')
+def serve_audio(id):
+    return send_from_directory(podcast_pipeline.audio_dir, os.path.basename(podcast_path(id)))
 
 if __name__ == "__main__":
     init_db()
+    # Warm the API key status so the first page view doesn't wait for it
+    api_key_monitor.refresh_async()
+    # With the debug reloader, only the serving child process runs workers
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        job_queue.start()
     app.run(debug=True)
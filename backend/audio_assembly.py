@@ -0,0 +1,166 @@
+"""Linear-time concatenation of per-line podcast clips.
+
+`sum()` over pydub AudioSegments copies the whole podcast's PCM once per
+clip. Instead, when every clip is an MP3 with the same stream parameters
+(what ElevenLabs returns) their frames are copied straight into the output
+without decoding. Otherwise clips are decoded one at a time and their PCM is
+piped into a single ffmpeg encoder, so memory stays bounded by one clip.
+"""
+
+import subprocess
+
+from pydub import AudioSegment
+from pydub.utils import get_encoder_name
+
+# kbps by [MPEG-1?][layer index] (layer index 1 = Layer III, 2 = Layer II, 3 = Layer I)
+BITRATES = {
+    (True, 3): [0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448],
+    (True, 2): [0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384],
+    (True, 1): [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    (False, 3): [0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256],
+    (False, 2): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+    (False, 1): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+SAMPLE_RATES = {3: [44100, 48000, 32000], 2: [22050, 24000, 16000], 0: [11025, 12000, 8000]}
+
+
+def _skip_id3v2(data):
+    if data[:3] == b"ID3" and len(data) >= 10:
+        size = (data[6] << 21) | (data[7] << 14) | (data[8] << 7) | data[9]
+        footer = 10 if data[5] & 0x10 else 0
+        return 10 + size + footer
+    return 0
+
+
+def _parse_header(data, offset):
+    """Return (frame_length, (version, layer, sample_rate, channels)) for the
+    frame header at `offset`, or None if it is not a valid header."""
+    if offset + 4 > len(data):
+        return None
+    b1, b2, b3 = data[offset + 1], data[offset + 2], data[offset + 3]
+    if data[offset] != 0xFF or (b1 & 0xE0) != 0xE0:
+        return None
+
+    version = (b1 >> 3) & 0x03  # 3 = MPEG-1, 2 = MPEG-2, 0 = MPEG-2.5
+    layer = (b1 >> 1) & 0x03
+    bitrate_index = (b2 >> 4) & 0x0F
+    sample_rate_index = (b2 >> 2) & 0x03
+    if version == 1 or layer == 0 or bitrate_index in (0, 15) or sample_rate_index == 3:
+        return None
+
+    mpeg1 = version == 3
+    bitrate = BITRATES[(mpeg1, layer)][bitrate_index] * 1000
+    sample_rate = SAMPLE_RATES[version][sample_rate_index]
+    padding = (b2 >> 1) & 0x01
+    channels = 1 if (b3 >> 6) == 3 else 2
+
+    if layer == 3:
+        length = (12 * bitrate // sample_rate + padding) * 4
+    elif layer == 1 and not mpeg1:
+        length = 72 * bitrate // sample_rate + padding
+    else:
+        length = 144 * bitrate // sample_rate + padding
+    return length, (version, layer, sample_rate, channels)
+
+
+def mp3_frames(data):
+    """Split MP3 bytes into audio frames.
+
+    Returns (stream_params, frames) where frames is a list of (start, end)
+    offsets, or None if `data` is not a clean MP3 stream. ID3 tags and the
+    Xing/Info header frame (whose frame count would be wrong after
+    concatenation) are skipped.
+    """
+    offset = _skip_id3v2(data)
+    end = len(data) - 128 if data[-128:-125] == b"TAG" else len(data)
+    params = None
+    frames = []
+
+    while offset < end:
+        header = _parse_header(data, offset)
+        if header is None:
+            return None
+        length, frame_params = header
+        if params is None:
+            params = frame_params
+        elif frame_params != params or offset + length > end:
+            return None
+
+        frame = data[offset : offset + min(length, 64)]
+        if frames or not any(tag in frame for tag in (b"Xing", b"Info", b"VBRI")):
+            frames.append((offset, offset + length))
+        offset += length
+
+    return (params, frames) if frames else None
+
+
+def concat_mp3(files, output_path):
+    """Copy the frames of every clip into output_path without re-encoding.
+
+    Returns False (writing nothing) if the clips are not all MP3 streams with
+    identical parameters.
+    """
+    params = None
+    for file in files:
+        with open(file, "rb") as f:
+            parsed = mp3_frames(f.read())
+        if parsed is None or (params is not None and parsed[0] != params):
+            return False
+        params = parsed[0]
+
+    # Second pass writes; only one clip is held in memory at a time
+    with open(output_path, "wb") as out:
+        for file in files:
+            with open(file, "rb") as f:
+                data = f.read()
+            for start, end in mp3_frames(data)[1]:
+                out.write(data[start:end])
+    return True
+
+
+def concat_reencode(files, output_path, format="mp3", bitrate="128k"):
+    """Decode clips one at a time and stream their PCM through one encoder."""
+    first = AudioSegment.from_file(files[0])
+    command = [
+        get_encoder_name(),
+        "-y",
+        "-loglevel", "error",
+        "-f", f"s{first.sample_width * 8}le",
+        "-ar", str(first.frame_rate),
+        "-ac", str(first.channels),
+        "-i", "pipe:0",
+        "-b:a", bitrate,
+        "-f", format,
+        output_path,
+    ]
+    encoder = subprocess.Popen(command, stdin=subprocess.PIPE, stderr=subprocess.PIPE)
+    try:
+        for i, file in enumerate(files):
+            segment = first if i == 0 else AudioSegment.from_file(file)
+            segment = (
+                segment.set_frame_rate(first.frame_rate)
+                .set_channels(first.channels)
+                .set_sample_width(first.sample_width)
+            )
+            encoder.stdin.write(segment.raw_data)
+        encoder.stdin.close()
+    except BrokenPipeError:
+        pass
+    stderr = encoder.stderr.read()
+    if encoder.wait() != 0:
+        raise RuntimeError(f"Encoding podcast failed: {stderr.decode('utf-8', 'replace')}")
+
+
+def assemble(files, output_path, passthrough=True):
+    """Concatenate clips into output_path in a single linear pass.
+
+    With `passthrough`, compatible MP3 clips are joined frame by frame;
+    anything else falls back to decoding and re-encoding. Returns "copy" or
+    "reencode" to say which path was taken.
+    """
+    if not files:
+        raise ValueError("No audio clips to assemble")
+    if passthrough and output_path.endswith(".mp3") and concat_mp3(files, output_path):
+        return "copy"
+    concat_reencode(files, output_path, format=output_path.rsplit(".", 1)[-1])
+    return "reencode"
@@ -1,9 +1,14 @@
-import requests
 import os
+import sys
 import urllib.parse
 import time
 from dotenv import load_dotenv
 
+# Make the shared http_client importable when run from backend/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from http_client import client  # noqa: E402
+
 # Load environment variables
 load_dotenv()
 
@@ -35,7 +40,12 @@ files = {
 }
 
 # Send the POST request
-response = requests.post(url, headers=headers, files=files)
+# Only retry rate limits: a 5xx, a dropped connection or a read timeout
+# may come after the PlayNote was created, and a retry would make a second
+# one. (POST already leaves those errors unretried; this says so explicitly.)
+response = client.post(
+    url, headers=headers, files=files, endpoint="playai.playnotes", retry_status={429}, retry_errors=False
+)
 
 # Initialize PlayNoteID
 playNoteId = ''
@@ -57,7 +67,7 @@ if (playNoteId != ''):
 
     # Poll for completion
     while True:
-        response = requests.get(status_url, headers=headers)
+        response = client.get(status_url, headers=headers, endpoint="playai.playnote_status")
         if response.status_code == 200:
             playnote_data = response.json()
             status = playnote_data['status']
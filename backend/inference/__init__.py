@@ -0,0 +1,6 @@
+"""Batched inference engine behind the FastAPI server in backend/main.py.
+
+Modules here import each other relatively, so the package works both as
+`inference` (main.py runs with backend/ as the working directory) and as
+`backend.inference` (benchmarks run from the repo root).
+"""
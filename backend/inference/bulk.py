@@ -0,0 +1,70 @@
+"""Bulk generation: many prompts through the scheduler, results as they finish.
+
+Prompts are admitted shortest first, at most `concurrency` at a time (by
+default the scheduler's batch size). Sequences that share a prefill step
+are then close in length, so little of it is padding. Because each
+finishing item frees its slot for the next one, the batch stays full until
+the queue runs out. Results come back in completion order, each with its
+own timings, so callers can stream them instead of waiting for the
+slowest item.
+"""
+
+import asyncio
+import time
+from dataclasses import dataclass
+from typing import AsyncIterator, List, Optional, Sequence
+
+from .sampling import SamplingParams
+from .scheduler import SchedulerBusy
+
+
+@dataclass
+class BulkResult:
+    index: int  # position in the submitted list
+    token_ids: List[int]
+    queued_seconds: float  # waiting for a slot
+    latency_seconds: float  # from admission to the last token
+    error: Optional[str] = None
+
+
+async def generate_bulk(
+    scheduler,
+    prompts: Sequence[List[int]],
+    max_tokens: int,
+    sampling: SamplingParams,
+    concurrency: Optional[int] = None,
+    sort: bool = True,
+) -> AsyncIterator[BulkResult]:
+    """Generate for every prompt in `prompts`, yielding results as they
+    finish. Closing the iterator early cancels whatever is still running."""
+    start = time.perf_counter()
+    order = sorted(range(len(prompts)), key=lambda i: len(prompts[i])) if sort else range(len(prompts))
+    # asyncio.Semaphore wakes waiters in FIFO order, so slots go out in `order`
+    slots = asyncio.Semaphore(concurrency or scheduler.max_batch_size)
+    results: asyncio.Queue = asyncio.Queue()
+
+    async def run(index: int):
+        async with slots:
+            admitted = time.perf_counter()
+            token_ids: List[int] = []
+            error = None
+            try:
+                stream = scheduler.generate(prompts[index], max_tokens, sampling)
+                try:
+                    async for token in stream:
+                        token_ids.append(token)
+                finally:
+                    # Cancels the sequence right away if this task is cancelled
+                    await stream.aclose()
+            except (SchedulerBusy, RuntimeError) as e:
+                error = str(e)
+            finished = time.perf_counter()
+            await results.put(BulkResult(index, token_ids, admitted - start, finished - admitted, error))
+
+    tasks = [asyncio.ensure_future(run(index)) for index in order]
+    try:
+        for _ in tasks:
+            yield await results.get()
+    finally:
+        for task in tasks:
+            task.cancel()
@@ -0,0 +1,95 @@
+"""Incremental detokenization and batched flushing for streamed text.
+
+Decoding each token on its own breaks characters that span several
+byte-level tokens (they come out as U+FFFD) and drops the spaces that
+SentencePiece attaches to the following token. IncrementalDetokenizer
+instead decodes a short window of recent tokens and emits only the text
+that became final. It holds back output while the window ends in an
+incomplete character.
+
+detokenize_stream groups that text into chunks of several tokens or
+milliseconds, so the endpoints serialize and write one line per chunk
+rather than one per token.
+"""
+
+import time
+from typing import AsyncIterator, List
+
+
+class IncrementalDetokenizer:
+    def __init__(self, tokenizer, skip_special_tokens: bool = True):
+        self.tokenizer = tokenizer
+        self.skip_special_tokens = skip_special_tokens
+        # Fast tokenizers can decode through the Rust backend directly, about
+        # 4x cheaper per call, unless decode() has post-processing to apply
+        backend = getattr(tokenizer, "backend_tokenizer", None)
+        if backend is not None and not getattr(tokenizer, "clean_up_tokenization_spaces", False):
+            self._decode = lambda ids: backend.decode(ids, skip_special_tokens=skip_special_tokens)
+        self.ids: List[int] = []
+        # ids[prefix_offset:read_offset] is context already emitted; decoding
+        # it again gives the baseline to diff against
+        self.prefix_offset = 0
+        self.read_offset = 0
+        self._prefix_text = ""
+
+    def _decode(self, ids: List[int]) -> str:
+        return self.tokenizer.decode(ids, skip_special_tokens=self.skip_special_tokens)
+
+    def push(self, token_id: int) -> str:
+        """Add a token and return the text it completed (possibly "")."""
+        self.ids.append(token_id)
+        new_text = self._decode(self.ids[self.prefix_offset :])
+        if len(new_text) <= len(self._prefix_text) or new_text.endswith("\ufffd"):
+            return ""
+        text = new_text[len(self._prefix_text) :]
+        self.prefix_offset = self.read_offset
+        self.read_offset = len(self.ids)
+        self._prefix_text = self._decode(self.ids[self.prefix_offset : self.read_offset])
+        return text
+
+    def flush(self) -> str:
+        """Return whatever is still held back, complete or not."""
+        if self.read_offset == len(self.ids):
+            return ""
+        new_text = self._decode(self.ids[self.prefix_offset :])
+        self.prefix_offset = self.read_offset = len(self.ids)
+        text = new_text[len(self._prefix_text) :]
+        self._prefix_text = ""
+        return text
+
+
+async def detokenize_stream(
+    tokens: AsyncIterator[int], tokenizer, flush_tokens: int = 1, flush_ms: float = 0
+) -> AsyncIterator[str]:
+    """Turn a stream of token ids into text chunks.
+
+    A chunk is sent once `flush_tokens` tokens have accumulated or the
+    oldest pending text is `flush_ms` old, whichever comes first; either
+    limit is off when <= 0, and with both off the text comes as one chunk
+    at the end. The age limit is checked as tokens arrive, which is every
+    decode step while the sequence runs.
+    """
+    detokenizer = IncrementalDetokenizer(tokenizer)
+    pending: List[str] = []
+    pending_tokens = 0
+    deadline = None
+    async for token in tokens:
+        text = detokenizer.push(token)
+        pending_tokens += 1
+        if text:
+            pending.append(text)
+            if deadline is None and flush_ms > 0:
+                deadline = time.monotonic() + flush_ms / 1000
+        if (flush_tokens > 0 and pending_tokens >= flush_tokens) or (
+            deadline is not None and time.monotonic() >= deadline
+        ):
+            if pending:
+                yield "".join(pending)
+            pending = []
+            pending_tokens = 0
+            deadline = None
+
+    pending.append(detokenizer.flush())
+    text = "".join(pending)
+    if text:
+        yield text
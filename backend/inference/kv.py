@@ -0,0 +1,67 @@
+"""Helpers for batched KV caches.
+
+The scheduler keeps the cache as a list of per-layer (keys, values) tensors
+shaped [batch, heads, seq, head_dim], left-padded so that every row ends at
+the newest position. The attention mask marks the padding. These helpers
+convert to and from whatever cache object the installed transformers
+version uses, and pad, merge and select rows.
+"""
+
+from typing import List, Sequence, Tuple
+
+import torch
+
+Layers = List[Tuple[torch.Tensor, torch.Tensor]]
+
+
+def cache_layers(past) -> Layers:
+    """Per-layer (keys, values) from a model's past_key_values."""
+    if isinstance(past, (tuple, list)):
+        return [(k, v) for k, v in past]
+    if hasattr(past, "layers"):
+        return [(layer.keys, layer.values) for layer in past.layers]
+    return list(zip(past.key_cache, past.value_cache))
+
+
+def make_cache(layers: Layers):
+    """A past_key_values object the model accepts."""
+    from transformers import DynamicCache
+
+    if hasattr(DynamicCache, "from_legacy_cache"):
+        return DynamicCache.from_legacy_cache(tuple(layers))
+    return DynamicCache(layers)
+
+
+def left_pad(layers: Layers, mask: torch.Tensor, length: int) -> Tuple[Layers, torch.Tensor]:
+    """Pad the sequence dimension on the left up to `length`."""
+    pad = length - mask.shape[1]
+    if pad <= 0:
+        return layers, mask
+    padded = []
+    for k, v in layers:
+        shape = (k.shape[0], k.shape[1], pad, k.shape[3])
+        padded.append((torch.cat([k.new_zeros(shape), k], dim=2), torch.cat([v.new_zeros(shape), v], dim=2)))
+    return padded, torch.cat([mask.new_zeros((mask.shape[0], pad)), mask], dim=1)
+
+
+def concat(parts: Sequence[Tuple[Layers, torch.Tensor]]) -> Tuple[Layers, torch.Tensor]:
+    """Stack several batches of rows into one, padding to the longest."""
+    parts = [part for part in parts if part[1].shape[0]]
+    if len(parts) == 1:
+        return parts[0]
+    length = max(mask.shape[1] for _, mask in parts)
+    parts = [left_pad(layers, mask, length) for layers, mask in parts]
+    layers = [
+        (torch.cat([p[0][i][0] for p in parts]), torch.cat([p[0][i][1] for p in parts]))
+        for i in range(len(parts[0][0]))
+    ]
+    return layers, torch.cat([mask for _, mask in parts])
+
+
+def select(layers: Layers, mask: torch.Tensor, rows: torch.Tensor) -> Tuple[Layers, torch.Tensor]:
+    """Keep only `rows`, dropping leading columns that are padding in all of them."""
+    mask = mask.index_select(0, rows)
+    used = mask.any(dim=0).nonzero()
+    start = int(used[0]) if len(used) else mask.shape[1]
+    layers = [(k.index_select(0, rows)[:, :, start:], v.index_select(0, rows)[:, :, start:]) for k, v in layers]
+    return layers, mask[:, start:]
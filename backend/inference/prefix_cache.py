@@ -0,0 +1,153 @@
+"""Reuse of prompt KV caches across requests.
+
+Prompts share long prefixes: the fixed MCQ instruction, system messages,
+and chat histories that grow by one turn per request. The cache keeps the
+KV tensors of recent prompts in a radix tree keyed by token ids. With
+causal attention the keys and values of the first n tokens do not depend on
+what follows them, so any stored prompt can serve every prefix it shares
+with a new one by slicing. Only the unmatched suffix needs a prefill.
+
+Entries are evicted least-recently-used first once their tensors exceed
+`max_bytes`. The cache is used from the inference worker thread only.
+"""
+
+import itertools
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from .kv import Layers
+
+
+class _Entry:
+    __slots__ = ("layers", "size", "last_used", "node")
+
+    def __init__(self, layers: Layers, size: int, last_used: int, node: "_Node"):
+        self.layers = layers
+        self.size = size
+        self.last_used = last_used
+        self.node = node
+
+
+class _Node:
+    __slots__ = ("edge", "children", "parent", "entry")
+
+    def __init__(self, edge: Tuple[int, ...], parent: Optional["_Node"]):
+        self.edge = edge  # token ids on the edge from the parent
+        self.children: Dict[int, _Node] = {}
+        self.parent = parent
+        self.entry: Optional[_Entry] = None
+
+
+class PrefixCache:
+    def __init__(self, max_bytes: int = 512 * 1024 * 1024, min_tokens: int = 16):
+        self.max_bytes = max_bytes
+        self.min_tokens = min_tokens
+        self.root = _Node((), None)
+        self.entries: List[_Entry] = []
+        self.bytes = 0
+        self._clock = itertools.count()
+
+        self.lookups = 0
+        self.hits = 0
+        self.tokens_looked_up = 0
+        self.tokens_reused = 0
+        self.evictions = 0
+
+    def lookup(self, token_ids: Sequence[int]) -> Tuple[int, Optional[Layers]]:
+        """Return (matched, layers): KV for the first `matched` tokens of
+        `token_ids`, or (0, None). At least one token is always left
+        unmatched, since the model needs it to produce the next logits."""
+        self.lookups += 1
+        self.tokens_looked_up += len(token_ids)
+        node, matched = self.root, 0
+        limit = len(token_ids) - 1
+        while matched < limit:
+            child = node.children.get(token_ids[matched])
+            if child is None:
+                break
+            common = 0
+            for expected, actual in zip(child.edge, token_ids[matched:limit]):
+                if expected != actual:
+                    break
+                common += 1
+            matched += common
+            node = child
+            if common < len(child.edge):
+                break
+
+        if matched < self.min_tokens:
+            return 0, None
+        # Any entry below this point starts with the matched tokens
+        while node.entry is None:
+            node = next(iter(node.children.values()))
+        entry = node.entry
+        entry.last_used = next(self._clock)
+        self.hits += 1
+        self.tokens_reused += matched
+        return matched, [(k[:, :, :matched], v[:, :, :matched]) for k, v in entry.layers]
+
+    def insert(self, token_ids: Sequence[int], layers: Layers):
+        """Store the KV of a whole prompt: tensors shaped [1, heads,
+        len(token_ids), head_dim] that nothing else holds on to."""
+        if len(token_ids) < self.min_tokens:
+            return
+        size = sum(k.numel() * k.element_size() + v.numel() * v.element_size() for k, v in layers)
+        if size > self.max_bytes:
+            return
+
+        node, pos = self.root, 0
+        token_ids = tuple(token_ids)
+        while pos < len(token_ids):
+            child = node.children.get(token_ids[pos])
+            if child is None:
+                child = _Node(token_ids[pos:], node)
+                node.children[token_ids[pos]] = child
+                node, pos = child, len(token_ids)
+                break
+            common = 0
+            for expected, actual in zip(child.edge, token_ids[pos:]):
+                if expected != actual:
+                    break
+                common += 1
+            if common < len(child.edge):
+                # Split the edge where the new prompt diverges
+                middle = _Node(child.edge[:common], node)
+                node.children[token_ids[pos]] = middle
+                child.edge = child.edge[common:]
+                child.parent = middle
+                middle.children[child.edge[0]] = child
+                child = middle
+            node, pos = child, pos + common
+
+        if node.entry is not None:
+            node.entry.last_used = next(self._clock)
+            return
+        node.entry = _Entry(layers, size, next(self._clock), node)
+        self.entries.append(node.entry)
+        self.bytes += size
+        self._evict()
+
+    def _evict(self):
+        if self.bytes <= self.max_bytes:
+            return
+        self.entries.sort(key=lambda entry: entry.last_used)
+        while self.bytes > self.max_bytes and self.entries:
+            entry = self.entries.pop(0)
+            self.bytes -= entry.size
+            self.evictions += 1
+            node = entry.node
+            node.entry = None
+            # Drop branches that no longer lead to any entry
+            while node.parent is not None and node.entry is None and not node.children:
+                del node.parent.children[node.edge[0]]
+                node = node.parent
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self.entries),
+            "bytes": self.bytes,
+            "lookups": self.lookups,
+            "hit_rate": self.hits / self.lookups if self.lookups else 0.0,
+            "token_hit_rate": self.tokens_reused / self.tokens_looked_up if self.tokens_looked_up else 0.0,
+            "tokens_reused": self.tokens_reused,
+            "evictions": self.evictions,
+        }
@@ -0,0 +1,152 @@
+"""Models and tokenizers shared by every endpoint, loaded once in the background.
+
+main.py used to load its model at import time and then load the same
+checkpoint a second time for the summarization pipeline. Both copies were
+loaded before the server could bind. The registry loads each registered
+model exactly once, on a background thread. Endpoints get the shared
+instance from it, and get ModelNotReady until it is loaded, so the server
+binds straight away and /health can report readiness.
+
+Loading is tuned for CPU serving:
+- safetensors checkpoints are memory-mapped and copied straight into the
+  model instead of into a randomly initialised one first
+  (low_cpu_mem_usage).
+- `quantize="int8"` applies PyTorch dynamic quantization to the Linear
+  layers. Their weights are stored as int8, about a quarter of the float32
+  size, and activations are quantized on the fly. This is CPU only.
+- A short forward pass warms the model up before it is reported ready.
+"""
+
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+import torch
+from transformers import AutoModelForCausalLM, AutoTokenizer
+
+QUANTIZATION_MODES = (None, "int8")
+
+
+class ModelNotReady(Exception):
+    """The models are still loading, or failed to load."""
+
+
+@dataclass
+class LoadedModel:
+    model: Any
+    tokenizer: Any
+    load_seconds: float
+    quantize: Optional[str] = None
+    info: Dict[str, Any] = field(default_factory=dict)
+
+
+def load_model(
+    name: str, device, token=None, quantize: Optional[str] = None, dtype: str = "float32"
+) -> LoadedModel:
+    """Load a causal LM and its tokenizer, quantize it if asked, and warm it up."""
+    if quantize not in QUANTIZATION_MODES:
+        raise ValueError(f"Unknown quantization {quantize!r}; expected one of {QUANTIZATION_MODES}")
+    device = torch.device(device)
+    if quantize and device.type != "cpu":
+        raise ValueError("Dynamic int8 quantization only runs on CPU")
+
+    start = time.perf_counter()
+    tokenizer = AutoTokenizer.from_pretrained(name, token=token)
+    model = AutoModelForCausalLM.from_pretrained(
+        name,
+        token=token,
+        torch_dtype=dtype if dtype == "auto" else getattr(torch, dtype),
+        low_cpu_mem_usage=True,
+    )
+    model.eval()
+    if quantize == "int8":
+        # In place: a copy would briefly hold the float weights twice
+        model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+    model.to(device)
+
+    with torch.no_grad():
+        model(input_ids=torch.tensor([[tokenizer.bos_token_id or 0] * 8], device=device))
+
+    parameter_bytes = sum(p.numel() * p.element_size() for p in model.parameters())
+    # Quantized weights are packed params, not parameters
+    for module in model.modules():
+        if isinstance(module, torch.ao.nn.quantized.dynamic.Linear):
+            weight, bias = module._weight_bias()
+            parameter_bytes += weight.numel() * weight.element_size()
+            if bias is not None:
+                parameter_bytes += bias.numel() * bias.element_size()
+    return LoadedModel(
+        model,
+        tokenizer,
+        load_seconds=time.perf_counter() - start,
+        quantize=quantize,
+        info={"name": name, "device": str(device), "dtype": dtype, "weight_bytes": parameter_bytes},
+    )
+
+
+class ModelRegistry:
+    def __init__(self, device, token=None):
+        self.device = device
+        self.token = token
+        self._specs: Dict[str, dict] = {}
+        self._models: Dict[str, LoadedModel] = {}
+        self._callbacks: List[Callable[[Dict[str, LoadedModel]], None]] = []
+        self._ready = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.state = "idle"  # idle, loading, ready or failed
+        self.error: Optional[str] = None
+
+    def register(self, key: str, name: str, quantize: Optional[str] = None, dtype: str = "float32"):
+        """Add a model to load; `key` is what endpoints ask for."""
+        if self.state != "idle":
+            raise RuntimeError("Models must be registered before loading starts")
+        self._specs[key] = {"name": name, "quantize": quantize, "dtype": dtype}
+
+    def on_ready(self, callback: Callable[[Dict[str, LoadedModel]], None]):
+        """Run `callback(models)`, models by key, on the loading thread once
+        all are loaded and before readiness is reported (e.g. to build the
+        scheduler the endpoints need)."""
+        self._callbacks.append(callback)
+
+    def start(self):
+        """Begin loading in the background and return immediately."""
+        if self._thread is None:
+            self.state = "loading"
+            self._thread = threading.Thread(target=self.load, name="model-loader", daemon=True)
+            self._thread.start()
+
+    def load(self):
+        """Load every registered model on the calling thread."""
+        self.state = "loading"
+        try:
+            for key, spec in self._specs.items():
+                if key not in self._models:
+                    self._models[key] = load_model(device=self.device, token=self.token, **spec)
+            for callback in self._callbacks:
+                callback(dict(self._models))
+        except Exception as e:
+            print(f"Error loading models: {str(e)}")
+            self.error = str(e)
+            self.state = "failed"
+            return
+        self.state = "ready"
+        self._ready.set()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        return self._ready.wait(timeout)
+
+    def get(self, key: str) -> LoadedModel:
+        if not self._ready.is_set():
+            raise ModelNotReady(f"models are {self.state}" + (f": {self.error}" if self.error else ""))
+        return self._models[key]
+
+    def status(self) -> dict:
+        return {
+            "state": self.state,
+            "error": self.error,
+            "models": {
+                key: {**loaded.info, "quantize": loaded.quantize, "load_seconds": loaded.load_seconds}
+                for key, loaded in list(self._models.items())
+            },
+        }
@@ -0,0 +1,217 @@
+"""Batched token sampling with per-sequence settings.
+
+Every row of a batch can use its own temperature, top-k, top-p, min-p and
+repetition penalty. Each filter comes down to a per-row probability cutoff,
+so rows with different settings share the same tensor ops. Which work a
+step needs is decided from the Python-side settings, never from tensor
+values, so sampling reads nothing back to the host. The only transfer per
+step is the scheduler's single tolist() of the chosen tokens.
+
+Sorting is partial. When every sampled row has a top-k, the whole step runs
+on the k best candidates instead of the vocabulary. Otherwise top-p sorts
+only the `max_candidates` most likely tokens. A nucleus that does not fit
+in them only happens with a near-flat distribution, and is then left
+untruncated.
+"""
+
+from dataclasses import dataclass
+from typing import List, Optional, Sequence
+
+import torch
+
+MAX_CANDIDATES = 1024
+
+
+@dataclass(frozen=True)
+class SamplingParams:
+    temperature: float = 1.0  # 0: greedy
+    top_k: int = 0  # 0: off
+    top_p: float = 1.0  # 1: off
+    min_p: float = 0.0  # 0: off
+    repetition_penalty: float = 1.0  # 1: off
+
+    def __post_init__(self):
+        if self.temperature < 0:
+            raise ValueError(f"temperature must be >= 0, got {self.temperature}")
+        if self.top_k < 0:
+            raise ValueError(f"top_k must be >= 0, got {self.top_k}")
+        if not 0 < self.top_p <= 1:
+            raise ValueError(f"top_p must be in (0, 1], got {self.top_p}")
+        if not 0 <= self.min_p <= 1:
+            raise ValueError(f"min_p must be in [0, 1], got {self.min_p}")
+        if self.repetition_penalty <= 0:
+            raise ValueError(f"repetition_penalty must be > 0, got {self.repetition_penalty}")
+
+    @property
+    def greedy(self) -> bool:
+        return self.temperature == 0 or self.top_k == 1
+
+
+def apply_repetition_penalty(logits: torch.Tensor, seen: torch.Tensor, penalties: torch.Tensor) -> torch.Tensor:
+    """Make tokens a row has seen less likely: positive logits are divided
+    by the row's penalty, negative ones multiplied (as in CTRL and HF)."""
+    penalized = torch.where(logits > 0, logits / penalties, logits * penalties)
+    return torch.where(seen, penalized, logits)
+
+
+class _Settings:
+    """Per-row parameters as tensors, built once per batch composition."""
+
+    def __init__(self, params: Sequence[SamplingParams], vocab_size: int, max_candidates: int, device):
+        self.params = list(params)
+        sampled = [p for p in params if not p.greedy]
+        self.all_greedy = not sampled
+        self.any_greedy = len(sampled) < len(params)
+        self.penalize = any(p.repetition_penalty != 1 for p in params)
+        self.use_top_p = any(p.top_p < 1 for p in sampled)
+        self.use_min_p = any(p.min_p > 0 for p in sampled)
+
+        def column(values, dtype=torch.float32):
+            return torch.tensor(values, dtype=dtype, device=device)[:, None]
+
+        max_top_k = max((p.top_k for p in sampled), default=0)
+        # Every sampled row truncates to its top k: only candidates matter
+        self.candidates = min(max_top_k, vocab_size) if sampled and all(p.top_k for p in sampled) else 0
+        if self.candidates:
+            # Greedy rows get their argmax substituted; any k does for them
+            self.top_k = column([p.top_k or 1 for p in params], torch.long)
+            self.sorted_k = self.candidates
+        else:
+            self.top_k = column([p.top_k for p in params], torch.long) if max_top_k else None
+            self.sorted_k = min(vocab_size, max(max_top_k, max_candidates if self.use_top_p else 0))
+        self.greedy = column([p.greedy for p in params], torch.bool)
+        # Greedy rows run through the sampling ops at temperature 1
+        self.temperatures = column([p.temperature if not p.greedy else 1.0 for p in params])
+        self.top_p = column([p.top_p for p in params])
+        self.min_p = column([p.min_p for p in params])
+        self.penalties = column([p.repetition_penalty for p in params])
+
+
+class Sampler:
+    """Picks the next token for every row of a batch.
+
+    Parameter tensors are cached while the batch's sequences stay the same,
+    so a steady decode loop does not rebuild them each step.
+    """
+
+    def __init__(self, max_candidates: int = MAX_CANDIDATES, generator: Optional[torch.Generator] = None):
+        self.max_candidates = max_candidates
+        self.generator = generator
+        self._settings: Optional[_Settings] = None
+
+    def _settings_for(self, params: Sequence[SamplingParams], logits: torch.Tensor) -> _Settings:
+        cached = self._settings
+        if (
+            cached is None
+            or len(cached.params) != len(params)
+            or any(a is not b for a, b in zip(cached.params, params))
+        ):
+            cached = self._settings = _Settings(params, logits.shape[-1], self.max_candidates, logits.device)
+        return cached
+
+    def __call__(
+        self, logits: torch.Tensor, params: Sequence[SamplingParams], seen: Optional[torch.Tensor] = None
+    ) -> torch.Tensor:
+        """Token ids [batch] for `logits` [batch, vocab], one SamplingParams
+        per row. `seen` [batch, vocab] marks the tokens each row has seen so
+        far; the repetition penalty needs it."""
+        settings = self._settings_for(params, logits)
+        logits = self._penalize(logits, settings, seen)
+        if settings.all_greedy:
+            return logits.argmax(dim=-1)
+
+        probs, indices = self._filter(logits, settings)
+        tokens = draw(probs, self.generator)
+        if indices is not None:
+            tokens = indices.gather(1, tokens[:, None]).squeeze(-1)
+        if settings.any_greedy:
+            tokens = torch.where(settings.greedy.squeeze(-1), logits.argmax(dim=-1), tokens)
+        return tokens
+
+    def distribution(
+        self, logits: torch.Tensor, params: Sequence[SamplingParams], seen: Optional[torch.Tensor] = None
+    ) -> torch.Tensor:
+        """The probabilities [batch, vocab] that __call__ samples from, one-hot
+        for greedy rows. Speculative decoding compares them between models."""
+        settings = self._settings_for(params, logits)
+        logits = self._penalize(logits, settings, seen)
+        greedy = torch.zeros_like(logits).scatter_(1, logits.argmax(dim=-1, keepdim=True), 1.0)
+        if settings.all_greedy:
+            return greedy
+
+        probs, indices = self._filter(logits, settings)
+        if indices is not None:
+            probs = torch.zeros_like(logits).scatter_(1, indices, probs)
+        probs = probs / probs.sum(dim=-1, keepdim=True)
+        if settings.any_greedy:
+            probs = torch.where(settings.greedy, greedy, probs)
+        return probs
+
+    @staticmethod
+    def _penalize(logits: torch.Tensor, settings: _Settings, seen: Optional[torch.Tensor]) -> torch.Tensor:
+        logits = logits.float()
+        if settings.penalize and seen is not None:
+            logits = apply_repetition_penalty(logits, seen, settings.penalties)
+        return logits
+
+    def _filter(self, logits: torch.Tensor, settings: _Settings):
+        """(probs, indices): unnormalized probabilities after every filter,
+        over the top candidates given by `indices`, or over the whole
+        vocabulary when `indices` is None."""
+        if settings.candidates:
+            values, indices = logits.topk(settings.candidates, dim=-1)
+            ranks = torch.arange(settings.candidates, device=logits.device)
+            values = values.masked_fill(ranks >= settings.top_k, float("-inf"))
+            probs = torch.softmax(values / settings.temperatures, dim=-1)
+            # Already sorted, so top-p needs no further sort
+            return self._truncate(probs, settings, probs if settings.use_top_p else None), indices
+
+        probs = torch.softmax(logits / settings.temperatures, dim=-1)
+        top = probs.topk(settings.sorted_k, dim=-1).values if settings.sorted_k else None
+        if settings.top_k is not None:
+            # The k-th largest probability; rows without top-k keep everything
+            kth = top.gather(1, (settings.top_k - 1).clamp(min=0, max=settings.sorted_k - 1))
+            truncated = settings.top_k > 0
+            probs = probs.masked_fill(truncated & (probs < kth), 0)
+            top = top.masked_fill(truncated & (top < kth), 0)
+            # Top-p works on the renormalized top-k distribution
+            mass = torch.where(truncated, top.sum(dim=-1, keepdim=True), 1.0)
+            top = top / mass
+            probs = probs / mass
+        return self._truncate(probs, settings, top if settings.use_top_p else None), None
+
+    @staticmethod
+    def _truncate(probs: torch.Tensor, settings: _Settings, top: Optional[torch.Tensor]) -> torch.Tensor:
+        """Zero the probabilities below each row's top-p and min-p cutoffs.
+        `top` holds each row's largest probabilities in descending order."""
+        cutoff = None
+        if top is not None:
+            cumulative = top.cumsum(dim=-1)
+            # A token is in the nucleus if the mass before it is below top_p
+            inside = (cumulative - top) < settings.top_p
+            last = inside.sum(dim=-1, keepdim=True) - 1
+            covered = cumulative[:, -1:] >= settings.top_p
+            cutoff = torch.where(covered & (settings.top_p < 1), top.gather(1, last), 0.0)
+        if settings.use_min_p:
+            floor = settings.min_p * probs.amax(dim=-1, keepdim=True)
+            cutoff = floor if cutoff is None else torch.maximum(cutoff, floor)
+        if cutoff is None:
+            return probs
+        return probs.masked_fill(probs < cutoff, 0)
+
+
+def draw(probs: torch.Tensor, generator: Optional[torch.Generator] = None) -> torch.Tensor:
+    """One index per row with probability proportional to `probs`: the
+    argmax of p / E for E ~ Exp(1), which needs no normalization and,
+    unlike multinomial, no synchronization."""
+    noise = torch.empty_like(probs).exponential_(generator=generator)
+    return (probs / noise).argmax(dim=-1)
+
+
+def seen_tokens(token_lists: List[List[int]], vocab_size: int, device) -> torch.Tensor:
+    """[len(token_lists), vocab_size] bool marking each row's tokens."""
+    seen = torch.zeros((len(token_lists), vocab_size), dtype=torch.bool)
+    for row, ids in enumerate(token_lists):
+        if ids:
+            seen[row, torch.tensor(ids)] = True
+    return seen.to(device)
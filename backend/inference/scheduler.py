@@ -0,0 +1,443 @@
+"""Continuous batching for causal LM generation.
+
+Requests no longer run their own generate loop. They join a shared batch
+as soon as they arrive: newly admitted prompts are prefilled together, then
+every decode step runs one left-padded forward pass over all active
+sequences. Finished sequences leave the batch straight away, so a long
+generation never holds back a short one, and each caller receives its
+tokens as they are sampled.
+
+The forward passes run on a dedicated worker thread, never on the asyncio
+event loop, so a long generation cannot stall other requests or health
+checks. Tokens are handed back to each caller's asyncio queue. A caller
+that stops reading (a slow or vanished streaming client) is parked out of
+the batch once its backlog passes `max_buffered_tokens`, and cancelled
+sequences are dropped at the next step.
+
+With a PrefixCache, prompts only prefill the part that no recent prompt
+shared with them; see prefix_cache.py. Each sequence samples with its own
+SamplingParams; see sampling.py. If given, `observe(stage, seconds)` is
+called with the duration of every prefill ("model.prefill") and decode step
+("model.decode").
+
+A model is not safe to run from two threads at once. When another worker
+(the SpeculativeDecoder) runs the same model, both get the same
+`model_lock`, which each step holds around its forward passes.
+"""
+
+import asyncio
+import collections
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Callable, List, Optional
+
+import torch
+
+from .kv import cache_layers, concat, make_cache, select
+from .prefix_cache import PrefixCache
+from .sampling import Sampler, SamplingParams, seen_tokens
+
+
+class SchedulerBusy(Exception):
+    """Too many requests are already waiting for a batch slot."""
+
+
+@dataclass
+class Sequence:
+    prompt_ids: List[int]
+    max_tokens: int
+    sampling: SamplingParams
+    queue: asyncio.Queue
+    loop: asyncio.AbstractEventLoop
+    generated: List[int] = field(default_factory=list)
+    stop_reason: Optional[str] = None  # "end_of_message" or "out_of_tokens"
+    stats: Optional[dict] = None  # filled in for the caller when it finishes
+    cancelled: bool = False
+    consumed: int = 0  # tokens the caller has read; written by the caller only
+    submitted_at: float = field(default_factory=time.perf_counter)
+    first_token_at: Optional[float] = None
+
+    @property
+    def backlog(self) -> int:
+        return len(self.generated) - self.consumed
+
+
+@dataclass
+class ParkedSequence:
+    sequence: Sequence
+    layers: list
+    mask: torch.Tensor
+    last_token: torch.Tensor
+
+
+def deliver(deliveries):
+    """Hand (sequence, token or None) pairs to their callers' event loops,
+    one wakeup per loop. Safe to call from any thread."""
+    by_loop = collections.defaultdict(list)
+    for sequence, item in deliveries:
+        by_loop[sequence.loop].append((sequence.queue, item))
+
+    def put_all(items):
+        for queue, item in items:
+            queue.put_nowait(item)
+
+    for loop, items in by_loop.items():
+        try:
+            loop.call_soon_threadsafe(put_all, items)
+        except RuntimeError:
+            pass  # the caller's loop is closed; nobody is listening
+
+
+class BatchScheduler:
+    def __init__(
+        self,
+        model,
+        eos_token_id: int,
+        device,
+        max_batch_size: int = 8,
+        pad_token_id: int = 0,
+        max_waiting: int = 256,
+        max_buffered_tokens: int = 256,
+        prefix_cache: Optional[PrefixCache] = None,
+        sampler: Optional[Sampler] = None,
+        observe: Optional[Callable[[str, float], None]] = None,
+        model_lock: Optional[threading.Lock] = None,
+    ):
+        self.model = model
+        self.eos_token_id = eos_token_id
+        self.device = device
+        self.max_batch_size = max_batch_size
+        self.pad_token_id = pad_token_id
+        self.max_waiting = max_waiting
+        self.max_buffered_tokens = max_buffered_tokens
+        self.prefix_cache = prefix_cache
+        self.sampler = sampler or Sampler()
+        self.observe = observe
+        self.model_lock = model_lock or threading.Lock()
+
+        # waiting and parked are shared with the event loop; guarded by _lock
+        self.waiting = collections.deque()
+        self.parked: List[ParkedSequence] = []
+        # Only the worker thread touches the running batch
+        self.running: List[Sequence] = []
+        self.layers = None  # KV cache of the running batch, see kv.py
+        self.mask = None  # [batch, cached positions], 0 for left padding
+        self.last_tokens = None  # sampled but not yet fed back, [batch]
+        # [batch, vocab] bool of the tokens each row has seen, kept only while
+        # a running sequence uses a repetition penalty
+        self.seen = None
+        self.vocab_size = None
+
+        self.steps = 0
+        self.tokens_generated = 0
+        self.prefill_tokens = 0  # prompt tokens actually run through the model
+        self.prefill_seconds = 0.0
+        self._lock = threading.Lock()
+        self._work = threading.Condition(self._lock)
+        self._thread: Optional[threading.Thread] = None
+        self._stop = False
+
+    def generate(
+        self, prompt_ids: List[int], max_tokens: int, sampling: SamplingParams, stats: Optional[dict] = None
+    ) -> AsyncIterator[int]:
+        """Queue a prompt and return an async iterator over its generated
+        token ids. Must be called from the event loop. If given, `stats`
+        receives the sequence's "stop_reason" once the iterator is done.
+
+        Raises SchedulerBusy right away when the waiting queue is full, so
+        endpoints can refuse before they start a response. Closing the
+        iterator early (e.g. the client disconnected) cancels the sequence.
+        """
+        loop = asyncio.get_running_loop()
+        sequence = Sequence(list(prompt_ids), int(max_tokens), sampling, asyncio.Queue(), loop, stats=stats)
+        with self._work:
+            if len(self.waiting) >= self.max_waiting:
+                raise SchedulerBusy(f"{len(self.waiting)} requests already waiting")
+            self.waiting.append(sequence)
+            self._start()
+            self._work.notify()
+        return self._stream(sequence)
+
+    async def _stream(self, sequence: Sequence) -> AsyncIterator[int]:
+        try:
+            while True:
+                token = await sequence.queue.get()
+                if token is None:
+                    if sequence.stop_reason == "error":
+                        raise RuntimeError("Generation failed; see the inference worker log")
+                    if sequence.stats is not None:
+                        sequence.stats["stop_reason"] = sequence.stop_reason
+                    return
+                sequence.consumed += 1
+                if sequence.backlog == self.max_buffered_tokens // 2:
+                    # Caught up enough for a parked sequence to rejoin
+                    with self._work:
+                        self._work.notify()
+                yield token
+        finally:
+            if sequence.stop_reason is None:
+                sequence.cancelled = True
+                with self._work:
+                    self._work.notify()
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = {
+                "running": len(self.running),
+                "waiting": len(self.waiting),
+                "parked": len(self.parked),
+                "steps": self.steps,
+                "tokens_generated": self.tokens_generated,
+                "prefill_tokens": self.prefill_tokens,
+                "prefill_seconds": self.prefill_seconds,
+            }
+        if self.prefix_cache is not None:
+            cache = self.prefix_cache.stats()
+            # Reused tokens would have cost the average prefill time per token
+            per_token = self.prefill_seconds / self.prefill_tokens if self.prefill_tokens else 0.0
+            cache["prefill_seconds_saved"] = cache["tokens_reused"] * per_token
+            stats["prefix_cache"] = cache
+        return stats
+
+    def _start(self):
+        if self._thread is None:
+            self._stop = False
+            self._thread = threading.Thread(target=self._run, name="inference-worker", daemon=True)
+            self._thread.start()
+
+    def close(self):
+        with self._work:
+            self._stop = True
+            self._work.notify()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _has_work(self) -> bool:
+        return bool(
+            self.running
+            or self.waiting
+            or any(p.sequence.cancelled or self._can_resume(p.sequence) for p in self.parked)
+        )
+
+    def _run(self):
+        while True:
+            with self._work:
+                while not self._stop and not self._has_work():
+                    self._work.wait()
+                if self._stop:
+                    return
+            try:
+                self.step()
+            except Exception as e:
+                # Fail everything in flight rather than leave callers hanging
+                print(f"Inference step failed: {str(e)}")
+                self._fail_all()
+
+    def step(self):
+        """One scheduling iteration: a decode step for the running batch,
+        then prefill for whatever is waiting and fits."""
+        self._drop_finished()  # and cancelled
+        self._park_and_resume()
+        with self.model_lock, torch.no_grad():
+            if self.running:
+                self._decode()
+            self._admit()
+        self._drop_finished()
+
+    def _can_resume(self, sequence: Sequence) -> bool:
+        return sequence.backlog <= self.max_buffered_tokens // 2
+
+    def _park_and_resume(self):
+        # Park sequences whose callers are not keeping up
+        stalled = [row for row, sequence in enumerate(self.running) if sequence.backlog > self.max_buffered_tokens]
+        if stalled:
+            parked = []
+            for row in stalled:
+                rows = torch.tensor([row], device=self.mask.device)
+                layers, mask = select(self.layers, self.mask, rows)
+                parked.append(ParkedSequence(self.running[row], layers, mask, self.last_tokens[row : row + 1]))
+            with self._lock:
+                self.parked.extend(parked)
+            self._keep([row for row in range(len(self.running)) if row not in stalled])
+
+        with self._lock:
+            self.parked = [p for p in self.parked if not p.sequence.cancelled]
+            resumable = [p for p in self.parked if self._can_resume(p.sequence)]
+            resumable = resumable[: self.max_batch_size - len(self.running)]
+            for parked in resumable:
+                self.parked.remove(parked)
+        for parked in resumable:
+            if self.running:
+                self.layers, self.mask = concat([(self.layers, self.mask), (parked.layers, parked.mask)])
+                self.last_tokens = torch.cat([self.last_tokens, parked.last_token])
+            else:
+                self.layers, self.mask, self.last_tokens = parked.layers, parked.mask, parked.last_token
+            self._join_seen([parked.sequence], self._seen_rows([parked.sequence]))
+            self.running.append(parked.sequence)
+
+    def _admit(self):
+        admitted = []
+        with self._lock:
+            while self.waiting and len(self.running) + len(admitted) < self.max_batch_size:
+                sequence = self.waiting.popleft()
+                if not sequence.cancelled:
+                    admitted.append(sequence)
+        if not admitted:
+            return
+        start = time.perf_counter()
+
+        # Cached prompt prefixes: each row is [padding, cached prefix,
+        # padding, suffix to prefill]; the mask hides both paddings
+        hits = [self.prefix_cache.lookup(s.prompt_ids) if self.prefix_cache else (0, None) for s in admitted]
+        past = None
+        if any(layers for _, layers in hits):
+            template = next(layers for _, layers in hits if layers)
+            rows = []
+            for matched, layers in hits:
+                if layers is None:
+                    layers = [(k.new_zeros(k.shape[:2] + (0,) + k.shape[3:]),) * 2 for k, _ in template]
+                rows.append((layers, torch.ones((1, matched), dtype=torch.long, device=self.device)))
+            past = concat(rows)
+
+        suffixes = [sequence.prompt_ids[matched:] for sequence, (matched, _) in zip(admitted, hits)]
+        length = max(len(suffix) for suffix in suffixes)
+        input_ids = torch.full((len(admitted), length), self.pad_token_id, dtype=torch.long)
+        suffix_mask = torch.zeros((len(admitted), length), dtype=torch.long)
+        for row, suffix in enumerate(suffixes):
+            input_ids[row, length - len(suffix) :] = torch.tensor(suffix)
+            suffix_mask[row, length - len(suffix) :] = 1
+        input_ids = input_ids.to(self.device)
+        suffix_mask = suffix_mask.to(self.device)
+        mask = torch.cat([past[1], suffix_mask], dim=1) if past else suffix_mask
+
+        outputs = self.model(
+            input_ids=input_ids,
+            attention_mask=mask,
+            position_ids=(mask.cumsum(-1) - 1).clamp(min=0)[:, mask.shape[1] - length :],
+            past_key_values=make_cache(past[0]) if past else None,
+            use_cache=True,
+        )
+        layers = cache_layers(outputs.past_key_values)
+        self.vocab_size = outputs.logits.shape[-1]
+        seen = self._seen_rows(admitted)
+        tokens = self._sample(outputs.logits[:, -1, :], admitted, seen)
+
+        if self.prefix_cache is not None:
+            for row, sequence in enumerate(admitted):
+                # index_select copies, so the entry doesn't pin the batch tensors
+                columns = mask[row].nonzero().squeeze(-1)
+                self.prefix_cache.insert(
+                    sequence.prompt_ids,
+                    [(k[row : row + 1].index_select(2, columns), v[row : row + 1].index_select(2, columns))
+                     for k, v in layers],
+                )
+        self.prefill_tokens += sum(len(suffix) for suffix in suffixes)
+        seconds = time.perf_counter() - start
+        self.prefill_seconds += seconds
+        if self.observe is not None:
+            self.observe("model.prefill", seconds)
+
+        if self.running:
+            self.layers, self.mask = concat([(self.layers, self.mask), (layers, mask)])
+            self.last_tokens = torch.cat([self.last_tokens, tokens])
+        else:
+            self.layers, self.mask = layers, mask
+            self.last_tokens = tokens
+        self._join_seen(admitted, seen)
+        self.running.extend(admitted)
+        self._emit(admitted, tokens)
+
+    def _decode(self):
+        start = time.perf_counter()
+        mask = torch.cat([self.mask, self.mask.new_ones((self.mask.shape[0], 1))], dim=1)
+        outputs = self.model(
+            input_ids=self.last_tokens[:, None],
+            attention_mask=mask,
+            # Left padding: a row's next position is its count of real tokens
+            position_ids=self.mask.sum(-1, keepdim=True),
+            past_key_values=make_cache(self.layers),
+            use_cache=True,
+        )
+        self.layers = cache_layers(outputs.past_key_values)
+        self.mask = mask
+        self.last_tokens = self._sample(outputs.logits[:, -1, :], self.running, self.seen)
+        self._emit(self.running, self.last_tokens)
+        self.steps += 1
+        if self.observe is not None:
+            # _emit's tolist() has waited for the step to finish on the device
+            self.observe("model.decode", time.perf_counter() - start)
+
+    def _sample(self, logits: torch.Tensor, sequences: List[Sequence], seen: Optional[torch.Tensor]) -> torch.Tensor:
+        tokens = self.sampler(logits, [sequence.sampling for sequence in sequences], seen)
+        if seen is not None:
+            seen.scatter_(1, tokens[:, None], True)
+        return tokens
+
+    def _seen_rows(self, sequences: List[Sequence], force: bool = False) -> Optional[torch.Tensor]:
+        """Seen-token rows for `sequences`, or None if none of them uses a
+        repetition penalty (and not `force`)."""
+        if not force and all(s.sampling.repetition_penalty == 1 for s in sequences):
+            return None
+        return seen_tokens([s.prompt_ids + s.generated for s in sequences], self.vocab_size, self.device)
+
+    def _join_seen(self, added: List[Sequence], seen: Optional[torch.Tensor]):
+        """Extend self.seen for `added` joining self.running."""
+        if seen is None and self.seen is None:
+            return
+        if seen is None:
+            seen = self._seen_rows(added, force=True)
+        elif self.seen is None:
+            self.seen = self._seen_rows(self.running, force=True)
+        self.seen = torch.cat([self.seen, seen])
+
+    def _emit(self, sequences: List[Sequence], tokens: torch.Tensor):
+        now = time.perf_counter()
+        deliveries = []
+        # One host transfer for the whole batch
+        for sequence, token in zip(sequences, tokens.tolist()):
+            sequence.generated.append(token)
+            if sequence.first_token_at is None:
+                sequence.first_token_at = now
+            deliveries.append((sequence, token))
+            if token == self.eos_token_id:
+                sequence.stop_reason = "end_of_message"
+            elif len(sequence.generated) >= sequence.max_tokens:
+                sequence.stop_reason = "out_of_tokens"
+            if sequence.stop_reason is not None:
+                deliveries.append((sequence, None))
+        self.tokens_generated += len(sequences)
+        deliver(deliveries)
+
+    def _keep(self, keep: List[int]):
+        if keep:
+            rows = torch.tensor(keep, device=self.mask.device)
+            self.layers, self.mask = select(self.layers, self.mask, rows)
+            self.last_tokens = self.last_tokens.index_select(0, rows)
+        else:
+            self.layers = self.mask = self.last_tokens = None
+        self.running = [self.running[row] for row in keep]
+        if self.seen is not None:
+            penalized = any(s.sampling.repetition_penalty != 1 for s in self.running)
+            self.seen = self.seen.index_select(0, rows) if penalized else None
+
+    def _drop_finished(self):
+        keep = [
+            row
+            for row, sequence in enumerate(self.running)
+            if sequence.stop_reason is None and not sequence.cancelled
+        ]
+        if len(keep) != len(self.running):
+            self._keep(keep)
+
+    def _fail_all(self):
+        with self._lock:
+            sequences = self.running + list(self.waiting) + [p.sequence for p in self.parked]
+            self.waiting.clear()
+            self.parked = []
+        self.running = []
+        self.layers = self.mask = self.last_tokens = self.seen = None
+        for sequence in sequences:
+            sequence.stop_reason = sequence.stop_reason or "error"
+        deliver([(sequence, None) for sequence in sequences])
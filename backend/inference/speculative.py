@@ -0,0 +1,300 @@
+"""Speculative decoding with a small draft model.
+
+On CPU a single stream is bound by one full forward pass of the target
+model per token. Here a draft model that shares the target's tokenizer
+proposes `num_draft_tokens` tokens one by one, and the target scores all of
+them in a single forward pass. Each draft token x is kept with probability
+min(1, p(x) / q(x)), where p and q are the target's and the draft's
+sampling distributions (after temperature, top-k/top-p/min-p and the
+repetition penalty). At the first rejection a replacement is drawn from
+the normalized max(0, p - q). When every draft token is kept, a bonus token
+comes from the target's last position. This rejection sampling makes the
+output follow exactly the target's distribution (Leviathan et al., 2023).
+Greedy requests reduce to keeping the drafts that match the target's
+argmax.
+
+Sequences run one at a time on a worker thread: the point is latency for
+a single stream, which the batch scheduler trades for throughput. Like the
+scheduler's, `observe` receives the time of each round's drafting
+("model.draft") and verification ("model.verify").
+
+The target is usually the model the batch scheduler runs too. Pass the
+scheduler's `model_lock`: every target pass holds it, so the two workers
+take turns on the target while the draft runs alongside the batch.
+"""
+
+import asyncio
+import collections
+import contextlib
+import threading
+import time
+from dataclasses import dataclass
+from typing import AsyncIterator, Callable, List, Optional
+
+import torch
+
+from .kv import cache_layers, make_cache
+from .sampling import Sampler, SamplingParams, draw, seen_tokens
+from .scheduler import SchedulerBusy, Sequence, deliver
+
+
+@dataclass
+class SpeculativeSequence(Sequence):
+    draft_tokens: int = 0
+    accepted_tokens: int = 0
+    target_passes: int = 0
+
+
+def _crop(layers, length: int):
+    return [(k[:, :, :length], v[:, :, :length]) for k, v in layers]
+
+
+class SpeculativeDecoder:
+    def __init__(
+        self,
+        target,
+        draft,
+        eos_token_id: int,
+        device,
+        num_draft_tokens: int = 4,
+        max_waiting: int = 64,
+        generator: Optional[torch.Generator] = None,
+        observe: Optional[Callable[[str, float], None]] = None,
+        model_lock: Optional[threading.Lock] = None,
+    ):
+        if target.config.vocab_size != draft.config.vocab_size:
+            raise ValueError(
+                f"Draft vocabulary ({draft.config.vocab_size}) differs from the target's ({target.config.vocab_size})"
+            )
+        self.target = target
+        self.draft = draft
+        self.eos_token_id = eos_token_id
+        self.device = device
+        self.num_draft_tokens = num_draft_tokens
+        self.max_waiting = max_waiting
+        self.generator = generator
+        self.observe = observe
+        self.model_lock = model_lock or threading.Lock()
+        # Separate samplers, so each keeps its parameter tensors cached
+        self.target_sampler = Sampler(generator=generator)
+        self.draft_sampler = Sampler(generator=generator)
+
+        self.waiting = collections.deque()
+        self.requests = 0
+        self.tokens_generated = 0
+        self.draft_tokens = 0
+        self.accepted_tokens = 0
+        self.target_passes = 0
+        self._lock = threading.Lock()
+        self._work = threading.Condition(self._lock)
+        self._thread: Optional[threading.Thread] = None
+        self._stop = False
+
+    def generate(
+        self, prompt_ids: List[int], max_tokens: int, sampling: SamplingParams, stats: Optional[dict] = None
+    ) -> AsyncIterator[int]:
+        """Like BatchScheduler.generate. If given, `stats` also receives the
+        request's acceptance rate and speed once it finishes."""
+        loop = asyncio.get_running_loop()
+        sequence = SpeculativeSequence(
+            list(prompt_ids), int(max_tokens), sampling, asyncio.Queue(), loop, stats=stats
+        )
+        with self._work:
+            if len(self.waiting) >= self.max_waiting:
+                raise SchedulerBusy(f"{len(self.waiting)} speculative requests already waiting")
+            self.waiting.append(sequence)
+            if self._thread is None:
+                self._stop = False
+                self._thread = threading.Thread(target=self._run, name="speculative-worker", daemon=True)
+                self._thread.start()
+            self._work.notify()
+        return self._stream(sequence)
+
+    async def _stream(self, sequence: SpeculativeSequence) -> AsyncIterator[int]:
+        try:
+            while True:
+                token = await sequence.queue.get()
+                if token is None:
+                    if sequence.stop_reason == "error":
+                        raise RuntimeError("Generation failed; see the inference worker log")
+                    if sequence.stats is not None:
+                        sequence.stats["stop_reason"] = sequence.stop_reason
+                    return
+                sequence.consumed += 1
+                yield token
+        finally:
+            if sequence.stop_reason is None:
+                sequence.cancelled = True
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "waiting": len(self.waiting),
+                "requests": self.requests,
+                "tokens_generated": self.tokens_generated,
+                "acceptance_rate": self.accepted_tokens / self.draft_tokens if self.draft_tokens else 0.0,
+                "tokens_per_target_pass": self.tokens_generated / self.target_passes if self.target_passes else 0.0,
+            }
+
+    def close(self):
+        with self._work:
+            self._stop = True
+            self._work.notify()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while True:
+            with self._work:
+                while not self._stop and not self.waiting:
+                    self._work.wait()
+                if self._stop:
+                    return
+                sequence = self.waiting.popleft()
+            if sequence.cancelled:
+                continue
+            try:
+                with torch.no_grad():
+                    self._decode(sequence)
+            except Exception as e:
+                print(f"Speculative decoding failed: {str(e)}")
+                sequence.stop_reason = "error"
+            self._finish(sequence)
+
+    def _forward(self, model, layers, tokens: torch.Tensor):
+        """Feed `tokens` [n] after the cached positions; return the logits
+        [n, vocab] and the extended cache."""
+        with self.model_lock if model is self.target else contextlib.nullcontext():
+            outputs = model(
+                input_ids=tokens[None],
+                past_key_values=make_cache(layers) if layers else None,
+                use_cache=True,
+            )
+        return outputs.logits[0], cache_layers(outputs.past_key_values)
+
+    def _decode(self, sequence: SpeculativeSequence):
+        params = sequence.sampling
+        prompt = torch.tensor(sequence.prompt_ids, device=self.device)
+        # Both caches hold every token but the last accepted one, which is
+        # fed with the next pass; the draft may also lag by a token
+        target_layers = draft_layers = None
+        if len(prompt) > 1:
+            _, target_layers = self._forward(self.target, None, prompt[:-1])
+            _, draft_layers = self._forward(self.draft, None, prompt[:-1])
+        target_pending = draft_pending = prompt[-1:]
+        vocab_size = self.target.config.vocab_size
+        seen = None
+        if params.repetition_penalty != 1:
+            seen = seen_tokens([sequence.prompt_ids], vocab_size, self.device)
+
+        while not sequence.cancelled:
+            cached = target_layers[0][0].shape[2] if target_layers else 0
+            k = min(self.num_draft_tokens, sequence.max_tokens - len(sequence.generated) - 1)
+
+            # Draft k tokens, keeping each one's distribution
+            started = time.perf_counter()
+            drafts, draft_probs, seen_rows = [], [], []
+            for _ in range(k):
+                logits, draft_layers = self._forward(self.draft, draft_layers, draft_pending)
+                row_seen = seen.clone() if seen is not None else None
+                probs = self.draft_sampler.distribution(logits[-1:], [params], row_seen)
+                token = draw(probs, self.generator)
+                drafts.append(token)
+                draft_probs.append(probs)
+                seen_rows.append(row_seen)
+                if seen is not None:
+                    seen = row_seen.index_fill(1, token, True)
+                draft_pending = token
+
+            # Score all of them, plus one more position, in one target pass
+            drafted_at = time.perf_counter()
+            fed = torch.cat([target_pending] + drafts)
+            logits, target_layers = self._forward(self.target, target_layers, fed)
+            target_params = [params] * (k + 1)
+            rows = torch.cat(seen_rows + [seen]) if seen is not None else None
+            target_probs = self.target_sampler.distribution(logits, target_params, rows)
+            sequence.target_passes += 1
+
+            if k:
+                drafted = torch.cat(drafts)
+                draft_probs = torch.cat(draft_probs)
+                positions = torch.arange(k, device=drafted.device)
+                p = target_probs[positions, drafted]
+                q = draft_probs[positions, drafted]
+                accept = torch.rand(k, device=drafted.device, generator=self.generator) * q < p
+                accepted = int(accept.int().cumprod(0).sum())
+            else:
+                accepted = 0
+            if accepted < k:
+                residual = (target_probs[accepted] - draft_probs[accepted]).clamp(min=0)
+                # p == q leaves nothing to correct; p itself is then exact
+                residual = torch.where(residual.sum() > 0, residual, target_probs[accepted])
+                bonus = draw(residual[None], self.generator)
+            else:
+                bonus = draw(target_probs[k : k + 1], self.generator)
+            sequence.draft_tokens += k
+            sequence.accepted_tokens += accepted
+            if self.observe is not None:
+                # On a GPU nothing waits for the drafts, so their time lands in verify
+                self.observe("model.draft", drafted_at - started)
+                self.observe("model.verify", time.perf_counter() - drafted_at)
+
+            new_tokens = (drafted[:accepted].tolist() if accepted else []) + bonus.tolist()
+            if self._emit(sequence, new_tokens):
+                return
+
+            # Roll both caches back to the accepted tokens
+            length = cached + 1 + accepted
+            target_layers = _crop(target_layers, length)
+            target_pending = bonus
+            draft_cached = draft_layers[0][0].shape[2] if draft_layers else 0
+            if draft_cached >= length:
+                draft_layers = _crop(draft_layers, length)
+                draft_pending = bonus
+            else:
+                # Every draft was kept: the last one never went through the draft
+                draft_pending = torch.cat([fed[draft_cached - cached : length - cached], bonus])
+            if seen is not None:
+                seen = rows[accepted : accepted + 1].index_fill(1, bonus, True)
+
+    def _emit(self, sequence: SpeculativeSequence, tokens: List[int]) -> bool:
+        """Deliver `tokens` up to EOS or max_tokens; True once finished."""
+        now = time.perf_counter()
+        if sequence.first_token_at is None:
+            sequence.first_token_at = now
+        deliveries = []
+        for token in tokens:
+            sequence.generated.append(token)
+            deliveries.append((sequence, token))
+            if token == self.eos_token_id:
+                sequence.stop_reason = "end_of_message"
+            elif len(sequence.generated) >= sequence.max_tokens:
+                sequence.stop_reason = "out_of_tokens"
+            if sequence.stop_reason is not None:
+                break
+        deliver(deliveries)
+        return sequence.stop_reason is not None
+
+    def _finish(self, sequence: SpeculativeSequence):
+        seconds = time.perf_counter() - sequence.submitted_at
+        generated = len(sequence.generated)
+        with self._lock:
+            self.requests += 1
+            self.tokens_generated += generated
+            self.draft_tokens += sequence.draft_tokens
+            self.accepted_tokens += sequence.accepted_tokens
+            self.target_passes += sequence.target_passes
+        if sequence.stats is not None:
+            sequence.stats.update(
+                {
+                    "generated_tokens": generated,
+                    "draft_tokens": sequence.draft_tokens,
+                    "accepted_tokens": sequence.accepted_tokens,
+                    "acceptance_rate": sequence.accepted_tokens / sequence.draft_tokens if sequence.draft_tokens else 0.0,
+                    "target_passes": sequence.target_passes,
+                    "tokens_per_second": generated / seconds if seconds else 0.0,
+                }
+            )
+        # After the stats, so the caller sees them once its stream ends
+        deliver([(sequence, None)])
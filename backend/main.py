@@ -1,6 +1,12 @@
-from fastapi import FastAPI, Request
-from fastapi.responses import StreamingResponse
-from transformers import AutoTokenizer, AutoModelForCausalLM, pipeline
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
 import torch
 import uvicorn
 from config import Config
@@ -15,8 +21,20 @@ from llama_stack.apis.inference.inference import (
     CompletionRequest,
     StopReason,
 )
-from typing import Union, AsyncGenerator
+from typing import List, Optional, Union, AsyncGenerator
 from llama_models.llama3.api.datatypes import interleaved_text_media_as_str
+from inference.bulk import generate_bulk
+from inference.detokenizer import detokenize_stream
+from inference.prefix_cache import PrefixCache
+from inference.registry import ModelNotReady, ModelRegistry
+from inference.sampling import SamplingParams
+from inference.scheduler import BatchScheduler, SchedulerBusy
+from inference.speculative import SpeculativeDecoder
+
+# Run from backend/; instrumentation.py lives in the repository root, shared with the Flask app
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from instrumentation import CONTENT_TYPE, REGISTRY, REQUEST_SECONDS, observe, profiler, render, span  # noqa: E402
 
 app = FastAPI()
 
@@ -29,94 +47,341 @@ if Config.HUGGINGFACE_ACCESS_TOKEN:
     login(token=Config.HUGGINGFACE_ACCESS_TOKEN)
 use_auth = bool(Config.HUGGINGFACE_ACCESS_TOKEN)
 
-tokenizer = AutoTokenizer.from_pretrained(Config.MODEL_NAME, use_auth_token=use_auth)
-model = AutoModelForCausalLM.from_pretrained(Config.MODEL_NAME, use_auth_token=use_auth).to(device)
-summarizer = pipeline("summarization", model=Config.MODEL_NAME, tokenizer=Config.MODEL_NAME, use_auth_token=use_auth)
-
-async def generate_tokens(input_text: str, max_tokens: int, temperature: float) -> AsyncGenerator[str, None]:
-    input_ids = tokenizer.encode(input_text, return_tensors="pt").to(device)
-    attention_mask = torch.ones_like(input_ids).to(device)
-    past = None
-    
-    for _ in range(max_tokens):
-        with torch.no_grad():
-            outputs = model(input_ids=input_ids, attention_mask=attention_mask, past_key_values=past, use_cache=True)
-            logits = outputs.logits[:, -1, :]
-
-            scaled_logits = logits / max(temperature, 1e-8)
-            probs = torch.softmax(scaled_logits, dim=-1)
-            token = torch.multinomial(probs, num_samples=1).squeeze(-1)
-            
-            token_str = tokenizer.decode(token.item())
-            yield token_str
-
-            if token.item() == tokenizer.eos_token_id:
-                break
-            
-            input_ids = token.unsqueeze(0)
-            attention_mask = torch.cat([attention_mask, torch.ones_like(input_ids)], dim=-1)
-            past = outputs.past_key_values
+# One copy of the model serves every endpoint, summarization included. It
+# loads in the background so the server binds and answers /health at once.
+# QUANTIZE=int8 stores the Linear weights as int8 (CPU only).
+models = ModelRegistry(device, token=use_auth or None)
+models.register("main", Config.MODEL_NAME, quantize=os.getenv("QUANTIZE") or None, dtype=os.getenv("MODEL_DTYPE", "float32"))
+# Optional small model of the same family (same tokenizer) for requests
+# that opt into speculative decoding with ?speculative=true
+if os.getenv("DRAFT_MODEL_NAME"):
+    models.register("draft", os.getenv("DRAFT_MODEL_NAME"), quantize=os.getenv("QUANTIZE") or None, dtype=os.getenv("MODEL_DTYPE", "float32"))
+
+tokenizer = None
+scheduler = None
+speculative_decoder = None
+context_tokens = None
+
+def build_scheduler(loaded):
+    global tokenizer, scheduler, speculative_decoder, context_tokens
+    main = loaded["main"]
+    tokenizer = main.tokenizer
+    context_tokens = int(os.getenv("MAX_CONTEXT_TOKENS", "0")) or getattr(main.model.config, "max_position_embeddings", 4096)
+    # The scheduler and the speculative decoder both run the main model, each
+    # on its own thread; they take turns on it under this lock
+    model_lock = threading.Lock()
+    # Concurrent requests share one batched decode loop instead of each running
+    # its own forward passes. The loop runs on a worker thread, off the event loop.
+    scheduler = BatchScheduler(
+        main.model,
+        eos_token_id=tokenizer.eos_token_id,
+        device=device,
+        max_batch_size=int(os.getenv("MAX_BATCH_SIZE", "8")),
+        pad_token_id=tokenizer.pad_token_id or tokenizer.eos_token_id,
+        max_waiting=int(os.getenv("MAX_WAITING_REQUESTS", "256")),
+        max_buffered_tokens=int(os.getenv("MAX_BUFFERED_TOKENS", "256")),
+        # Shared prompt prefixes (the MCQ instruction, chat history) skip prefill
+        prefix_cache=PrefixCache(max_bytes=int(os.getenv("PREFIX_CACHE_MB", "512")) * 1024 * 1024),
+        # Every prefill and decode step goes into stage_seconds on /metrics
+        observe=observe,
+        model_lock=model_lock,
+    )
+    if "draft" in loaded:
+        if loaded["draft"].tokenizer.get_vocab() != tokenizer.get_vocab():
+            raise ValueError("DRAFT_MODEL_NAME must use the same tokenizer as MODEL_NAME")
+        speculative_decoder = SpeculativeDecoder(
+            main.model,
+            loaded["draft"].model,
+            eos_token_id=tokenizer.eos_token_id,
+            device=device,
+            num_draft_tokens=int(os.getenv("SPECULATIVE_TOKENS", "4")),
+            observe=observe,
+            model_lock=model_lock,
+        )
+
+models.on_ready(build_scheduler)
+
+def scheduler_gauge(key):
+    # Omitted from /metrics until the model is loaded
+    return lambda: scheduler.stats()[key] if scheduler is not None else None
+
+REGISTRY.gauge("inference_running_sequences", "Sequences in the running batch", scheduler_gauge("running"))
+REGISTRY.gauge("inference_waiting_sequences", "Requests waiting for a batch slot", scheduler_gauge("waiting"))
+REGISTRY.gauge("inference_parked_sequences", "Sequences parked for slow readers", scheduler_gauge("parked"))
+SPECULATIVE_ACCEPTANCE = REGISTRY.histogram(
+    "speculative_acceptance_rate",
+    "Share of draft tokens the target kept, per speculative request",
+    buckets=(0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1),
+)
+SPECULATIVE_SPEED = REGISTRY.histogram(
+    "speculative_tokens_per_second",
+    "Generated tokens per second, per speculative request",
+    buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500),
+)
+
+# PROFILE_REQUESTS=1 starts with slow-request profiling on; kill -USR2 toggles it
+profiler.install_toggle()
+
+@app.on_event("startup")
+async def start_loading_models():
+    models.start()
+
+@app.middleware("http")
+async def time_requests(request: Request, call_next):
+    # The handler only awaits here; the model runs on the inference thread,
+    # which the profile's all-thread stack samples cover (cProfile would not)
+    session = profiler.start(f"{request.method} {request.url.path}", cprofile=False)
+    start = time.perf_counter()
+    try:
+        response = await call_next(request)
+    finally:
+        if session is not None:
+            session.stop()
+    route = request.scope.get("route")
+    REQUEST_SECONDS.observe(
+        time.perf_counter() - start,
+        method=request.method,
+        route=getattr(route, "path", "unmatched"),
+        status=response.status_code,
+    )
+    return response
+
+@app.get("/metrics")
+async def metrics():
+    return Response(render(), media_type=CONTENT_TYPE)
+
+@app.exception_handler(ModelNotReady)
+async def model_not_ready(request: Request, exc: ModelNotReady):
+    return JSONResponse(status_code=503, content={"detail": f"Model not ready: {exc}"}, headers={"Retry-After": "5"})
+
+@app.exception_handler(SchedulerBusy)
+async def scheduler_busy(request: Request, exc: SchedulerBusy):
+    return JSONResponse(status_code=503, content={"detail": f"Server busy: {exc}"}, headers={"Retry-After": "1"})
+
+# Streams send one JSON line per STREAM_FLUSH_TOKENS tokens or
+# STREAM_FLUSH_MS milliseconds, whichever comes first
+STREAM_FLUSH_TOKENS = int(os.getenv("STREAM_FLUSH_TOKENS", "8"))
+STREAM_FLUSH_MS = float(os.getenv("STREAM_FLUSH_MS", "50"))
+
+def sampling_params(params) -> SamplingParams:
+    """The scheduler's settings for a request's llama_stack sampling_params.
+    The greedy strategy or a temperature of 0 decodes greedily, and the
+    default temperature only fills in a missing one; top-k and top-p apply
+    when their strategy is chosen."""
+    strategy = getattr(params.strategy, "value", params.strategy)
+    repetition_penalty = params.repetition_penalty or 1.0
+    if strategy == "greedy" or params.temperature == 0:
+        return SamplingParams(temperature=0, repetition_penalty=repetition_penalty)
+    return SamplingParams(
+        temperature=Config.DEFAULT_TEMPERATURE if params.temperature is None else params.temperature,
+        top_k=(params.top_k or 0) if strategy == "top_k" else 0,
+        top_p=(params.top_p or 1.0) if strategy == "top_p" else 1.0,
+        repetition_penalty=repetition_penalty,
+    )
+
+def generate_tokens(
+    input_text: str,
+    max_tokens: int,
+    sampling: SamplingParams,
+    stream: bool = False,
+    speculative: bool = False,
+    stats: Optional[dict] = None,
+) -> AsyncGenerator[str, None]:
+    """Text chunks of the completion; a single chunk unless `stream`.
+    Once they are done, `stats` receives the "stop_reason" and, with
+    `speculative`, the acceptance rate and speed."""
+    models.get("main")  # ModelNotReady (503) while loading
+    prompt_ids = tokenizer.encode(input_text)
+    # Queued now, so a full queue is refused before any response starts
+    if speculative:
+        if speculative_decoder is None:
+            raise HTTPException(status_code=400, detail="Speculative decoding needs DRAFT_MODEL_NAME to be set")
+        tokens = speculative_decoder.generate(prompt_ids, max_tokens, sampling, stats)
+    else:
+        tokens = scheduler.generate(prompt_ids, max_tokens, sampling, stats)
+    if stream:
+        return detokenize_stream(tokens, tokenizer, STREAM_FLUSH_TOKENS, STREAM_FLUSH_MS)
+    return detokenize_stream(tokens, tokenizer, flush_tokens=0, flush_ms=0)
+
+@app.get("/health")
+async def health():
+    # 503 until the model is loaded and warm, so load balancers wait for it
+    if models.state != "ready":
+        return JSONResponse(status_code=503, content={"status": models.state, "models": models.status()})
+    status = {"status": "ok", "models": models.status(), **scheduler.stats()}
+    if speculative_decoder is not None:
+        status["speculative"] = speculative_decoder.stats()
+    return status
+
+def stop_reason(stats: dict) -> StopReason:
+    # The scheduler's reasons are named after StopReason's values
+    return StopReason(stats["stop_reason"])
+
+def record_speculative(stats: dict):
+    SPECULATIVE_ACCEPTANCE.observe(stats["acceptance_rate"])
+    SPECULATIVE_SPEED.observe(stats["tokens_per_second"])
+
+def speculative_headers(stats: dict) -> dict:
+    return {
+        "X-Speculative-Acceptance-Rate": f"{stats['acceptance_rate']:.3f}",
+        "X-Tokens-Per-Second": f"{stats['tokens_per_second']:.1f}",
+    }
 
 @app.post("/inference/completion")
-async def completion(request: CompletionRequest) -> Union[CompletionResponse, CompletionResponseStreamChunk]:
+async def completion(request: CompletionRequest, response: Response, speculative: bool = False) -> Union[CompletionResponse, CompletionResponseStreamChunk]:
     input_text = interleaved_text_media_as_str(request.content)
     max_tokens = min(request.sampling_params.max_tokens or float('inf'), Config.DEFAULT_MAX_TOKENS)
-    temperature = request.sampling_params.temperature or Config.DEFAULT_TEMPERATURE
+    sampling = sampling_params(request.sampling_params)
 
+    stats = {}
+    chunks = generate_tokens(input_text, max_tokens, sampling, stream=request.stream, speculative=speculative, stats=stats)
     if request.stream:
         async def stream_generator():
-            async for token in generate_tokens(input_text, max_tokens, temperature):
-                yield serialize(CompletionResponseStreamChunk(delta=token)).encode('utf-8') + b'\n'
+            async for chunk in chunks:
+                yield serialize(CompletionResponseStreamChunk(delta=chunk)).encode('utf-8') + b'\n'
+            yield serialize(CompletionResponseStreamChunk(delta="", stop_reason=stop_reason(stats))).encode('utf-8') + b'\n'
+            if speculative:
+                # Headers are gone by the time a stream ends; /metrics has them
+                record_speculative(stats)
         return StreamingResponse(stream_generator(), media_type="application/json")
     else:
         output_text = ""
-        async for token in generate_tokens(input_text, max_tokens, temperature):
-            output_text += token
+        async for chunk in chunks:
+            output_text += chunk
+        if speculative:
+            record_speculative(stats)
+            response.headers.update(speculative_headers(stats))
         return CompletionResponse(completion_message={
             "content": output_text,
-            "stop_reason": StopReason.out_of_tokens if len(output_text) >= max_tokens else StopReason.end_of_message
+            "stop_reason": stop_reason(stats),
         })
 
 @app.post("/inference/chat_completion")
-async def chat_completion(request: ChatCompletionRequest) -> Union[ChatCompletionResponse, ChatCompletionResponseStreamChunk]:
+async def chat_completion(request: ChatCompletionRequest, response: Response, speculative: bool = False) -> Union[ChatCompletionResponse, ChatCompletionResponseStreamChunk]:
     input_text = "\n".join([f"{m.role}: {interleaved_text_media_as_str(m.content)}" for m in request.messages])
     max_tokens = min(request.sampling_params.max_tokens or float('inf'), Config.DEFAULT_MAX_TOKENS)
-    temperature = request.sampling_params.temperature or Config.DEFAULT_TEMPERATURE
+    sampling = sampling_params(request.sampling_params)
 
+    stats = {}
+    chunks = generate_tokens(input_text, max_tokens, sampling, stream=request.stream, speculative=speculative, stats=stats)
     if request.stream:
         async def stream_generator():
-            async for token in generate_tokens(input_text, max_tokens, temperature):
-                yield serialize(ChatCompletionResponseStreamChunk(event={"event_type": "progress", "delta": token})).encode('utf-8') + b'\n'
+            async for chunk in chunks:
+                yield serialize(ChatCompletionResponseStreamChunk(event={"event_type": "progress", "delta": chunk})).encode('utf-8') + b'\n'
+            yield serialize(ChatCompletionResponseStreamChunk(event={"event_type": "complete", "delta": "", "stop_reason": stop_reason(stats)})).encode('utf-8') + b'\n'
+            if speculative:
+                # Headers are gone by the time a stream ends; /metrics has them
+                record_speculative(stats)
         return StreamingResponse(stream_generator(), media_type="application/json")
     else:
         output_text = ""
-        async for token in generate_tokens(input_text, max_tokens, temperature):
-            output_text += token
+        async for chunk in chunks:
+            output_text += chunk
+        if speculative:
+            record_speculative(stats)
+            response.headers.update(speculative_headers(stats))
         return ChatCompletionResponse(completion_message={
             "role": "assistant",
             "content": output_text,
-            "stop_reason": StopReason.out_of_tokens if len(output_text) >= max_tokens else StopReason.end_of_message
+            "stop_reason": stop_reason(stats),
         })
 
+SUMMARY_MAX_TOKENS = 150
+MCQ_MAX_TOKENS = 150
+# Room left in the context for the instruction around the notes
+PROMPT_RESERVE_TOKENS = 64
+MAX_BULK_DOCUMENTS = int(os.getenv("MAX_BULK_DOCUMENTS", "500"))
+
+def fit_notes(notes: str, max_tokens: int) -> str:
+    """Cut `notes` so the prompt and `max_tokens` of output fit the context."""
+    budget = max(context_tokens - max_tokens - PROMPT_RESERVE_TOKENS, 1)
+    ids = tokenizer.encode(notes, add_special_tokens=False)
+    return notes if len(ids) <= budget else tokenizer.decode(ids[:budget])
+
+def summary_prompt(notes: str) -> str:
+    return f"Summarize the following notes:\n{notes}\nSummary:"
+
+def mcq_prompt(notes: str) -> str:
+    return f"Generate multiple-choice questions based on the following notes:\n{notes}\n"
+
+def parse_summary(text: str) -> dict:
+    return {"summary": text.strip()}
+
+def parse_mcqs(text: str) -> dict:
+    questions = text.split('\n\n')
+    return {"mcqs": [{"question": q.split('\n')[0], "options": q.split('\n')[1:]} for q in questions if q]}
+
 @app.post("/summarize")
 async def summarize_notes(notes: str):
-    summary = summarizer(notes, max_length=150, min_length=30, do_sample=False)
-    return {"summary": summary[0]['summary_text']}
+    # Runs on the shared model through the scheduler rather than a second
+    # copy loaded for a summarization pipeline; greedy, as do_sample=False was
+    models.get("main")
+    prompt = summary_prompt(fit_notes(notes, SUMMARY_MAX_TOKENS))
+    summary = ""
+    async for chunk in generate_tokens(prompt, SUMMARY_MAX_TOKENS, SamplingParams(temperature=0)):
+        summary += chunk
+    return parse_summary(summary)
 
 @app.post("/generate_mcqs")
 async def generate_mcqs(notes: str):
-    prompt = f"Generate multiple-choice questions based on the following notes:\n{notes}\n"
-    max_tokens = 150
-    temperature = 0.7
+    models.get("main")
+    prompt = mcq_prompt(fit_notes(notes, MCQ_MAX_TOKENS))
+    sampling = SamplingParams(temperature=0.7)
 
     output_text = ""
-    async for token in generate_tokens(prompt, max_tokens, temperature):
-        output_text += token
+    async for chunk in generate_tokens(prompt, MCQ_MAX_TOKENS, sampling):
+        output_text += chunk
+
+    return parse_mcqs(output_text)
+
+class BulkRequest(BaseModel):
+    documents: List[str]
+    max_tokens: Optional[int] = None
+
+async def bulk_response(request: BulkRequest, build_prompt, default_max_tokens: int, sampling: SamplingParams, parse):
+    """Stream one JSON line per document as it finishes, then a summary line."""
+    models.get("main")  # ModelNotReady (503) while loading
+    if len(request.documents) > MAX_BULK_DOCUMENTS:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BULK_DOCUMENTS} documents per request")
+    max_tokens = min(request.max_tokens or default_max_tokens, Config.DEFAULT_MAX_TOKENS)
+    start = time.perf_counter()
+
+    # Tokenizing a semester of notes is real work; keep it off the event loop
+    def encode_all():
+        with span("bulk.tokenize"):
+            return [tokenizer.encode(build_prompt(fit_notes(document, max_tokens))) for document in request.documents]
+    prompts = await asyncio.get_running_loop().run_in_executor(None, encode_all)
+
+    async def lines():
+        errors = 0
+        async for result in generate_bulk(scheduler, prompts, max_tokens, sampling):
+            item = {
+                "index": result.index,
+                "queued_ms": round(result.queued_seconds * 1000, 1),
+                "latency_ms": round(result.latency_seconds * 1000, 1),
+                "tokens": len(result.token_ids),
+            }
+            if result.error:
+                errors += 1
+                item["error"] = result.error
+            else:
+                item.update(parse(tokenizer.decode(result.token_ids, skip_special_tokens=True)))
+            yield json.dumps(item) + "\n"
+        yield json.dumps({
+            "done": True,
+            "documents": len(prompts),
+            "errors": errors,
+            "elapsed_ms": round((time.perf_counter() - start) * 1000, 1),
+        }) + "\n"
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
 
-    questions = output_text.split('\n\n')
-    mcqs = [{"question": q.split('\n')[0], "options": q.split('\n')[1:]} for q in questions if q]
+@app.post("/summarize/batch")
+async def summarize_batch(request: BulkRequest):
+    return await bulk_response(request, summary_prompt, SUMMARY_MAX_TOKENS, SamplingParams(temperature=0), parse_summary)
 
-    return {"mcqs": mcqs}
+@app.post("/generate_mcqs/batch")
+async def generate_mcqs_batch(request: BulkRequest):
+    return await bulk_response(request, mcq_prompt, MCQ_MAX_TOKENS, SamplingParams(temperature=0.7), parse_mcqs)
 
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=Config.PORT)
@@ -0,0 +1,319 @@
+"""Reusable podcast generation pipeline.
+
+Turns a document summary into a two-speaker dialogue script with Groq, voices
+every line with ElevenLabs and stitches the clips into one MP3. Requests go
+through the shared keep-alive client in http_client.py, so the Flask app and
+the batch CLI can generate many podcasts in one process on warm connections:
+
+    python -m backend.podcast summary.txt [more.txt ...] [--output-dir DIR]
+"""
+
+import argparse
+import json
+import os
+import re
+import shutil
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from dotenv import load_dotenv
+
+from backend import audio_assembly
+from backend.tts_cache import TTSCache
+from http_client import client
+from instrumentation import span
+
+# Groq API configuration
+GROQ_API_URL = "https://api.groq.com/openai/v1/chat/completions"
+
+# ElevenLabs API configuration
+ELEVENLABS_API_URL = "https://api.elevenlabs.io/v1/text-to-speech"
+
+# Speaker profiles
+SPEAKER_PROFILES = [
+    {"name": "Speaker 1", "personality": "curious", "voice_id": "iP95p4xoKVk53GoZ742B"},
+    {"name": "Speaker 2", "personality": "skeptical", "voice_id": "cgSgspJ2msm6clMCkdW9"},
+]
+
+VOICE_SETTINGS = {"stability": 0.75, "similarity_boost": 0.9}
+
+
+class PodcastError(Exception):
+    """Raised when any stage of podcast generation fails."""
+
+
+def build_prompt(summary, speaker_profiles=SPEAKER_PROFILES, length=10, tone="informal", style="conversational"):
+    return f"""
+Generate a detailed podcast script for a dialogue between two speakers. The script will later be used for voice cloning and converted into a podcast audio file. Ensure the script meets the following criteria:
+
+1. Topic: The podcast should be about the following summary: {summary}.
+2. Length: The script should be approximately {length} minutes long.
+3. Speakers: The dialogue should alternate between two speakers:
+   - Speaker 1: Has a "{speaker_profiles[0]['personality']}" personality".
+   - Speaker 2: Has a "{speaker_profiles[1]['personality']}" personality".
+4. Tone and Style: Use an "{tone}" tone and a "{style}" style to make the content accessible and engaging.
+5. Restrictions:
+   - Avoid including the names of the speakers in the script.
+   - Do not introduce or conclude the podcast explicitly (e.g., no “Welcome to the show!”).
+   - Keep the dialogue focused entirely on the topic.
+   - Ensure the interaction is natural and feels like a genuine conversation.
+6. Structure: The dialogue should:
+   - Introduce the topic naturally through the conversation.
+   - Cover key concepts, theories, or ideas comprehensively.
+   - Include a balance of facts, examples, and analogies to explain complex ideas.
+   - Feature occasional light humor or curiosity to maintain listener engagement.
+
+Format the script as a JSON object, where each line of dialogue is represented as an array of objects with the following structure:
+
+[
+  {{"speaker": "Speaker 1", "text": "Opening line or question."}},
+  {{"speaker": "Speaker 2", "text": "Response or follow-up."}}
+]
+
+The output should strictly follow this format, as it will be programmatically processed for voice cloning. Ensure there are no formatting errors.
+"""
+
+
+# Function to remove excess information from the generated JSON output
+def extract_json_content(raw_content):
+    """
+    Extracts the JSON content from a string that may contain extra text
+    before or after the JSON block.
+
+    Args:
+        raw_content (str): The raw string containing JSON and other excess text.
+
+    Returns:
+        str: The JSON array substring, if one is found.
+        None: If no JSON array is found.
+    """
+    # Use a regex to find the JSON content (starts with [ and ends with ])
+    json_match = re.search(r"\[.*\]", raw_content, re.DOTALL)
+    if not json_match:
+        print("Error: No valid JSON content found in the provided string.")
+        return None
+
+    return json_match.group(0)
+
+
+class PodcastPipeline:
+    """Summary -> script -> per-line TTS -> final MP3 over the shared pooled HTTP client."""
+
+    def __init__(
+        self,
+        groq_api_key=None,
+        elevenlabs_api_key=None,
+        audio_dir="backend/audio",
+        speaker_profiles=SPEAKER_PROFILES,
+        length=10,
+        tone="informal",
+        style="conversational",
+        groq_api_url=GROQ_API_URL,
+        elevenlabs_api_url=ELEVENLABS_API_URL,
+        timeout=120,
+        tts_workers=None,
+        tts_retries=4,
+        mp3_passthrough=True,
+        use_tts_cache=True,
+    ):
+        self.groq_api_key = groq_api_key or os.getenv("GROQ_API_KEY")
+        self.elevenlabs_api_key = elevenlabs_api_key or os.getenv("ELEVENLABS_API_KEY")
+        self.audio_dir = audio_dir
+        self.speaker_profiles = speaker_profiles
+        self.voices = {profile["name"]: profile["voice_id"] for profile in speaker_profiles}
+        self.length = length
+        self.tone = tone
+        self.style = style
+        self.groq_api_url = groq_api_url
+        self.elevenlabs_api_url = elevenlabs_api_url
+        self.timeout = timeout
+        # Lines voiced in parallel; ElevenLabs limits concurrent requests per plan
+        self.tts_workers = tts_workers or int(os.getenv("ELEVENLABS_MAX_CONCURRENCY", "4"))
+        self.tts_retries = tts_retries
+        self.mp3_passthrough = mp3_passthrough
+        self.tts_cache = None
+        if use_tts_cache:
+            self.tts_cache = TTSCache(
+                os.getenv("TTS_CACHE_DIR", os.path.join(audio_dir, "tts_cache")),
+                max_bytes=int(os.getenv("TTS_CACHE_MAX_MB", "512")) * 1024 * 1024,
+            )
+        # Hit/miss counts of the most recent synthesize() call
+        self.last_cache_stats = {"hits": 0, "misses": 0}
+
+        self.groq_headers = {"Authorization": f"Bearer {self.groq_api_key}"}
+        self.tts_headers = {"Content-Type": "application/json", "xi-api-key": self.elevenlabs_api_key}
+
+        os.makedirs(self.audio_dir, exist_ok=True)
+
+    def generate_script(self, summary):
+        """Ask Groq for the dialogue and return it as a list of {speaker, text} dicts."""
+        payload = {
+            "model": "llama3-8b-8192",
+            "messages": [
+                {
+                    "role": "user",
+                    "content": build_prompt(summary, self.speaker_profiles, self.length, self.tone, self.style),
+                }
+            ],
+            "temperature": 0.7,
+        }
+        try:
+            with span("groq.podcast_script"):
+                response = client.post(
+                    self.groq_api_url,
+                    headers=self.groq_headers,
+                    json=payload,
+                    timeout=self.timeout,
+                    retry_errors=True,
+                    endpoint="groq.chat",
+                )
+        except requests.exceptions.RequestException as e:
+            raise PodcastError(f"Unable to connect to Groq API. {e}")
+        if response.status_code != 200:
+            raise PodcastError(f"Groq returned status code {response.status_code}: {response.text}")
+
+        content = response.json().get("choices", [{}])[0].get("message", {}).get("content", "")
+        script = extract_json_content(content)
+        if script is None:
+            raise PodcastError("No podcast script found in the Groq response")
+        try:
+            return json.loads(script)
+        except json.JSONDecodeError:
+            raise PodcastError("Unable to parse the podcast script JSON.")
+
+    def generate_audio(self, text, voice_id, output_path):
+        """Synthesize one line of dialogue with ElevenLabs into output_path,
+        retrying rate-limited and failed requests with backoff."""
+        data = {"text": text, "voice_settings": VOICE_SETTINGS}
+        url = f"{self.elevenlabs_api_url}/{voice_id}"
+
+        try:
+            response = client.post(
+                url,
+                headers=self.tts_headers,
+                json=data,
+                timeout=self.timeout,
+                retries=self.tts_retries,
+                # Synthesis creates nothing server-side; repeating it is safe
+                retry_errors=True,
+                endpoint="elevenlabs.tts",
+            )
+        except requests.exceptions.RequestException as e:
+            raise PodcastError(f"Unable to connect to ElevenLabs API. {e}")
+        if response.status_code != 200:
+            raise PodcastError(f"Error generating audio: {response.status_code} {response.text}")
+
+        with open(output_path, "wb") as f:
+            f.write(response.content)
+
+    def synthesize(self, script_lines, work_dir):
+        """Voice every script line into work_dir and return the clip paths in
+        script order. Up to `tts_workers` lines are synthesized at once, and
+        only lines missing from the TTS cache are sent to ElevenLabs."""
+        jobs = []
+        for i, line in enumerate(script_lines):
+            speaker = line.get("speaker")
+            if speaker not in self.voices:
+                raise PodcastError(f"Unknown speaker in script: {speaker}")
+            voice_id = self.voices[speaker]
+            jobs.append(
+                {
+                    "text": line.get("text"),
+                    "voice_id": voice_id,
+                    "key": TTSCache.key(voice_id, VOICE_SETTINGS, line.get("text")),
+                    "output_file": os.path.join(work_dir, f"audio_line_{i + 1}.mp3"),
+                }
+            )
+
+        # Lines repeated within the script are synthesized once and copied
+        first_by_key = {}
+        for job in jobs:
+            first_by_key.setdefault(job["key"], job)
+        unique = list(first_by_key.values())
+
+        if self.tts_cache is not None:
+            misses = [job for job in unique if not self.tts_cache.get(job["key"], job["output_file"])]
+        else:
+            misses = unique
+
+        def synthesize_line(job):
+            with span("tts.line"):
+                self.generate_audio(job["text"], job["voice_id"], job["output_file"])
+            if self.tts_cache is not None:
+                self.tts_cache.put(job["key"], job["output_file"])
+
+        if misses:
+            workers = max(1, min(self.tts_workers, len(misses)))
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                # Consuming map() re-raises the first failure
+                list(pool.map(synthesize_line, misses))
+
+        for job in jobs:
+            first = first_by_key[job["key"]]
+            if first is not job:
+                shutil.copyfile(first["output_file"], job["output_file"])
+
+        self.last_cache_stats = {"hits": len(jobs) - len(misses), "misses": len(misses)}
+        if self.tts_cache is not None:
+            print(f"TTS cache: {self.last_cache_stats['hits']} hits, {self.last_cache_stats['misses']} misses")
+        return [job["output_file"] for job in jobs]
+
+    def assemble(self, files, output_path):
+        with span("audio.assemble"):
+            mode = audio_assembly.assemble(files, output_path, passthrough=self.mp3_passthrough)
+        print(f"Assembled {len(files)} clips ({mode})")
+
+    def generate(self, summary, output_path=None):
+        """Generate a podcast for `summary` and return the path of the MP3."""
+        output_path = output_path or os.path.join(self.audio_dir, "final_podcast.mp3")
+
+        script_lines = self.generate_script(summary)
+        if not script_lines:
+            raise PodcastError("The podcast script is empty")
+
+        # Each run gets its own scratch directory so concurrent runs don't clash.
+        # It sits next to the output: the MP3 is assembled there and moved into
+        # place in one step, so the output is never seen half-written.
+        work_dir = tempfile.mkdtemp(prefix="podcast_", dir=os.path.dirname(os.path.abspath(output_path)))
+        try:
+            files = self.synthesize(script_lines, work_dir)
+            assembled = os.path.join(work_dir, "podcast.mp3")
+            self.assemble(files, assembled)
+            os.replace(assembled, output_path)
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+        print(f"Final podcast saved as '{output_path}'.")
+        return output_path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate podcasts from summary text files in one process.")
+    parser.add_argument("summaries", nargs="+", help="summary text files ('-' reads stdin)")
+    parser.add_argument("--output-dir", default="backend/audio")
+    args = parser.parse_args(argv)
+
+    load_dotenv()
+    pipeline = PodcastPipeline(audio_dir=args.output_dir)
+    failures = 0
+    for path in args.summaries:
+        if path == "-":
+            summary, name = sys.stdin.read(), "stdin"
+        else:
+            with open(path, encoding="utf-8") as f:
+                summary = f.read()
+            name = os.path.splitext(os.path.basename(path))[0]
+
+        try:
+            pipeline.generate(summary, os.path.join(args.output_dir, f"{name}_podcast.mp3"))
+        except PodcastError as e:
+            failures += 1
+            print(f"Error generating podcast for {path}: {e}")
+
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,76 @@
+"""On-disk cache of synthesized dialogue clips.
+
+Clips are stored under the SHA-256 of (voice_id, voice_settings, text), so a
+line that was voiced before -- in a regenerated podcast, a re-run after a
+partial failure, or a phrase repeated across podcasts -- is copied from disk
+instead of being sent to ElevenLabs again. File modification times double as
+the LRU clock: hits touch the file, and the oldest clips are deleted once the
+cache grows past `max_bytes`.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+
+
+class TTSCache:
+    def __init__(self, cache_dir="backend/audio/tts_cache", max_bytes=512 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._size = sum(entry.stat().st_size for entry in os.scandir(self.cache_dir) if entry.is_file())
+
+    @staticmethod
+    def key(voice_id, voice_settings, text):
+        material = json.dumps([voice_id, voice_settings, text], sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.mp3")
+
+    def get(self, key, output_path):
+        """Copy the cached clip for `key` to output_path; return False on a miss."""
+        path = self._path(key)
+        try:
+            shutil.copyfile(path, output_path)
+            os.utime(path)
+        except FileNotFoundError:
+            return False
+        return True
+
+    def put(self, key, clip_path):
+        """Store a freshly synthesized clip, evicting old clips if needed."""
+        path = self._path(key)
+        # Write to a temp file first so readers never see a partial clip
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        os.close(fd)
+        shutil.copyfile(clip_path, tmp_path)
+        size = os.path.getsize(tmp_path)
+
+        with self._lock:
+            existed = os.path.exists(path)
+            os.replace(tmp_path, path)
+            if not existed:
+                self._size += size
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        entries = sorted(
+            (entry for entry in os.scandir(self.cache_dir) if entry.name.endswith(".mp3")),
+            key=lambda entry: entry.stat().st_mtime,
+        )
+        self._size = sum(entry.stat().st_size for entry in entries)
+        for entry in entries:
+            if self._size <= self.max_bytes:
+                break
+            size = entry.stat().st_size
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                continue
+            self._size -= size
@@ -0,0 +1,107 @@
+"""Load test for the continuous-batching scheduler on CPU: batch size 1 vs. N.
+
+    python -m benchmarks.bench_batching --requests 32 --rate 8 --batch-sizes 1,8
+    python -m benchmarks.bench_batching --model sshleifer/tiny-gpt2
+"""
+
+import argparse
+import asyncio
+import random
+import statistics
+import time
+
+import torch
+
+from backend.inference.sampling import SamplingParams
+from backend.inference.scheduler import BatchScheduler
+from benchmarks.tiny_llm import load_model
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q / 100 * len(values)))]
+
+
+async def run_load(scheduler, requests, rate, seed=0):
+    """Send `requests` (prompt_ids, max_tokens) with Poisson arrivals at
+    `rate` per second (0: all at once); return per-request timings, the
+    elapsed time and how late a 10 ms event-loop timer fired."""
+    rng = random.Random(seed)
+    arrivals = []
+    t = 0.0
+    for _ in requests:
+        arrivals.append(t)
+        if rate:
+            t += rng.expovariate(rate)
+
+    async def client(prompt_ids, max_tokens, delay):
+        await asyncio.sleep(delay)
+        start = time.perf_counter()
+        first = None
+        count = 0
+        # eos_token_id is -1, so every request runs to max_tokens
+        async for _ in scheduler.generate(prompt_ids, max_tokens, SamplingParams()):
+            if first is None:
+                first = time.perf_counter()
+            count += 1
+        end = time.perf_counter()
+        return first - start, end - start, count
+
+    lag = []
+    done = asyncio.Event()
+
+    async def probe():
+        # Stands in for a health check: any stall of the event loop shows here
+        while not done.is_set():
+            start = time.perf_counter()
+            await asyncio.sleep(0.01)
+            lag.append(time.perf_counter() - start - 0.01)
+
+    start = time.perf_counter()
+    prober = asyncio.ensure_future(probe())
+    results = await asyncio.gather(*(client(p, n, d) for (p, n), d in zip(requests, arrivals)))
+    elapsed = time.perf_counter() - start
+    done.set()
+    await prober
+    return results, elapsed, lag
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--model", help="Hugging Face model name or path (default: tiny random Llama)")
+    parser.add_argument("--requests", type=int, default=32)
+    parser.add_argument("--rate", type=float, default=8.0, help="arrivals per second, 0 for a burst")
+    parser.add_argument("--prompt-tokens", type=int, default=64)
+    parser.add_argument("--max-tokens", type=int, default=64)
+    parser.add_argument("--batch-sizes", default="1,8")
+    parser.add_argument("--threads", type=int, default=0, help="torch CPU threads (0: torch default)")
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    model = load_model(args.model)
+    vocab = model.config.vocab_size
+    rng = random.Random(0)
+    # Varied prompt and output lengths, as real traffic has
+    requests = [
+        (
+            [rng.randrange(1, vocab) for _ in range(rng.randint(args.prompt_tokens // 2, args.prompt_tokens))],
+            rng.randint(args.max_tokens // 4, args.max_tokens),
+        )
+        for _ in range(args.requests)
+    ]
+
+    for batch_size in [int(size) for size in args.batch_sizes.split(",")]:
+        scheduler = BatchScheduler(model, eos_token_id=-1, device="cpu", max_batch_size=batch_size)
+        results, elapsed, lag = asyncio.run(run_load(scheduler, requests, args.rate))
+        scheduler.close()
+        ttft = [r[0] for r in results]
+        latency = [r[1] for r in results]
+        tokens = sum(r[2] for r in results)
+        print(
+            f"max_batch_size={batch_size:<3} {tokens / elapsed:8.1f} tok/s  "
+            f"latency p50={statistics.median(latency):6.2f}s p99={percentile(latency, 99):6.2f}s  "
+            f"ttft p50={statistics.median(ttft):6.2f}s p99={percentile(ttft, 99):6.2f}s  "
+            f"avg batch={scheduler.tokens_generated / max(scheduler.steps, 1):.1f}  "
+            f"loop lag p99={percentile(lag, 99) * 1000:.1f}ms"
+        )
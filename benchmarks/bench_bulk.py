@@ -0,0 +1,73 @@
+"""Bulk summarization throughput on CPU: one request per document vs. generate_bulk.
+
+    python -m benchmarks.bench_bulk --documents 48 --max-tokens 32
+"""
+
+import argparse
+import asyncio
+import random
+import statistics
+import time
+
+from backend.inference.bulk import generate_bulk
+from backend.inference.sampling import SamplingParams
+from backend.inference.scheduler import BatchScheduler
+from benchmarks.bench_batching import percentile
+from benchmarks.tiny_llm import load_model
+
+
+async def sequential(scheduler, prompts, max_tokens, sampling):
+    """What a client had to do before: one call per document, in turn.
+    Latency counts from the start, as it does for the bulk runs."""
+    latencies = []
+    start = time.perf_counter()
+    for prompt in prompts:
+        async for _ in scheduler.generate(prompt, max_tokens, sampling):
+            pass
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+async def bulk(scheduler, prompts, max_tokens, sampling, sort):
+    # Latency as a client of the bulk endpoint sees it: submission to result
+    return [
+        result.queued_seconds + result.latency_seconds
+        async for result in generate_bulk(scheduler, prompts, max_tokens, sampling, sort=sort)
+    ]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--model", help="Hugging Face model name or path (default: tiny random Llama)")
+    parser.add_argument("--documents", type=int, default=48)
+    parser.add_argument("--min-tokens", type=int, default=32, help="shortest document, in tokens")
+    parser.add_argument("--max-doc-tokens", type=int, default=512, help="longest document, in tokens")
+    parser.add_argument("--max-tokens", type=int, default=32, help="tokens generated per document")
+    parser.add_argument("--batch-size", type=int, default=8)
+    args = parser.parse_args()
+
+    model = load_model(args.model)
+    vocab = model.config.vocab_size
+    rng = random.Random(0)
+    prompts = [
+        [rng.randrange(1, vocab) for _ in range(rng.randint(args.min_tokens, args.max_doc_tokens))]
+        for _ in range(args.documents)
+    ]
+    sampling = SamplingParams(temperature=0)
+
+    for name, run in (
+        ("one request per document", lambda s: sequential(s, prompts, args.max_tokens, sampling)),
+        ("bulk, submission order", lambda s: bulk(s, prompts, args.max_tokens, sampling, sort=False)),
+        ("bulk, length-sorted", lambda s: bulk(s, prompts, args.max_tokens, sampling, sort=True)),
+    ):
+        # eos_token_id -1: every document generates exactly max_tokens
+        scheduler = BatchScheduler(model, eos_token_id=-1, device="cpu", max_batch_size=args.batch_size)
+        start = time.perf_counter()
+        latencies = asyncio.run(run(scheduler))
+        elapsed = time.perf_counter() - start
+        scheduler.close()
+        print(
+            f"{name:<26} {elapsed:6.2f}s  {args.documents / elapsed:5.2f} docs/s  "
+            f"first result {min(latencies):5.2f}s  item latency p50={statistics.median(latencies):5.2f}s "
+            f"p99={percentile(latencies, 99):5.2f}s  prefill {scheduler.prefill_seconds:5.2f}s"
+        )
@@ -0,0 +1,103 @@
+"""Chunk count and Groq calls per document: 8000-char chunks vs. token budget.
+
+Also checks that a local edit keeps the other chunks (and so their cached
+summaries): a sentence is added at the start, the middle and the end.
+
+    python -m benchmarks.bench_chunking backend/test.pdf [--tokenizer tiktoken]
+    python -m benchmarks.bench_chunking --synthetic-pages 200
+"""
+
+import argparse
+import random
+
+from chunking import chunk_token_budget, get_token_counter, iter_chunks
+from pdf_extract import iter_pages
+from summarizer import SYSTEM_PROMPT, chunk_prompt, group_summaries
+
+
+def legacy_chunk_text(text, chunk_size=8000):
+    """The character-count chunker this benchmark compares against."""
+    chunks = []
+    current_chunk = []
+    current_length = 0
+    for word in text.split():
+        word_length = len(word) + 1
+        if current_length + word_length > chunk_size:
+            chunks.append(" ".join(current_chunk))
+            current_chunk = [word]
+            current_length = word_length
+        else:
+            current_chunk.append(word)
+            current_length += word_length
+    if current_chunk:
+        chunks.append(" ".join(current_chunk))
+    return chunks
+
+
+def api_calls(chunk_count, summary_chars, fan_in=4, target_chars=4000):
+    """Chunk calls plus the reduce calls summarize_hierarchical would make,
+    assuming every summary comes back `summary_chars` long."""
+    calls = chunk_count
+    summaries = ["x" * summary_chars] * chunk_count
+    while len(summaries) > 1 and len("\n\n".join(summaries)) > target_chars:
+        groups = group_summaries(summaries, fan_in, 16000)
+        calls += len(groups)
+        summaries = ["x" * summary_chars] * len(groups)
+    return calls
+
+
+EDIT = "This sentence was added in a later revision of the notes. "
+
+
+def edited(pages, where):
+    """`pages` with EDIT inserted at the start of the first, middle or last page."""
+    index = {"start": 0, "middle": len(pages) // 2, "end": len(pages) - 1}[where]
+    return pages[:index] + [EDIT + pages[index]] + pages[index + 1 :]
+
+
+def reused(before, after):
+    """How many chunks of `after` already appear in `before`."""
+    known = set(before)
+    return sum(chunk in known for chunk in after)
+
+
+def synthetic_pages(count, seed=0):
+    rng = random.Random(seed)
+    words = "the model summary lecture notes gradient theorem proof example data result method".split()
+    for _ in range(count):
+        sentences = [
+            " ".join(rng.choice(words) for _ in range(rng.randint(6, 28))).capitalize() + "."
+            for _ in range(rng.randint(25, 40))
+        ]
+        yield " ".join(sentences) + "\n\n"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("pdfs", nargs="*")
+    parser.add_argument("--synthetic-pages", type=int, default=0)
+    parser.add_argument("--tokenizer", default="auto")
+    parser.add_argument("--overlap", type=int, default=100)
+    parser.add_argument("--summary-chars", type=int, default=1500)
+    args = parser.parse_args()
+
+    count_tokens = get_token_counter(args.tokenizer)
+    budget = chunk_token_budget(count_tokens, SYSTEM_PROMPT + chunk_prompt(""), 8192, 1000)
+    print(f"token budget per chunk: {budget}")
+
+    documents = [(path, list(iter_pages(path))) for path in args.pdfs]
+    if args.synthetic_pages:
+        documents.append((f"synthetic ({args.synthetic_pages} pages)", list(synthetic_pages(args.synthetic_pages))))
+
+    for name, pages in documents:
+        legacy = legacy_chunk_text("".join(pages))
+        token_aware = list(iter_chunks(pages, budget, args.overlap, count_tokens))
+        for label, chunks in (("8000 chars", legacy), ("token budget", token_aware)):
+            largest = max((count_tokens(chunk) for chunk in chunks), default=0)
+            print(
+                f"{name:<28} {label:<13} chunks={len(chunks):<4} "
+                f"api_calls={api_calls(len(chunks), args.summary_chars):<4} largest_chunk={largest} tokens"
+            )
+        for where in ("start", "middle", "end"):
+            chunks = list(iter_chunks(edited(pages, where), budget, args.overlap, count_tokens))
+            print(f"{'':<28} edit at {where:<6} {reused(token_aware, chunks)}/{len(chunks)} chunks unchanged")
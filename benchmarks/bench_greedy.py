@@ -0,0 +1,87 @@
+"""Greedy requests through the scheduler vs. Hugging Face generate: same tokens, and the time each takes.
+
+    python -m benchmarks.bench_greedy --requests 8 --tokens 32
+    python -m benchmarks.bench_greedy --model sshleifer/tiny-gpt2
+"""
+
+import argparse
+import asyncio
+import random
+import sys
+import time
+
+import torch
+
+from backend.inference.sampling import SamplingParams
+from backend.inference.scheduler import BatchScheduler
+from benchmarks.tiny_llm import load_model
+
+
+async def scheduler_tokens(model, prompts, max_tokens, sampling, batch_size):
+    """Every prompt at once through the scheduler, which batches them."""
+    # eos_token_id is -1, so every request runs to max_tokens
+    scheduler = BatchScheduler(model, eos_token_id=-1, device="cpu", max_batch_size=batch_size)
+
+    async def one(prompt):
+        return [token async for token in scheduler.generate(prompt, max_tokens, sampling)]
+
+    try:
+        return await asyncio.gather(*(one(prompt) for prompt in prompts))
+    finally:
+        scheduler.close()
+
+
+def generate_tokens(model, prompts, max_tokens, sampling):
+    """The reference: one unpadded generate() call per prompt."""
+    outputs = []
+    with torch.no_grad():
+        for prompt in prompts:
+            output = model.generate(
+                torch.tensor([prompt]),
+                attention_mask=torch.ones(1, len(prompt), dtype=torch.long),
+                max_new_tokens=max_tokens,
+                do_sample=False,
+                repetition_penalty=sampling.repetition_penalty,
+                eos_token_id=None,
+                pad_token_id=0,
+            )
+            outputs.append(output[0, len(prompt) :].tolist())
+    return outputs
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--model", default=None, help="Hugging Face name or path (default: a tiny random Llama)")
+    parser.add_argument("--requests", type=int, default=8)
+    parser.add_argument("--tokens", type=int, default=32)
+    parser.add_argument("--batch-size", type=int, default=4)
+    parser.add_argument("--penalties", default="1.0,1.2", help="repetition penalties to check")
+    args = parser.parse_args()
+
+    model = load_model(args.model)
+    model.generation_config.eos_token_id = None
+    rng = random.Random(0)
+    vocab = model.config.vocab_size
+    # Different lengths, so the scheduler's batches are left-padded
+    prompts = [[rng.randrange(1, vocab) for _ in range(rng.randint(4, 48))] for _ in range(args.requests)]
+
+    mismatched = 0
+    for penalty in [float(p) for p in args.penalties.split(",")]:
+        sampling = SamplingParams(temperature=0, repetition_penalty=penalty)
+        start = time.perf_counter()
+        ours = asyncio.run(scheduler_tokens(model, prompts, args.tokens, sampling, args.batch_size))
+        scheduler_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        reference = generate_tokens(model, prompts, args.tokens, sampling)
+        generate_seconds = time.perf_counter() - start
+        same = sum(a == b for a, b in zip(ours, reference))
+        mismatched += len(prompts) - same
+        print(
+            f"repetition penalty {penalty}: {same}/{len(prompts)} identical   "
+            f"scheduler {scheduler_seconds:6.2f} s   generate() {generate_seconds:6.2f} s"
+        )
+        for index, (a, b) in enumerate(zip(ours, reference)):
+            if a != b:
+                first = next((i for i, (x, y) in enumerate(zip(a, b)) if x != y), min(len(a), len(b)))
+                print(f"  request {index} first differs at token {first}: {a[first:first + 1]} vs {b[first:first + 1]}")
+    sys.exit(1 if mismatched else 0)
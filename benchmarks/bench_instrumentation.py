@@ -0,0 +1,91 @@
+"""Cost of the instrumentation: spans, timed iterators, /metrics rendering and request profiling.
+
+    python -m benchmarks.bench_instrumentation backend/test.pdf
+"""
+
+import argparse
+import time
+
+from chunking import estimate_tokens, iter_chunks
+from instrumentation import Profiler, Registry, span, timed_iter
+from pdf_extract import iter_pages
+
+
+def per_call(function, calls):
+    start = time.perf_counter()
+    for _ in range(calls):
+        function()
+    return (time.perf_counter() - start) / calls
+
+
+def noop_span():
+    with span("bench.noop"):
+        pass
+
+
+def extract_and_chunk(path, instrumented):
+    """The upload pipeline's CPU work: page extraction feeding the chunker."""
+    pages = iter_pages(path, workers=1)
+    if instrumented:
+        pages = timed_iter(pages, "bench.pdf")
+    chunks = iter_chunks(pages, 1500, 100, estimate_tokens)
+    if instrumented:
+        chunks = timed_iter(chunks, "bench.chunking")
+    return sum(1 for _ in chunks)
+
+
+def best_of(repeat, variants):
+    """Best time of each variant; rounds interleave them so that drift in
+    machine speed does not favour one."""
+    best = {name: float("inf") for name in variants}
+    for _ in range(repeat):
+        for name, function in variants.items():
+            start = time.perf_counter()
+            function()
+            best[name] = min(best[name], time.perf_counter() - start)
+    return best
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("pdf", nargs="?", default="backend/test.pdf")
+    parser.add_argument("--calls", type=int, default=200000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"span():               {per_call(noop_span, args.calls) * 1e6:6.2f} us per block")
+    items = list(range(args.calls))
+    start = time.perf_counter()
+    for _ in timed_iter(items, "bench.items"):
+        pass
+    print(f"timed_iter():         {(time.perf_counter() - start) / args.calls * 1e6:6.2f} us per item")
+
+    # A scrape of the two stock histograms with every stage of both apps
+    registry = Registry()
+    stages = registry.histogram("stage_seconds", "", ("stage",))
+    requests = registry.histogram("http_request_seconds", "", ("method", "route", "status"))
+    for i in range(40):
+        stages.observe(0.01, stage=f"stage.{i}")
+        requests.observe(0.01, method="GET", route=f"/route/{i}", status=200)
+    print(f"render(), 80 series:  {per_call(registry.render, 200) * 1e3:6.2f} ms per scrape ({len(registry.render())} bytes)")
+
+    # slow_seconds=inf: measure the profiling, not the profile writing
+    sampling = Profiler(slow_seconds=float("inf"), enabled=True, cprofile=False)
+    full = Profiler(slow_seconds=float("inf"), enabled=True)
+
+    def profiled(profiler):
+        with profiler.profile("bench"):
+            extract_and_chunk(args.pdf, True)
+
+    times = best_of(
+        args.repeat,
+        {
+            "plain": lambda: extract_and_chunk(args.pdf, False),
+            "timed_iter on both stages": lambda: extract_and_chunk(args.pdf, True),
+            "profiled, stack samples only": lambda: profiled(sampling),
+            "profiled, stack samples + cProfile": lambda: profiled(full),
+        },
+    )
+    print(f"\nextract + chunk {args.pdf}")
+    for name, seconds in times.items():
+        print(f"  {name:<36}{seconds * 1e3:7.1f} ms ({seconds / times['plain'] - 1:+.1%})")
@@ -0,0 +1,104 @@
+"""Home page listing on a large library: unbounded full-row scan vs. keyset pages.
+
+    python -m benchmarks.bench_listing --documents 100000
+    python -m benchmarks.bench_listing --documents 20000 --summary-chars 8000 --text-chars 50000
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+from db import PREVIEW_LENGTH, list_documents, migrate
+
+
+def seed(conn, count, summary_chars, text_chars, seed=0):
+    """Insert `count` documents with the pre-migration schema (no preview
+    column, no index), spread over about a year of upload dates."""
+    rng = random.Random(seed)
+    conn.execute(
+        """
+        CREATE TABLE documents (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            filename TEXT NOT NULL,
+            original_text TEXT NOT NULL,
+            summary TEXT NOT NULL,
+            upload_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """
+    )
+    summary = "lorem ipsum dolor sit amet " * (summary_chars // 27 + 1)
+    text = "consectetur adipiscing elit " * (text_chars // 28 + 1)
+    start = time.time() - 365 * 86400
+    rows = (
+        (
+            f"notes_{i}.pdf",
+            text[:text_chars],
+            summary[rng.randint(0, 26):][:summary_chars],
+            time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(start + rng.uniform(0, 365 * 86400))),
+        )
+        for i in range(count)
+    )
+    conn.executemany("INSERT INTO documents (filename, original_text, summary, upload_date) VALUES (?, ?, ?, ?)", rows)
+    conn.commit()
+
+
+def timed(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--documents", type=int, default=100000)
+    parser.add_argument("--summary-chars", type=int, default=2000)
+    parser.add_argument("--text-chars", type=int, default=5000)
+    parser.add_argument("--page-size", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "listing.db")
+        conn = sqlite3.connect(path)
+        start = time.perf_counter()
+        seed(conn, args.documents, args.summary_chars, args.text_chars)
+        print(f"seeded {args.documents} documents in {time.perf_counter() - start:.1f}s "
+              f"({os.path.getsize(path) / 1e6:.0f} MB)")
+
+        def legacy():
+            rows = conn.execute(
+                "SELECT id, filename, summary, upload_date FROM documents ORDER BY upload_date DESC"
+            ).fetchall()
+            # The template then truncated every summary to PREVIEW_LENGTH
+            return [(r[0], r[1], r[2][:PREVIEW_LENGTH], r[3]) for r in rows]
+
+        seconds, rows = timed(legacy, args.repeat)
+        print(f"{'unbounded scan (before)':<26} {seconds * 1000:9.1f} ms  rows={len(rows)}")
+
+        start = time.perf_counter()
+        migrate(conn)
+        print(f"migration (preview + index) {time.perf_counter() - start:.1f}s")
+
+        seconds, (rows, cursor) = timed(lambda: list_documents(conn, args.page_size), args.repeat)
+        print(f"{'first page':<26} {seconds * 1000:9.3f} ms  rows={len(rows)}")
+
+        # Walk half the library to get a cursor deep in the index
+        deep = cursor
+        for _ in range(args.documents // args.page_size // 2):
+            _, deep = list_documents(conn, args.page_size, deep)
+        seconds, (rows, _) = timed(lambda: list_documents(conn, args.page_size, deep), args.repeat)
+        print(f"{'page at 50% depth':<26} {seconds * 1000:9.3f} ms  rows={len(rows)}")
+
+        plan = conn.execute(
+            "EXPLAIN QUERY PLAN SELECT id, filename, preview, upload_date FROM documents "
+            "WHERE (upload_date, id) < (?, ?) ORDER BY upload_date DESC, id DESC LIMIT 21",
+            deep,
+        ).fetchall()
+        print("query plan:", "; ".join(row[-1] for row in plan))
+        conn.close()
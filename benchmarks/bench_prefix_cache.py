@@ -0,0 +1,82 @@
+"""Prefill saved by the prompt-prefix KV cache on repeated-prefix workloads.
+
+    python -m benchmarks.bench_prefix_cache --requests 40
+    python -m benchmarks.bench_prefix_cache --instruction-tokens 512 --turn-tokens 64
+"""
+
+import argparse
+import asyncio
+import random
+import statistics
+import time
+
+from backend.inference.prefix_cache import PrefixCache
+from backend.inference.sampling import SamplingParams
+from backend.inference.scheduler import BatchScheduler
+from benchmarks.tiny_llm import load_model
+
+
+def mcq_prompts(count, instruction_tokens, notes_tokens, vocab, rng):
+    """A fixed instruction followed by different notes, like generate_mcqs."""
+    instruction = [rng.randrange(1, vocab) for _ in range(instruction_tokens)]
+    return [instruction + [rng.randrange(1, vocab) for _ in range(notes_tokens)] for _ in range(count)]
+
+
+def chat_prompts(count, system_tokens, turn_tokens, conversations, vocab, rng):
+    """Interleaved conversations whose history grows by one turn per request."""
+    system = [rng.randrange(1, vocab) for _ in range(system_tokens)]
+    histories = [list(system) for _ in range(conversations)]
+    prompts = []
+    for i in range(count):
+        history = histories[i % conversations]
+        history.extend(rng.randrange(1, vocab) for _ in range(turn_tokens))
+        prompts.append(list(history))
+    return prompts
+
+
+async def run(scheduler, prompts, max_tokens):
+    ttft = []
+    for prompt in prompts:
+        start = time.perf_counter()
+        async for _ in scheduler.generate(prompt, max_tokens, SamplingParams()):
+            ttft.append(time.perf_counter() - start)
+            break
+    return ttft
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--model", help="Hugging Face model name or path (default: tiny random Llama)")
+    parser.add_argument("--requests", type=int, default=40)
+    parser.add_argument("--instruction-tokens", type=int, default=256)
+    parser.add_argument("--notes-tokens", type=int, default=128)
+    parser.add_argument("--turn-tokens", type=int, default=48)
+    parser.add_argument("--cache-mb", type=int, default=256)
+    args = parser.parse_args()
+
+    model = load_model(args.model)
+    vocab = model.config.vocab_size
+    rng = random.Random(0)
+    workloads = {
+        "mcq": mcq_prompts(args.requests, args.instruction_tokens, args.notes_tokens, vocab, rng),
+        "chat": chat_prompts(args.requests, args.instruction_tokens, args.turn_tokens, 4, vocab, rng),
+    }
+
+    for name, prompts in workloads.items():
+        for cached in (False, True):
+            prefix_cache = PrefixCache(args.cache_mb * 1024 * 1024) if cached else None
+            scheduler = BatchScheduler(model, eos_token_id=-1, device="cpu", prefix_cache=prefix_cache)
+            ttft = asyncio.run(run(scheduler, prompts, 1))
+            stats = scheduler.stats()
+            scheduler.close()
+            line = (
+                f"{name:<5} cache={'on ' if cached else 'off'} prefill {stats['prefill_seconds']:6.2f}s "
+                f"for {stats['prefill_tokens']:6d} tokens  ttft p50={statistics.median(ttft) * 1000:7.1f}ms"
+            )
+            if cached:
+                cache = stats["prefix_cache"]
+                line += (
+                    f"  hit rate={cache['hit_rate']:.0%} tokens reused={cache['token_hit_rate']:.0%} "
+                    f"est. saved={cache['prefill_seconds_saved']:.2f}s"
+                )
+            print(line)
@@ -0,0 +1,88 @@
+"""Per-step sampling overhead on CPU: the Sampler vs. full-vocabulary baselines.
+
+    python -m benchmarks.bench_sampling --vocab 32000 --batch-sizes 1,8,32
+"""
+
+import argparse
+
+import torch
+
+from backend.inference.sampling import Sampler, SamplingParams, seen_tokens
+from benchmarks.bench_listing import timed
+
+
+def softmax_multinomial(logits, params):
+    """What the scheduler did before: temperature only, full softmax and
+    multinomial, with temperature 0 faked by a tiny divisor."""
+    temperatures = torch.tensor([p.temperature for p in params])
+    probs = torch.softmax(logits / temperatures.clamp(min=1e-8)[:, None], dim=-1)
+    return torch.multinomial(probs, num_samples=1).squeeze(-1)
+
+
+def full_sort(logits, params, seen):
+    """The textbook filters, one row at a time: penalty, full sort for
+    top-k/top-p, min-p, multinomial, and an item() per token."""
+    tokens = []
+    for row, p in zip(range(logits.shape[0]), params):
+        scores = logits[row]
+        if p.repetition_penalty != 1:
+            penalized = torch.where(scores > 0, scores / p.repetition_penalty, scores * p.repetition_penalty)
+            scores = torch.where(seen[row], penalized, scores)
+        if p.greedy:
+            tokens.append(scores.argmax().item())
+            continue
+        probs = torch.softmax(scores / p.temperature, dim=-1)
+        sorted_probs, order = probs.sort(descending=True)
+        keep = torch.ones_like(sorted_probs, dtype=torch.bool)
+        if p.top_k:
+            keep[p.top_k :] = False
+        if p.top_p < 1:
+            keep &= (sorted_probs.cumsum(-1) - sorted_probs) < p.top_p
+        if p.min_p:
+            keep &= sorted_probs >= p.min_p * sorted_probs[0]
+        sorted_probs = sorted_probs * keep
+        tokens.append(order[torch.multinomial(sorted_probs, 1)].item())
+    return torch.tensor(tokens)
+
+
+SETTINGS = {
+    "greedy": [SamplingParams(temperature=0)],
+    "temperature 0.7": [SamplingParams(temperature=0.7)],
+    "top-k 50": [SamplingParams(temperature=0.7, top_k=50)],
+    "top-p 0.9": [SamplingParams(temperature=0.7, top_p=0.9)],
+    "top-k+top-p+penalty": [SamplingParams(temperature=0.7, top_k=50, top_p=0.9, repetition_penalty=1.2)],
+    "mixed per row": [
+        SamplingParams(temperature=0),
+        SamplingParams(temperature=0.7, top_p=0.9),
+        SamplingParams(temperature=1.0, min_p=0.05),
+        SamplingParams(temperature=0.7, top_k=40, repetition_penalty=1.1),
+    ],
+}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--vocab", type=int, default=32000)
+    parser.add_argument("--batch-sizes", default="1,8,32")
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--threads", type=int, default=0, help="torch CPU threads (0: torch default)")
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    torch.manual_seed(0)
+    for batch_size in [int(size) for size in args.batch_sizes.split(",")]:
+        # Peaked like real LM logits, not uniform noise
+        logits = torch.randn(batch_size, args.vocab) * 3
+        seen = seen_tokens([list(range(0, 2000, 7))] * batch_size, args.vocab, "cpu")
+        print(f"batch {batch_size}, vocab {args.vocab}")
+        for name, pattern in SETTINGS.items():
+            params = [pattern[row % len(pattern)] for row in range(batch_size)]
+            sampler = Sampler()
+            ours, _ = timed(lambda: sampler(logits, params, seen), args.repeat)
+            textbook, _ = timed(lambda: full_sort(logits, params, seen), max(args.repeat // 10, 3))
+            line = f"  {name:<22} Sampler {ours * 1e6:8.0f} us/step   full sort per row {textbook * 1e6:8.0f} us/step"
+            if all(p.top_k == 0 and p.top_p == 1 and p.min_p == 0 and p.repetition_penalty == 1 for p in params):
+                before, _ = timed(lambda: softmax_multinomial(logits, params), args.repeat)
+                line += f"   softmax+multinomial {before * 1e6:8.0f} us/step"
+            print(line)
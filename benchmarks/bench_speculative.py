@@ -0,0 +1,96 @@
+"""Single-stream decode speed on CPU: plain decoding vs. speculative decoding with a draft model.
+
+The draft is the target's first layers with its embeddings, final norm and
+LM head (an early-exit copy). Randomly initialised deeper layers would
+rewrite the residual stream at random, so their output projections are
+scaled by --deep-scale. That makes the pair agree about as often as a real
+small/large pair of one family does; the measured acceptance rate shows how
+often that is.
+
+    python -m benchmarks.bench_speculative --layers 12 --draft-layers 2 --draft-tokens 2,4
+"""
+
+import argparse
+import asyncio
+import copy
+import random
+import time
+
+import torch
+
+from backend.inference.sampling import SamplingParams
+from backend.inference.scheduler import BatchScheduler
+from backend.inference.speculative import SpeculativeDecoder
+from benchmarks.tiny_llm import tiny_llama
+
+
+def damp_deep_layers(target, first, scale):
+    with torch.no_grad():
+        for layer in target.model.layers[first:]:
+            layer.self_attn.o_proj.weight.mul_(scale)
+            layer.mlp.down_proj.weight.mul_(scale)
+
+
+def early_exit_draft(target, layers):
+    draft = copy.deepcopy(target)
+    draft.model.layers = draft.model.layers[:layers]
+    draft.config.num_hidden_layers = layers
+    return draft.eval()
+
+
+async def run(engine, prompts, max_tokens, sampling, speculative):
+    """Requests one after another; returns tokens/s and per-request stats."""
+    tokens = 0
+    stats = []
+    start = time.perf_counter()
+    for prompt in prompts:
+        request_stats = {}
+        if speculative:
+            stream = engine.generate(prompt, max_tokens, sampling, request_stats)
+        else:
+            stream = engine.generate(prompt, max_tokens, sampling)
+        tokens += len([token async for token in stream])
+        stats.append(request_stats)
+    return tokens / (time.perf_counter() - start), stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--layers", type=int, default=12)
+    parser.add_argument("--hidden", type=int, default=512)
+    parser.add_argument("--draft-layers", type=int, default=2)
+    parser.add_argument("--draft-tokens", default="2,4")
+    parser.add_argument("--deep-scale", type=float, default=0.03, help="output scale of the layers the draft lacks")
+    parser.add_argument("--requests", type=int, default=4)
+    parser.add_argument("--max-tokens", type=int, default=64)
+    parser.add_argument("--threads", type=int, default=0, help="torch CPU threads (0: torch default)")
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    target = tiny_llama(layers=args.layers, hidden=args.hidden, heads=8, kv_heads=4)
+    damp_deep_layers(target, args.draft_layers, args.deep_scale)
+    draft = early_exit_draft(target, args.draft_layers)
+    vocab = target.config.vocab_size
+    rng = random.Random(0)
+    prompts = [[rng.randrange(1, vocab) for _ in range(32)] for _ in range(args.requests)]
+    print(f"target {args.layers} layers, draft {args.draft_layers} layers, {args.requests} requests x {args.max_tokens} tokens")
+
+    for name, sampling in (("greedy", SamplingParams(temperature=0)), ("T=0.7 top-p 0.9", SamplingParams(temperature=0.7, top_p=0.9))):
+        # Batch size 1: the scheduler's single-stream path
+        scheduler = BatchScheduler(target, eos_token_id=-1, device="cpu", max_batch_size=1)
+        baseline, _ = asyncio.run(run(scheduler, prompts, args.max_tokens, sampling, False))
+        scheduler.close()
+        print(f"{name:<16} plain decoding        {baseline:6.1f} tok/s")
+        for k in [int(k) for k in args.draft_tokens.split(",")]:
+            decoder = SpeculativeDecoder(target, draft, eos_token_id=-1, device="cpu", num_draft_tokens=k)
+            speed, stats = asyncio.run(run(decoder, prompts, args.max_tokens, sampling, True))
+            decoder.close()
+            acceptance = [s["acceptance_rate"] for s in stats]
+            per_request = [s["tokens_per_second"] for s in stats]
+            print(
+                f"{name:<16} speculative, k={k:<2}    {speed:6.1f} tok/s ({speed / baseline:4.2f}x)  "
+                f"acceptance {min(acceptance):.2f}-{max(acceptance):.2f}  "
+                f"per request {min(per_request):5.1f}-{max(per_request):5.1f} tok/s  "
+                f"tokens/target pass {sum(s['generated_tokens'] for s in stats) / sum(s['target_passes'] for s in stats):.2f}"
+            )
@@ -0,0 +1,132 @@
+"""Model startup time and memory: main.py's old double load vs. the shared registry.
+
+Each configuration loads a saved checkpoint in a fresh process and reports
+the time until the model is ready, its resident memory split into private
+(anonymous) pages and file pages mapped from the checkpoint, and greedy
+decode speed. File pages are shared between processes and can be
+reclaimed, so the private figure is the one that counts against RAM.
+
+    python -m benchmarks.bench_startup --layers 8 --hidden 768
+"""
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import torch
+
+from benchmarks.tiny_llm import tiny_llama, tiny_tokenizer
+
+CONFIGURATIONS = {
+    "before: two copies": {"mode": "double"},
+    "registry": {"mode": "registry"},
+    "registry, int8": {"mode": "registry", "quantize": "int8"},
+    "registry, .bin checkpoint": {"mode": "registry", "checkpoint": "bin"},
+}
+
+
+def rss_mb():
+    """(private, file-backed) resident MB of this process."""
+    fields = {}
+    with open("/proc/self/status") as f:
+        for line in f:
+            key, _, value = line.partition(":")
+            if key in ("RssAnon", "RssFile"):
+                fields[key] = int(value.split()[0]) / 1024
+    return fields.get("RssAnon", 0.0), fields.get("RssFile", 0.0)
+
+
+def decode_speed(model, steps=32):
+    input_ids = torch.tensor([[1] * 16])
+    with torch.no_grad():
+        outputs = model(input_ids=input_ids, use_cache=True)
+        past = outputs.past_key_values
+        token = outputs.logits[:, -1:].argmax(-1)
+        start = time.perf_counter()
+        for _ in range(steps):
+            outputs = model(input_ids=token, past_key_values=past, use_cache=True)
+            past = outputs.past_key_values
+            token = outputs.logits[:, -1:].argmax(-1)
+    return steps / (time.perf_counter() - start)
+
+
+def child(path, mode, quantize=None):
+    """Runs in a fresh process; prints one JSON line."""
+    # Imports happen before the server could bind either way
+    from transformers import AutoModelForCausalLM, AutoTokenizer
+
+    from backend.inference.registry import ModelRegistry
+
+    baseline = rss_mb()[0]
+    start = time.perf_counter()
+    if mode == "double":
+        # The old import-time sequence: the model, then the same checkpoint
+        # again for the summarization pipeline, before the server binds
+        AutoTokenizer.from_pretrained(path)
+        model = AutoModelForCausalLM.from_pretrained(path).eval()
+        AutoTokenizer.from_pretrained(path)
+        AutoModelForCausalLM.from_pretrained(path).eval()
+        bind = ready = time.perf_counter() - start
+    else:
+        registry = ModelRegistry("cpu")
+        registry.register("main", path, quantize=quantize)
+        registry.start()
+        bind = time.perf_counter() - start  # the server could bind here
+        registry.wait()
+        ready = time.perf_counter() - start
+        model = registry.get("main").model
+    tok_s = decode_speed(model)
+    private, mapped = rss_mb()
+    print(
+        json.dumps(
+            {
+                "bind": bind,
+                "ready": ready,
+                "peak_rss": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+                "private": private - baseline,
+                "mapped": mapped,
+                "tok_s": tok_s,
+            }
+        )
+    )
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--child":
+        child(sys.argv[2], sys.argv[3], sys.argv[4] if len(sys.argv) > 4 else None)
+        sys.exit()
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--layers", type=int, default=8)
+    parser.add_argument("--hidden", type=int, default=768)
+    parser.add_argument("--vocab", type=int, default=32000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        model = tiny_llama(layers=args.layers, hidden=args.hidden, heads=12, kv_heads=4, vocab=args.vocab)
+        tokenizer = tiny_tokenizer()
+        size = sum(p.numel() for p in model.parameters())
+        for checkpoint, safe in (("safetensors", True), ("bin", False)):
+            model.save_pretrained(os.path.join(tmp, checkpoint), safe_serialization=safe)
+            tokenizer.save_pretrained(os.path.join(tmp, checkpoint))
+        del model
+        print(f"{size / 1e6:.0f}M parameters, {size * 4 / 2**20:.0f} MB in float32")
+
+        for name, config in CONFIGURATIONS.items():
+            path = os.path.join(tmp, config.get("checkpoint", "safetensors"))
+            command = [sys.executable, "-m", "benchmarks.bench_startup", "--child", path, config["mode"]]
+            if config.get("quantize"):
+                command.append(config["quantize"])
+            output = subprocess.run(command, capture_output=True, text=True, check=True).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            print(
+                f"{name:<26} bind after {result['bind']:6.2f}s  ready after {result['ready']:6.2f}s  "
+                f"peak RSS {result['peak_rss']:6.0f} MB  private +{result['private']:4.0f} MB  "
+                f"file-mapped {result['mapped']:5.0f} MB  "
+                f"decode {result['tok_s']:6.1f} tok/s"
+            )
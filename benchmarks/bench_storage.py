@@ -0,0 +1,83 @@
+"""Database size and query latency: inline original_text vs. compressed out-of-row text.
+
+    python -m benchmarks.bench_storage --documents 2000 --pages 40
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+from benchmarks.bench_chunking import synthetic_pages
+from benchmarks.bench_listing import timed
+from db import get_document, iter_document_text, migrate
+
+# Schema version before original_text moved out of the documents table
+INLINE_TEXT_VERSION = 3
+
+
+def seed(conn, count, pages, summary_chars):
+    """Insert `count` documents with their text inline in documents."""
+    migrate(conn, INLINE_TEXT_VERSION)
+    summary = ("lorem ipsum dolor sit amet " * (summary_chars // 27 + 1))[:summary_chars]
+    # A pool of synthetic PDFs keeps seeding quick for large corpora
+    texts = ["".join(synthetic_pages(pages, seed=i)) for i in range(20)]
+    conn.execute("BEGIN")
+    conn.executemany(
+        "INSERT INTO documents (filename, original_text, summary, preview) VALUES (?, ?, ?, ?)",
+        ((f"notes_{i}.pdf", texts[i % len(texts)], summary, summary[:200]) for i in range(count)),
+    )
+    conn.execute("COMMIT")
+
+
+def database_bytes(conn):
+    conn.execute("VACUUM")
+    page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+    return conn.execute("PRAGMA page_count").fetchone()[0] * page_size
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--documents", type=int, default=2000)
+    parser.add_argument("--pages", type=int, default=40, help="synthetic PDF pages per document")
+    parser.add_argument("--summary-chars", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    ids = random.Random(0).sample(range(1, args.documents + 1), min(args.documents, 200))
+    scan = "SELECT count(*) FROM documents WHERE summary LIKE '%zzz%'"
+
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = sqlite3.connect(os.path.join(tmp, "storage.db"), isolation_level=None)
+        seed(conn, args.documents, args.pages, args.summary_chars)
+        inline_bytes = database_bytes(conn)
+        inline = {
+            "document page x200": timed(
+                lambda: [conn.execute("SELECT * FROM documents WHERE id = ?", (i,)).fetchone() for i in ids],
+                args.repeat,
+            )[0],
+            "summary scan": timed(lambda: conn.execute(scan).fetchone(), args.repeat)[0],
+        }
+
+        start = time.perf_counter()
+        migrate(conn)
+        migration_seconds = time.perf_counter() - start
+        compressed_bytes = database_bytes(conn)
+        out_of_row = {
+            "document page x200": timed(lambda: [get_document(conn, i) for i in ids], args.repeat)[0],
+            "summary scan": timed(lambda: conn.execute(scan).fetchone(), args.repeat)[0],
+        }
+        stream_seconds = timed(
+            lambda: [sum(map(len, iter_document_text(conn, i))) for i in ids[:20]], args.repeat
+        )[0]
+        conn.close()
+
+    print(
+        f"database size: {inline_bytes / 1e6:.1f} MB inline -> {compressed_bytes / 1e6:.1f} MB "
+        f"({inline_bytes / compressed_bytes:.1f}x smaller); migration {migration_seconds:.1f}s"
+    )
+    for name in inline:
+        print(f"{name:<20} {inline[name] * 1000:9.2f} ms -> {out_of_row[name] * 1000:9.2f} ms")
+    print(f"{'stream text x20':<20} {stream_seconds * 1000:9.2f} ms (only when the text is opened)")
@@ -0,0 +1,100 @@
+"""Streaming overhead: per-token decode and write vs. incremental detokenizer with batched flushes.
+
+    python -m benchmarks.bench_streaming --tokens 20000
+    python -m benchmarks.bench_streaming --flush-tokens 16 --flush-ms 100 --generate 256
+"""
+
+import argparse
+import asyncio
+import json
+import time
+
+from backend.inference.detokenizer import detokenize_stream
+from backend.inference.sampling import SamplingParams
+from backend.inference.scheduler import BatchScheduler
+from benchmarks.tiny_llm import SAMPLE_TEXT, tiny_llama, tiny_tokenizer
+
+# Characters the tokenizer was not trained on, so they span several tokens
+UNSEEN_TEXT = "量子力学の基礎 🧪🔬 Ελληνικά ∮ ∂ "
+
+
+async def replay(ids):
+    for token in ids:
+        yield token
+
+
+async def naive_stream(tokens, tokenizer):
+    """What the endpoints did before: decode every token on its own."""
+    async for token in tokens:
+        yield tokenizer.decode(token)
+
+
+async def consume(chunks):
+    """Serialize and 'write' one JSON line per chunk, as the endpoints do."""
+    lines = []
+    text = []
+    async for chunk in chunks:
+        lines.append(json.dumps({"delta": chunk}).encode("utf-8") + b"\n")
+        text.append(chunk)
+    return lines, "".join(text)
+
+
+def report(name, seconds, tokens, lines, text, expected=None):
+    line = (
+        f"{name:<26} {tokens / seconds:10.0f} tok/s  {len(lines):6d} writes  "
+        f"{sum(map(len, lines)) / 1024:8.1f} KB"
+    )
+    # Only meaningful for real text: the untrained model emits byte
+    # sequences that are not valid UTF-8 in the first place
+    if expected is not None:
+        line += f"  broken chars={text.count(chr(0xFFFD))}  exact={text == expected}"
+    print(line)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tokens", type=int, default=20000, help="tokens replayed through the streaming layer")
+    parser.add_argument("--flush-tokens", type=int, default=8)
+    parser.add_argument("--flush-ms", type=float, default=50)
+    parser.add_argument("--generate", type=int, default=128, help="tokens per request in the end-to-end run")
+    args = parser.parse_args()
+
+    tokenizer = tiny_tokenizer()
+    ids = tokenizer.encode((UNSEEN_TEXT + SAMPLE_TEXT) * 4)
+    ids = (ids * (args.tokens // len(ids) + 1))[: args.tokens]
+    expected = tokenizer.decode(ids)
+
+    print(f"replaying {len(ids)} tokens through the streaming layer")
+    for name, make in (
+        ("per-token decode", lambda: naive_stream(replay(ids), tokenizer)),
+        ("incremental, per token", lambda: detokenize_stream(replay(ids), tokenizer, 1, 0)),
+        (
+            f"incremental, {args.flush_tokens} tok/{args.flush_ms:g}ms",
+            lambda: detokenize_stream(replay(ids), tokenizer, args.flush_tokens, args.flush_ms),
+        ),
+    ):
+        start = time.perf_counter()
+        lines, text = asyncio.run(consume(make()))
+        report(name, time.perf_counter() - start, len(ids), lines, text, expected)
+
+    # End to end: a tiny model sharing the tokenizer's vocabulary
+    model = tiny_llama(vocab=len(tokenizer))
+    print(f"\ngenerating {args.generate} tokens x 8 concurrent requests with a tiny model")
+    for name, flush in (("per-token decode", None), ("incremental + flush", (args.flush_tokens, args.flush_ms))):
+        scheduler = BatchScheduler(model, eos_token_id=-1, device="cpu")
+
+        async def run():
+            def stream():
+                tokens = scheduler.generate(ids[:32], args.generate, SamplingParams())
+                if flush is None:
+                    return naive_stream(tokens, tokenizer)
+                return detokenize_stream(tokens, tokenizer, *flush)
+
+            return await asyncio.gather(*(consume(stream()) for _ in range(8)))
+
+        start = time.perf_counter()
+        results = asyncio.run(run())
+        seconds = time.perf_counter() - start
+        scheduler.close()
+        lines = [line for result in results for line in result[0]]
+        report(name, seconds, 8 * args.generate, lines, "".join(result[1] for result in results))
@@ -0,0 +1,57 @@
+"""Serial vs. concurrent chunk summarization against the local fake Groq server.
+
+    python -m benchmarks.bench_summarize --chunks 32 --latency 0.3 --rate-limit 0.1
+    python -m benchmarks.bench_summarize --chunks 200 --reply-chars 3000 --fan-in 4
+"""
+
+import argparse
+import time
+
+from benchmarks.fake_groq import start_server
+from summarizer import summarize_chunks, summarize_hierarchical
+
+
+def run(chunks, url, workers):
+    start = time.perf_counter()
+    summaries = summarize_chunks(chunks, "fake-key", max_workers=workers, api_url=url)
+    elapsed = time.perf_counter() - start
+    assert len(summaries) == len(chunks)
+    return elapsed
+
+
+def run_hierarchical(chunks, url, workers, fan_in):
+    start = time.perf_counter()
+    summary, levels = summarize_hierarchical(chunks, "fake-key", fan_in=fan_in, max_workers=workers, api_url=url)
+    elapsed = time.perf_counter() - start
+    return elapsed, levels
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--chunks", type=int, default=32)
+    parser.add_argument("--latency", type=float, default=0.3)
+    parser.add_argument("--rate-limit", type=float, default=0.1)
+    parser.add_argument("--reply-chars", type=int, default=0)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--fan-in", type=int, default=0, help="also run the tree reduce with this fan-in")
+    args = parser.parse_args()
+
+    server, url = start_server(latency=args.latency, rate_limit=args.rate_limit, reply_chars=args.reply_chars)
+    chunks = [f"chunk {i} " * 200 for i in range(args.chunks)]
+
+    for workers in args.workers:
+        server.stats.update(requests=0, rate_limited=0)
+        elapsed = run(chunks, url, workers)
+        print(
+            f"workers={workers:<3} {elapsed:7.2f}s  "
+            f"requests={server.stats['requests']} rate_limited={server.stats['rate_limited']}"
+        )
+
+    if args.fan_in:
+        for workers in args.workers:
+            elapsed, levels = run_hierarchical(chunks, url, workers, args.fan_in)
+            print(f"tree workers={workers:<3} fan_in={args.fan_in} {elapsed:7.2f}s")
+            for level in levels:
+                print(f"  level {level['level']}: {level['inputs']} -> {level['outputs']} in {level['seconds']:.2f}s")
+
+    server.shutdown()
@@ -0,0 +1,48 @@
+"""Serial vs. concurrent line synthesis against the local fake TTS server.
+
+    python -m benchmarks.bench_tts --lines 80 --latency 0.5 --workers 1 4 8
+"""
+
+import argparse
+import tempfile
+import time
+
+from backend.podcast import PodcastPipeline
+from benchmarks.fake_tts import start_server
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--lines", type=int, default=80)
+    parser.add_argument("--latency", type=float, default=0.5)
+    parser.add_argument("--rate-limit", type=float, default=0.05)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 8])
+    args = parser.parse_args()
+
+    server, url = start_server(latency=args.latency, rate_limit=args.rate_limit)
+    script = [{"speaker": f"Speaker {i % 2 + 1}", "text": f"Line number {i}."} for i in range(args.lines)]
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        for workers in args.workers:
+            pipeline = PodcastPipeline(
+                "fake", "fake", audio_dir=work_dir, elevenlabs_api_url=url, tts_workers=workers, use_tts_cache=False
+            )
+            server.stats.update(requests=0, rate_limited=0)
+            start = time.perf_counter()
+            files = pipeline.synthesize(script, work_dir)
+            elapsed = time.perf_counter() - start
+            assert len(files) == args.lines
+            print(
+                f"workers={workers:<3} {elapsed:7.2f}s  "
+                f"requests={server.stats['requests']} rate_limited={server.stats['rate_limited']}"
+            )
+
+        # Second run of the same script with the cache on: no TTS requests expected
+        pipeline = PodcastPipeline("fake", "fake", audio_dir=work_dir, elevenlabs_api_url=url)
+        for run in ("cold", "warm"):
+            server.stats.update(requests=0, rate_limited=0)
+            start = time.perf_counter()
+            pipeline.synthesize(script, work_dir)
+            elapsed = time.perf_counter() - start
+            print(f"cache {run:<4}   {elapsed:7.2f}s  requests={server.stats['requests']} {pipeline.last_cache_stats}")
+
+    server.shutdown()
@@ -0,0 +1,75 @@
+"""Local stand-in for the Groq chat completions endpoint.
+
+Replies after a configurable delay and rejects a fraction of requests with
+429 + Retry-After, so concurrency and backoff can be exercised offline:
+
+    python -m benchmarks.fake_groq --port 8765 --latency 0.5 --rate-limit 0.2
+    GROQ_API_URL=http://127.0.0.1:8765/openai/v1/chat/completions python app.py
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeGroqHandler(BaseHTTPRequestHandler):
+    latency = 0.2
+    rate_limit = 0.0
+    reply_chars = 0
+    retry_after = "0.1"
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.server.stats["requests"] += 1
+
+        if random.random() < self.rate_limit:
+            self.server.stats["rate_limited"] += 1
+            self.send_response(429)
+            self.send_header("Retry-After", self.retry_after)
+            self.end_headers()
+            return
+
+        time.sleep(self.latency)
+        prompt = json.loads(body)["messages"][-1]["content"]
+        content = f"summary of {len(prompt)} chars".ljust(self.reply_chars, ".")
+        reply = json.dumps({"choices": [{"message": {"role": "assistant", "content": content}}]}).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(reply)))
+        self.end_headers()
+        self.wfile.write(reply)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_server(port=0, latency=0.2, rate_limit=0.0, reply_chars=0):
+    """Start the fake server on a background thread and return (server, url)."""
+    handler = type(
+        "Handler", (FakeGroqHandler,), {"latency": latency, "rate_limit": rate_limit, "reply_chars": reply_chars}
+    )
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.stats = {"requests": 0, "rate_limited": 0}
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/openai/v1/chat/completions"
+    return server, url
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.2, help="seconds per successful reply")
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="fraction of requests answered with 429")
+    parser.add_argument("--reply-chars", type=int, default=0, help="pad every summary to this length")
+    args = parser.parse_args()
+
+    server, url = start_server(args.port, args.latency, args.rate_limit, args.reply_chars)
+    print(f"Fake Groq listening on {url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
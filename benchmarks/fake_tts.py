@@ -0,0 +1,69 @@
+"""Local stand-in for the ElevenLabs text-to-speech endpoint.
+
+Answers POST /v1/text-to-speech/<voice_id> with dummy audio bytes after a
+configurable delay, optionally rate-limiting a fraction of requests:
+
+    python -m benchmarks.fake_tts --port 8766 --latency 0.8
+"""
+
+import argparse
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeTTSHandler(BaseHTTPRequestHandler):
+    latency = 0.5
+    rate_limit = 0.0
+    clip_bytes = 16 * 1024
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        with self.server.lock:
+            self.server.stats["requests"] += 1
+
+        if random.random() < self.rate_limit:
+            with self.server.lock:
+                self.server.stats["rate_limited"] += 1
+            self.send_response(429)
+            self.send_header("Retry-After", "0.1")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        time.sleep(self.latency)
+        self.send_response(200)
+        self.send_header("Content-Type", "audio/mpeg")
+        self.send_header("Content-Length", str(self.clip_bytes))
+        self.end_headers()
+        self.wfile.write(b"\0" * self.clip_bytes)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_server(port=0, latency=0.5, rate_limit=0.0):
+    """Start the fake server on a background thread and return (server, base_url)."""
+    handler = type("Handler", (FakeTTSHandler,), {"latency": latency, "rate_limit": rate_limit})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.stats = {"requests": 0, "rate_limited": 0}
+    server.lock = threading.Lock()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/v1/text-to-speech"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--latency", type=float, default=0.5)
+    parser.add_argument("--rate-limit", type=float, default=0.0)
+    args = parser.parse_args()
+
+    server, url = start_server(args.port, args.latency, args.rate_limit)
+    print(f"Fake TTS listening on {url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,59 @@
+"""Tiny Llama-architecture model for CPU benchmarks of backend/inference.
+
+The default model is randomly initialised from a small config, so the
+benchmarks need no download; pass a Hugging Face name or path to measure a
+real checkpoint instead.
+"""
+
+import torch
+
+
+def tiny_llama(layers=4, hidden=256, heads=8, kv_heads=4, vocab=4096, seed=0):
+    from transformers import LlamaConfig, LlamaForCausalLM
+
+    torch.manual_seed(seed)
+    config = LlamaConfig(
+        vocab_size=vocab,
+        hidden_size=hidden,
+        intermediate_size=hidden * 4,
+        num_hidden_layers=layers,
+        num_attention_heads=heads,
+        num_key_value_heads=kv_heads,
+        max_position_embeddings=4096,
+    )
+    return LlamaForCausalLM(config).eval()
+
+
+def load_model(name=None, **tiny_kwargs):
+    if not name:
+        return tiny_llama(**tiny_kwargs)
+    from transformers import AutoModelForCausalLM
+
+    return AutoModelForCausalLM.from_pretrained(name).eval()
+
+
+SAMPLE_TEXT = (
+    "Newton's laws describe motion: F = ma, and momentum p = mv is conserved. "
+    "Les élèves révisent la leçon — « naïve » café. Ünïcödé “quotes” and … ellipses. "
+    "数学の講義ノート：微分と積分。 Σ x² ≤ ∞. Emoji for notes 📘✏️🧠 and done ✅. "
+)
+
+
+def tiny_tokenizer(vocab=4096, texts=None):
+    """A byte-level BPE tokenizer (like Llama 3's) trained on the spot, so
+    multi-byte characters span several tokens as they do in real models."""
+    from tokenizers import Tokenizer, decoders, models, pre_tokenizers, trainers
+    from transformers import PreTrainedTokenizerFast
+
+    from benchmarks.bench_chunking import synthetic_pages
+
+    if texts is None:
+        texts = [SAMPLE_TEXT * 20] + list(synthetic_pages(50))
+    tokenizer = Tokenizer(models.BPE())
+    tokenizer.pre_tokenizer = pre_tokenizers.ByteLevel(add_prefix_space=False)
+    tokenizer.decoder = decoders.ByteLevel()
+    trainer = trainers.BpeTrainer(
+        vocab_size=vocab, special_tokens=["<|eos|>"], initial_alphabet=pre_tokenizers.ByteLevel.alphabet()
+    )
+    tokenizer.train_from_iterator(texts, trainer)
+    return PreTrainedTokenizerFast(tokenizer_object=tokenizer, eos_token="<|eos|>")
@@ -0,0 +1,208 @@
+"""Token-aware text chunking for the summarization prompts.
+
+Chunks are sized by a token budget -- the model's context window minus the
+prompt template and the tokens reserved for the reply -- rather than by
+characters, and are cut on paragraph and sentence boundaries with an
+optional overlap between neighbouring chunks. Token counting is pluggable:
+tiktoken or a Hugging Face tokenizer when installed, otherwise a cheap
+estimate.
+
+Where a chunk ends is decided by its last sentence, not by how much text
+came before it: once a chunk is three quarters full, it ends after any
+sentence whose hash falls under a threshold (content-defined chunking). An
+edit then only changes the chunks around it; the ones after it fall back
+onto the same boundaries, so their summaries can come from the cache.
+"""
+
+import importlib.util
+import math
+import re
+import zlib
+from typing import Callable, Iterable, Iterator, List
+
+TokenCounter = Callable[[str], int]
+
+PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+# Bump whenever the same text and settings would be cut differently
+CHUNKING_VERSION = "2"
+# Past the minimum, a chunk ends on average after this share of max_tokens more
+ANCHOR_SPAN = 0.125
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough count for English prose: about four characters per token, and
+    never fewer tokens than words."""
+    return max(math.ceil(len(text) / 4), len(text.split()))
+
+
+def resolve_tokenizer(name: str = "auto") -> str:
+    """The tokenizer get_token_counter(name) uses, with "auto" resolved."""
+    if name != "auto":
+        return name
+    return "tiktoken" if importlib.util.find_spec("tiktoken") else "estimate"
+
+
+def get_token_counter(name: str = "auto") -> TokenCounter:
+    """Return a token counter.
+
+    `name` is "estimate", "tiktoken[:<encoding>]", "hf:<model name>" or
+    "auto" (tiktoken when installed, else the estimate).
+    """
+    name = resolve_tokenizer(name)
+    if name == "estimate":
+        return estimate_tokens
+
+    if name.startswith("tiktoken"):
+        import tiktoken
+
+        # Llama 3 uses a tiktoken-style BPE; cl100k_base counts come close
+        encoding = tiktoken.get_encoding(name.partition(":")[2] or "cl100k_base")
+        return lambda text: len(encoding.encode(text, disallowed_special=()))
+
+    if name.startswith("hf:"):
+        from transformers import AutoTokenizer
+
+        tokenizer = AutoTokenizer.from_pretrained(name[3:])
+        return lambda text: len(tokenizer.encode(text, add_special_tokens=False))
+
+    raise ValueError(f"Unknown tokenizer: {name}")
+
+
+def chunk_token_budget(
+    count_tokens: TokenCounter,
+    prompt_template: str,
+    context_window: int = 8192,
+    max_output_tokens: int = 1000,
+    safety_margin: float = 0.05,
+) -> int:
+    """Tokens of document text that fit in one request next to the prompt
+    template and the reply."""
+    # ~4 tokens of chat formatting per message, two messages
+    available = context_window - max_output_tokens - count_tokens(prompt_template) - 8
+    budget = int(available * (1 - safety_margin))
+    if budget <= 0:
+        raise ValueError("Prompt and reply reserve leave no room for document text")
+    return budget
+
+
+def _split_units(
+    text: str, count_tokens: TokenCounter, max_tokens: int, closes_paragraph: bool = True
+) -> Iterator[tuple]:
+    """Yield (text, tokens, ends_paragraph) units: sentences, or word runs for
+    sentences that are longer than a whole chunk. Unless `closes_paragraph`,
+    the last paragraph of `text` continues in the text that follows."""
+    paragraphs = PARAGRAPH_BREAK.split(text)
+    for p, paragraph in enumerate(paragraphs):
+        sentences = [s for s in SENTENCE_END.split(paragraph.strip()) if s]
+        for i, sentence in enumerate(sentences):
+            sentence = " ".join(sentence.split())
+            last = i == len(sentences) - 1 and (closes_paragraph or p < len(paragraphs) - 1)
+            tokens = count_tokens(sentence)
+            if tokens <= max_tokens:
+                yield sentence, tokens, last
+                continue
+
+            words = sentence.split()
+            piece = []
+            piece_tokens = 0
+            for word in words:
+                word_tokens = count_tokens(word) + 1
+                if piece and piece_tokens + word_tokens > max_tokens:
+                    yield " ".join(piece), piece_tokens, False
+                    piece = []
+                    piece_tokens = 0
+                piece.append(word)
+                piece_tokens += word_tokens
+            if piece:
+                yield " ".join(piece), piece_tokens, last
+
+
+def iter_chunks(
+    pieces: Iterable[str],
+    max_tokens: int,
+    overlap_tokens: int = 0,
+    count_tokens: TokenCounter = estimate_tokens,
+) -> Iterator[str]:
+    """Yield chunks of at most `max_tokens` tokens from a stream of text
+    pieces (e.g. PDF pages), as soon as each chunk is complete.
+
+    Chunks end on sentence boundaries and keep paragraph breaks. A chunk
+    ends early, once it holds 3/4 of `max_tokens`, after a sentence picked by
+    its content (see the module docstring). The last sentences of a chunk,
+    up to `overlap_tokens`, are repeated at the start of the next one.
+    """
+    if overlap_tokens >= max_tokens:
+        raise ValueError("overlap_tokens must be smaller than max_tokens")
+
+    min_tokens = max_tokens - max_tokens // 4
+    # A sentence of n tokens ends the chunk with probability n / span, so the
+    # expected length does not depend on how long the sentences are
+    span = max(int(max_tokens * ANCHOR_SPAN), 1)
+    units = []  # (text, tokens, ends_paragraph) in the chunk being built
+    total = 0
+    has_new_text = False  # units holds more than the overlap already emitted
+    carry = ""  # text after the last sentence end of the previous piece
+
+    def emit():
+        parts = []
+        for text, _, ends_paragraph in units:
+            parts.append(text)
+            parts.append("\n\n" if ends_paragraph else " ")
+        return "".join(parts).strip()
+
+    def cut():
+        nonlocal units, total, has_new_text
+        chunk = emit()
+        kept = []
+        kept_tokens = 0
+        for previous in reversed(units):
+            if kept_tokens + previous[1] > overlap_tokens:
+                break
+            kept.insert(0, previous)
+            kept_tokens += previous[1]
+        units = kept
+        total = kept_tokens
+        has_new_text = False
+        return chunk
+
+    def add(text, closes_paragraph):
+        nonlocal total, has_new_text
+        for unit in _split_units(text, count_tokens, max_tokens - overlap_tokens, closes_paragraph):
+            if units and total + unit[1] > max_tokens:
+                yield cut()
+            units.append(unit)
+            total += unit[1]
+            has_new_text = True
+            if total >= min_tokens and zlib.crc32(unit[0].encode("utf-8")) < (unit[1] << 32) // span:
+                yield cut()
+
+    for piece in pieces:
+        text = carry + piece
+        # Hold back a trailing partial sentence; the next piece may finish it
+        paragraph_end = text.rfind("\n\n")
+        boundary = max(text.rfind(". "), text.rfind("! "), text.rfind("? "), paragraph_end)
+        if boundary == -1:
+            if len(text) < 8 * max_tokens:
+                carry = text
+                continue
+            # Unpunctuated text (e.g. OCR output): cut at the last space instead
+            boundary = text.rfind(" ")
+        if boundary == paragraph_end:
+            # Only a blank line ends a paragraph; a page break alone does not
+            carry = text[boundary + 2 :]
+            yield from add(text[:boundary], True)
+        else:
+            carry = text[boundary + 1 :]
+            yield from add(text[: boundary + 1], False)
+
+    if carry.strip():
+        yield from add(carry, True)
+    if has_new_text:
+        yield emit()
+
+
+def chunk_text(
+    text: str, max_tokens: int, overlap_tokens: int = 0, count_tokens: TokenCounter = estimate_tokens
+) -> List[str]:
+    return list(iter_chunks([text], max_tokens, overlap_tokens, count_tokens))
@@ -0,0 +1,447 @@
+"""SQLite connection pool, schema migrations and document queries.
+
+Connections are opened once, tuned (WAL journal, relaxed fsync, larger page
+cache, memory-mapped reads) and reused from a pool, so each request also
+reuses the connection's prepared-statement cache. Under WAL, readers never
+wait for the upload worker that is writing.
+
+The schema version is kept in SQLite's `user_version` pragma; `migrate`
+applies every migration above it in order, so existing databases are
+upgraded in place instead of being recreated.
+
+Extracted PDF text is stored zlib-compressed in its own table, out of the
+`documents` rows, and only read when it is actually shown. An FTS5 index
+over filename, summary and text backs the search page.
+"""
+
+import codecs
+import queue
+import re
+import sqlite3
+import zlib
+from contextlib import contextmanager
+from typing import Iterator, List, Optional, Tuple
+
+from instrumentation import timed
+
+PREVIEW_LENGTH = 200
+TEXT_COMPRESSION_LEVEL = 6
+
+
+def _create_documents(c):
+    c.execute(
+        """
+        CREATE TABLE IF NOT EXISTS documents (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            filename TEXT NOT NULL,
+            original_text TEXT NOT NULL,
+            summary TEXT NOT NULL,
+            upload_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """
+    )
+
+
+def _add_preview_and_listing_index(c):
+    # The home page only shows the start of each summary; store it so the
+    # listing never has to read full summaries
+    c.execute("ALTER TABLE documents ADD COLUMN preview TEXT NOT NULL DEFAULT ''")
+    c.execute("UPDATE documents SET preview = substr(summary, 1, ?)", (PREVIEW_LENGTH,))
+    # Covers ORDER BY upload_date DESC, id DESC and the keyset cursor
+    c.execute("CREATE INDEX IF NOT EXISTS idx_documents_upload_date ON documents (upload_date DESC, id DESC)")
+
+
+def _create_jobs(c):
+    c.execute(
+        """
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'queued',
+            stage TEXT NOT NULL DEFAULT 'queued',
+            progress REAL NOT NULL DEFAULT 0,
+            payload TEXT NOT NULL,
+            result TEXT,
+            error TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """
+    )
+    c.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, id)")
+
+
+def _pack_text(text: str) -> Tuple[int, bytes]:
+    """(uncompressed UTF-8 size, zlib data) for a document_texts row."""
+    encoded = text.encode("utf-8")
+    return len(encoded), zlib.compress(encoded, TEXT_COMPRESSION_LEVEL)
+
+
+def _move_original_text(c):
+    # Raw text was most of each documents row; scans and SELECT * dragged it
+    # along. It now lives compressed in document_texts, one row per document.
+    c.execute(
+        """
+        CREATE TABLE IF NOT EXISTS document_texts (
+            document_id INTEGER PRIMARY KEY REFERENCES documents (id) ON DELETE CASCADE,
+            codec TEXT NOT NULL DEFAULT 'zlib',
+            size INTEGER NOT NULL,
+            data BLOB NOT NULL
+        )
+    """
+    )
+    ids = [row[0] for row in c.execute("SELECT id FROM documents WHERE original_text != ''").fetchall()]
+    for document_id in ids:
+        text = c.execute("SELECT original_text FROM documents WHERE id = ?", (document_id,)).fetchone()[0]
+        c.execute(
+            "INSERT OR REPLACE INTO document_texts (document_id, size, data) VALUES (?, ?, ?)",
+            (document_id, *_pack_text(text)),
+        )
+        # original_text is NOT NULL and DROP COLUMN needs SQLite 3.35; empty it
+        c.execute("UPDATE documents SET original_text = '' WHERE id = ?", (document_id,))
+
+
+def _unpack_text(data: Optional[bytes]) -> Optional[str]:
+    return zlib.decompress(data).decode("utf-8") if data is not None else None
+
+
+def register_functions(conn: sqlite3.Connection):
+    """SQL functions the schema depends on; every connection needs them."""
+    conn.create_function("unpack_text", 1, _unpack_text, deterministic=True)
+
+
+def _create_search_index(c):
+    # External-content FTS5: the index stores only tokens, and highlight()
+    # and snippet() read the text back through this view, decompressing just
+    # the rows being shown
+    c.execute(
+        """
+        CREATE VIEW IF NOT EXISTS document_search_content AS
+        SELECT d.id, d.filename, d.summary, unpack_text(t.data) AS original_text
+        FROM documents d LEFT JOIN document_texts t ON t.document_id = d.id
+    """
+    )
+    c.execute(
+        """
+        CREATE VIRTUAL TABLE IF NOT EXISTS documents_fts USING fts5(
+            filename, summary, original_text,
+            content = 'document_search_content', content_rowid = 'id',
+            tokenize = 'porter unicode61', prefix = '2 3'
+        )
+    """
+    )
+    c.execute("INSERT INTO documents_fts (documents_fts) VALUES ('rebuild')")
+
+
+def _index_four_letter_prefixes(c):
+    # Without a prefix index for its length, a query like "lear*" merges the
+    # document lists of every term it expands to, for every query
+    c.execute("DROP TABLE documents_fts")
+    c.execute(
+        """
+        CREATE VIRTUAL TABLE documents_fts USING fts5(
+            filename, summary, original_text,
+            content = 'document_search_content', content_rowid = 'id',
+            tokenize = 'porter unicode61', prefix = '2 3 4'
+        )
+    """
+    )
+    c.execute("INSERT INTO documents_fts (documents_fts) VALUES ('rebuild')")
+
+
+# Index i upgrades the schema from version i to i + 1. Only ever append.
+MIGRATIONS = [
+    _create_documents,
+    _add_preview_and_listing_index,
+    _create_jobs,
+    _move_original_text,
+    _create_search_index,
+    _index_four_letter_prefixes,
+]
+
+# bm25 column weights: a match in the filename or summary ranks above one
+# buried in the extracted text
+SEARCH_WEIGHTS = (10.0, 4.0, 1.0)
+# Only this many matches, the newest, are ranked: bm25 scores every row it
+# is given, which made common terms slower to search than a full scan
+SEARCH_CANDIDATES = 500
+# Private-use markers around matches; the caller escapes the text and then
+# swaps them for real tags
+MATCH_START = "\ue000"
+MATCH_END = "\ue001"
+
+PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    # Durable at every checkpoint; a power cut can only lose the last commits
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA cache_size = -16000",  # 16 MB
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA mmap_size = 268435456",  # 256 MB
+    "PRAGMA foreign_keys = ON",
+)
+
+
+class Database:
+    def __init__(self, path: str = "pdf_summaries.db", pool_size: int = 8, timeout: float = 30,
+                 cached_statements: int = 256):
+        self.path = path
+        self.timeout = timeout
+        self.cached_statements = cached_statements
+        self._idle = queue.LifoQueue(maxsize=pool_size)
+
+    def _open(self) -> sqlite3.Connection:
+        # Autocommit mode: transactions are explicit (see transaction()), so
+        # plain reads never hold a snapshot open between statements
+        conn = sqlite3.connect(
+            self.path,
+            timeout=self.timeout,
+            isolation_level=None,
+            check_same_thread=False,
+            cached_statements=self.cached_statements,
+        )
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        register_functions(conn)
+        return conn
+
+    @contextmanager
+    def connect(self) -> Iterator[sqlite3.Connection]:
+        """Borrow a pooled connection for the duration of the block."""
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = self._open()
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            try:
+                self._idle.put_nowait(conn)
+            except queue.Full:
+                conn.close()
+
+    @contextmanager
+    def transaction(self, immediate: bool = False) -> Iterator[sqlite3.Connection]:
+        """Run the block in one transaction, committed on success.
+
+        `immediate` takes the write lock up front, for read-then-write blocks
+        that must not race another writer.
+        """
+        with self.connect() as conn:
+            conn.execute("BEGIN IMMEDIATE" if immediate else "BEGIN")
+            try:
+                yield conn
+            except BaseException:
+                conn.rollback()
+                raise
+            conn.commit()
+
+    def migrate(self) -> int:
+        with self.connect() as conn:
+            return migrate(conn)
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+def migrate(conn: sqlite3.Connection, target: Optional[int] = None) -> int:
+    """Bring the database up to schema version `target` (default: the
+    latest) and return it."""
+    target = len(MIGRATIONS) if target is None else target
+    register_functions(conn)
+    c = conn.cursor()
+    version = c.execute("PRAGMA user_version").fetchone()[0]
+    if version == 0:
+        # Databases created before versioning already have the documents table
+        has_documents = c.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'documents'"
+        ).fetchone()
+        if has_documents:
+            version = 1
+
+    for next_version, migration in enumerate(MIGRATIONS[version:target], start=version + 1):
+        # Each migration and its version bump commit together
+        c.execute("BEGIN IMMEDIATE")
+        try:
+            # Another process may have applied it while we waited for the lock
+            if c.execute("PRAGMA user_version").fetchone()[0] < next_version:
+                migration(c)
+                # PRAGMA doesn't accept parameters; the version is always an int
+                c.execute(f"PRAGMA user_version = {next_version}")
+        except BaseException:
+            c.execute("ROLLBACK")
+            raise
+        c.execute("COMMIT")
+    return max(version, target)
+
+
+@timed("db.insert_document")
+def insert_document(conn: sqlite3.Connection, filename: str, text: str, summary: str) -> int:
+    c = conn.cursor()
+    c.execute(
+        """
+        INSERT INTO documents (filename, original_text, summary, preview)
+        VALUES (?, '', ?, ?)
+        """,
+        (filename, summary, summary[:PREVIEW_LENGTH]),
+    )
+    document_id = c.lastrowid
+    c.execute(
+        "INSERT INTO document_texts (document_id, size, data) VALUES (?, ?, ?)",
+        (document_id, *_pack_text(text)),
+    )
+    # External-content FTS tables are not updated automatically
+    c.execute(
+        "INSERT INTO documents_fts (rowid, filename, summary, original_text) VALUES (?, ?, ?, ?)",
+        (document_id, filename, summary, text),
+    )
+    return document_id
+
+
+@timed("db.get_document")
+def get_document(conn: sqlite3.Connection, document_id: int) -> Optional[tuple]:
+    """(id, filename, summary, upload_date, text_size) without the text itself."""
+    return conn.execute(
+        """
+        SELECT d.id, d.filename, d.summary, d.upload_date, t.size
+        FROM documents d LEFT JOIN document_texts t ON t.document_id = d.id
+        WHERE d.id = ?
+        """,
+        (document_id,),
+    ).fetchone()
+
+
+@timed("db.iter_document_text")
+def iter_document_text(
+    conn: sqlite3.Connection, document_id: int, chunk_size: int = 64 * 1024
+) -> Optional[Iterator[str]]:
+    """Return an iterator over a document's extracted text, decompressed
+    `chunk_size` bytes at a time, or None if the document has no text.
+
+    Only the compressed blob is read here; the iterator does not use `conn`,
+    so it can outlive the borrowed connection (e.g. in a streamed response).
+    """
+    row = conn.execute("SELECT data FROM document_texts WHERE document_id = ?", (document_id,)).fetchone()
+    if row is None:
+        return None
+
+    def decompress(data):
+        decompressor = zlib.decompressobj()
+        decoder = codecs.getincrementaldecoder("utf-8")()
+        for start in range(0, len(data), chunk_size):
+            piece = decompressor.decompress(data[start : start + chunk_size], chunk_size)
+            while piece:
+                yield decoder.decode(piece)
+                piece = decompressor.decompress(decompressor.unconsumed_tail, chunk_size)
+        yield decoder.decode(decompressor.flush(), final=True)
+
+    return decompress(row[0])
+
+
+@timed("db.list_documents")
+def list_documents(
+    conn: sqlite3.Connection, limit: int = 20, before: Optional[Tuple[str, int]] = None
+) -> Tuple[List[tuple], Optional[Tuple[str, int]]]:
+    """Return one page of (id, filename, preview, upload_date) rows, newest
+    first, and the cursor for the next page (None on the last page).
+
+    `before` is the (upload_date, id) of the last row of the previous page;
+    seeking past it through the index keeps every page equally cheap.
+    """
+    c = conn.cursor()
+    if before is None:
+        c.execute(
+            """
+            SELECT id, filename, preview, upload_date FROM documents
+            ORDER BY upload_date DESC, id DESC LIMIT ?
+            """,
+            (limit + 1,),
+        )
+    else:
+        c.execute(
+            """
+            SELECT id, filename, preview, upload_date FROM documents
+            WHERE (upload_date, id) < (?, ?)
+            ORDER BY upload_date DESC, id DESC LIMIT ?
+            """,
+            (before[0], before[1], limit + 1),
+        )
+    rows = c.fetchall()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = (rows[-1][3], rows[-1][0])
+    return rows, next_cursor
+
+
+def match_expression(query: str) -> Optional[str]:
+    """Turn free text into an FTS5 query that every word must match; a word
+    ending in * matches as a prefix. None if the text has no words."""
+    words = re.findall(r"\w+\*?", query)
+    if not words:
+        return None
+    # Quoting keeps FTS5 operators (AND, NEAR, column:) in user input literal
+    return " ".join(f'"{word[:-1]}"*' if word.endswith("*") else f'"{word}"' for word in words)
+
+
+@timed("db.search_documents")
+def search_documents(
+    conn: sqlite3.Connection, query: str, limit: int = 20, offset: int = 0
+) -> Tuple[List[tuple], bool]:
+    """Return one page of (id, filename, upload_date, highlighted filename,
+    snippet) rows for documents matching `query`, best match first, and
+    whether more pages follow.
+
+    Matches in the highlighted filename and snippet are wrapped in
+    MATCH_START/MATCH_END. A query matching more than SEARCH_CANDIDATES
+    documents ranks only the newest of them.
+    """
+    expression = match_expression(query)
+    if expression is None:
+        return [], False
+
+    weights = ", ".join(str(weight) for weight in SEARCH_WEIGHTS)
+    # FTS5 sorts by rank internally under ORDER BY rank LIMIT, so snippet()
+    # (which decompresses the document text) only runs for rows on this page.
+    # The rowid bound, found by walking the matches newest first without
+    # scoring them, keeps the ranking to SEARCH_CANDIDATES rows.
+    rows = conn.execute(
+        """
+        SELECT d.id, d.filename, d.upload_date, hits.filename_match, hits.snippet
+        FROM (
+            SELECT rowid, rank,
+                highlight(documents_fts, 0, ?, ?) AS filename_match,
+                snippet(documents_fts, -1, ?, ?, '...', 24) AS snippet
+            FROM documents_fts
+            WHERE documents_fts MATCH ? AND rank MATCH ?
+                AND rowid >= (
+                    SELECT min(rowid) FROM (
+                        SELECT rowid FROM documents_fts WHERE documents_fts MATCH ?
+                        ORDER BY rowid DESC LIMIT ?
+                    )
+                )
+            ORDER BY rank LIMIT ? OFFSET ?
+        ) hits
+        JOIN documents d ON d.id = hits.rowid
+        ORDER BY hits.rank
+        """,
+        (
+            MATCH_START,
+            MATCH_END,
+            MATCH_START,
+            MATCH_END,
+            expression,
+            f"bm25({weights})",
+            expression,
+            SEARCH_CANDIDATES,
+            limit + 1,
+            offset,
+        ),
+    ).fetchall()
+    return rows[:limit], len(rows) > limit
@@ -0,0 +1,175 @@
+"""Shared HTTP client for the Groq, ElevenLabs and PlayAI callers.
+
+One pooled keep-alive session per host (with a cap on open connections to
+that host), default timeouts, retries with jittered exponential backoff that
+honour Retry-After, and per-endpoint latency/error counters.
+"""
+
+import os
+import random
+import threading
+import time
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+
+# Status codes worth retrying: rate limiting and transient upstream failures
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+# Methods a server must handle the same way however often they are sent
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+
+
+def was_sent(error: requests.exceptions.RequestException) -> bool:
+    """Whether the request may have reached the server before `error`.
+
+    Not when the connection timed out, was refused or the host name did not
+    resolve: requests reports the last two as a ConnectionError wrapping
+    urllib3's NewConnectionError (NameResolutionError is a subclass).
+    """
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return False
+    reason = getattr(error.args[0], "reason", error.args[0]) if error.args else None
+    return not isinstance(reason, NewConnectionError)
+
+
+def backoff_delay(attempt: int, retry_after: Optional[str] = None, base: float = 0.5, cap: float = 30.0) -> float:
+    """Seconds to wait before retry number `attempt` (0-based).
+
+    A numeric Retry-After header from the server wins; otherwise use
+    exponential backoff with full jitter.
+    """
+    if retry_after:
+        try:
+            return min(float(retry_after), cap)
+        except ValueError:
+            pass
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+class EndpointStats:
+    __slots__ = ("requests", "errors", "retries", "total_seconds", "max_seconds", "status_counts")
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.status_counts: Dict[str, int] = {}
+
+    def as_dict(self) -> dict:
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "retries": self.retries,
+            "avg_seconds": self.total_seconds / self.requests if self.requests else 0.0,
+            "max_seconds": self.max_seconds,
+            "status": dict(self.status_counts),
+        }
+
+
+class HTTPClient:
+    def __init__(self, max_connections_per_host: int = 10, timeout: float = 60, max_retries: int = 3):
+        self.max_connections_per_host = max_connections_per_host
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self._sessions: Dict[str, requests.Session] = {}
+        self._stats: Dict[str, EndpointStats] = {}
+        self._lock = threading.Lock()
+
+    def _session(self, url: str) -> requests.Session:
+        parts = urlsplit(url)
+        origin = f"{parts.scheme}://{parts.netloc}"
+        with self._lock:
+            session = self._sessions.get(origin)
+            if session is None:
+                session = requests.Session()
+                # pool_block makes extra threads wait for a free connection
+                # instead of opening more than the per-host limit
+                adapter = HTTPAdapter(pool_maxsize=self.max_connections_per_host, pool_block=True)
+                session.mount(origin, adapter)
+                self._sessions[origin] = session
+            return session
+
+    def _record(self, endpoint: str, seconds: float, status: Optional[int], retried: bool):
+        with self._lock:
+            stats = self._stats.setdefault(endpoint, EndpointStats())
+            stats.requests += 1
+            stats.total_seconds += seconds
+            stats.max_seconds = max(stats.max_seconds, seconds)
+            if retried:
+                stats.retries += 1
+            if status is None or status >= 400:
+                stats.errors += 1
+            key = str(status) if status is not None else "connection_error"
+            stats.status_counts[key] = stats.status_counts.get(key, 0) + 1
+
+    def request(
+        self,
+        method: str,
+        url: str,
+        endpoint: Optional[str] = None,
+        retries: Optional[int] = None,
+        retry_status=RETRYABLE_STATUS,
+        retry_errors: Optional[bool] = None,
+        **kwargs,
+    ) -> requests.Response:
+        """Send a request, retrying connection errors and `retry_status`
+        responses. Returns the last response (whatever its status) or raises
+        the last requests exception.
+
+        A connection that dropped or timed out after the request went out
+        may still have been processed, so such errors are only retried for
+        idempotent methods, or when `retry_errors` says the request is safe
+        to repeat. Failures to connect at all are always retried.
+        """
+        retries = self.max_retries if retries is None else retries
+        if retry_errors is None:
+            retry_errors = method.upper() in IDEMPOTENT_METHODS
+        endpoint = endpoint or f"{urlsplit(url).netloc}{urlsplit(url).path}"
+        kwargs.setdefault("timeout", self.timeout)
+        session = self._session(url)
+
+        for attempt in range(retries + 1):
+            start = time.perf_counter()
+            try:
+                response = session.request(method, url, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                self._record(endpoint, time.perf_counter() - start, None, attempt > 0)
+                if attempt == retries or (was_sent(e) and not retry_errors):
+                    raise
+                time.sleep(backoff_delay(attempt))
+                continue
+
+            self._record(endpoint, time.perf_counter() - start, response.status_code, attempt > 0)
+            if response.status_code in retry_status and attempt < retries:
+                time.sleep(backoff_delay(attempt, response.headers.get("Retry-After")))
+                continue
+            return response
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+    def metrics(self) -> Dict[str, dict]:
+        """Per-endpoint request counts, error counts and latency."""
+        with self._lock:
+            return {endpoint: stats.as_dict() for endpoint, stats in self._stats.items()}
+
+    def close(self):
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions.clear()
+
+
+# Process-wide client shared by app.py, the summarizer and the podcast scripts
+client = HTTPClient(
+    max_connections_per_host=int(os.getenv("HTTP_MAX_CONNECTIONS_PER_HOST", "10")),
+    timeout=float(os.getenv("HTTP_TIMEOUT", "60")),
+)
@@ -0,0 +1,337 @@
+"""Stage timing, Prometheus metrics and slow-request profiling.
+
+Shared by the Flask app and the inference server, which puts the
+repository root on sys.path to import it, so it needs nothing beyond the
+standard library.
+
+Stages are timed with span(), timed() or timed_iter() into one histogram,
+stage_seconds{stage="..."}; the web apps add http_request_seconds. render()
+writes every metric in the Prometheus text format for a /metrics endpoint.
+
+While `profiler` is enabled (PROFILE_REQUESTS=1, or toggled with SIGUSR2),
+requests and jobs are profiled, and those slower than PROFILE_SLOW_MS are
+written to PROFILE_DIR in two forms:
+  - <name>.prof: cProfile of the request's own thread, for pstats or
+    snakeviz (for one request at a time; overlapping ones only get samples).
+    Python-heavy stages like PDF parsing run several times slower under it;
+    PROFILE_CPROFILE=0 keeps only the samples, which cost a few percent.
+  - <name>.folded: stack samples of every thread, in the collapsed format of
+    `py-spy record --format raw`, for flamegraph.pl or speedscope. This one
+    also covers the worker threads a request waits on.
+"""
+
+import bisect
+import collections
+import cProfile
+import functools
+import os
+import re
+import signal
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Iterator, Optional, Sequence, Tuple
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+# Seconds; from a single decode step to a whole podcast
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+INF = 'le="+Inf"'
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [count per bucket..., count above the last, sum]
+        self._series: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        # bisect_left: a value equal to a bound belongs in that bucket (le)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def render(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            series = sorted((key, list(values)) for key, values in self._series.items())
+        for key, values in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets, values):
+                cumulative += count
+                le = f'le="{_number(bound)}"'
+                yield f"{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}"
+            count = cumulative + values[-2]
+            yield f"{self.name}_bucket{_labels(self.labelnames, key, INF)} {count}"
+            yield f"{self.name}_sum{_labels(self.labelnames, key)} {values[-1]}"
+            yield f"{self.name}_count{_labels(self.labelnames, key)} {count}"
+
+
+class Gauge:
+    """A value read when metrics are scraped; `read` returns None to omit it."""
+
+    def __init__(self, name: str, help: str, read: Callable[[], Optional[float]]):
+        self.name = name
+        self.help = help
+        self.read = read
+
+    def render(self) -> Iterator[str]:
+        value = self.read()
+        if value is None:
+            return
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} gauge"
+        yield f"{self.name} {_number(value)}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        with self._lock:
+            return self._metrics.setdefault(name, Histogram(name, help, labelnames, buckets))
+
+    def gauge(self, name: str, help: str, read: Callable[[], Optional[float]]) -> Gauge:
+        with self._lock:
+            gauge = self._metrics[name] = Gauge(name, help, read)
+            return gauge
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "".join(line + "\n" for metric in metrics for line in metric.render())
+
+
+REGISTRY = Registry()
+STAGE_SECONDS = REGISTRY.histogram("stage_seconds", "Time spent in each pipeline stage", ("stage",))
+REQUEST_SECONDS = REGISTRY.histogram(
+    "http_request_seconds", "Time to handle a request (up to the headers, for streamed responses)", ("method", "route", "status")
+)
+
+
+def render() -> str:
+    return REGISTRY.render()
+
+
+def observe(stage: str, seconds: float):
+    STAGE_SECONDS.observe(seconds, stage=stage)
+
+
+@contextmanager
+def span(stage: str) -> Iterator[None]:
+    """Time the block into stage_seconds{stage=...}, failed or not."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(stage, time.perf_counter() - start)
+
+
+def timed(stage: str):
+    """Decorator: time every call of the function as `stage`."""
+
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with span(stage):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorate
+
+
+_nesting = threading.local()
+
+
+def timed_iter(iterable: Iterable, stage: str) -> Iterator:
+    """Yield from `iterable`, timing the work that produces each item as
+    `stage`. Pipelined generators (pages -> chunks) pull from each other
+    inside next(), so time spent in a timed_iter nested within another is
+    counted for the inner stage only."""
+    iterator = iter(iterable)
+    while True:
+        outer = getattr(_nesting, "seconds", 0.0)
+        _nesting.seconds = 0.0
+        start = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+        finally:
+            elapsed = time.perf_counter() - start
+            observe(stage, elapsed - _nesting.seconds)
+            _nesting.seconds = outer + elapsed
+        yield item
+
+
+def _sample_stacks(skip: int) -> collections.Counter:
+    """One sample of every thread's stack but `skip`'s, collapsed to
+    "thread;outermost (file:line);...;innermost (file:line)"."""
+    names = {thread.ident: thread.name for thread in threading.enumerate()}
+    stacks = collections.Counter()
+    for ident, frame in sys._current_frames().items():
+        if ident == skip:
+            continue
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append(f"{code.co_name} ({code.co_filename}:{frame.f_lineno})")
+            frame = frame.f_back
+        stack.append(names.get(ident, str(ident)))
+        stacks[";".join(reversed(stack))] += 1
+    return stacks
+
+
+class ProfileSession:
+    def __init__(self, profiler: "Profiler", name: str, cprofile: bool):
+        self.profiler = profiler
+        self.name = name
+        self.stacks = collections.Counter()
+        self.profile = cProfile.Profile() if cprofile else None
+        self.start = time.perf_counter()
+
+    def stop(self) -> Optional[str]:
+        """Stop profiling; returns the path the profile was written to
+        (without extension) if the request was slow."""
+        elapsed = time.perf_counter() - self.start
+        self.profiler.end(self)
+        if elapsed < self.profiler.slow_seconds:
+            return None
+        return self.profiler.write(self, elapsed)
+
+
+class Profiler:
+    """Profiles requests while enabled and keeps the slow ones.
+
+    One sampler thread records stacks for every open session. cProfile runs
+    for one session at a time (Python allows a single active profiler), and
+    only sees the thread it runs on: pass cprofile=False where that thread
+    merely awaits (an asyncio handler) and rely on the stack samples.
+    """
+
+    def __init__(
+        self,
+        output_dir: str = "profiles",
+        slow_seconds: float = 1.0,
+        interval: float = 0.005,
+        enabled: bool = False,
+        cprofile: bool = True,
+    ):
+        self.output_dir = output_dir
+        self.slow_seconds = slow_seconds
+        self.interval = interval
+        self.enabled = enabled
+        self.cprofile = cprofile
+        self._sessions = set()
+        self._cprofiling = False
+        self._sampling = False
+        self._lock = threading.Lock()
+
+    def start(self, name: str, cprofile: bool = True) -> Optional[ProfileSession]:
+        """A running session, or None when profiling is off."""
+        if not self.enabled:
+            return None
+        with self._lock:
+            cprofile = cprofile and self.cprofile and not self._cprofiling
+            self._cprofiling = self._cprofiling or cprofile
+            session = ProfileSession(self, name, cprofile)
+            self._sessions.add(session)
+            if not self._sampling:
+                self._sampling = True
+                threading.Thread(target=self._sample, name="profile-sampler", daemon=True).start()
+        if session.profile is not None:
+            session.profile.enable()
+        return session
+
+    def end(self, session: ProfileSession):
+        if session.profile is not None:
+            session.profile.disable()
+        with self._lock:
+            self._sessions.discard(session)
+            if session.profile is not None:
+                self._cprofiling = False
+
+    def _sample(self):
+        own = threading.get_ident()
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                sessions = list(self._sessions)
+                if not sessions:
+                    # start() launches a new sampler for the next session
+                    self._sampling = False
+                    return
+            stacks = _sample_stacks(own)
+            for session in sessions:
+                session.stacks.update(stacks)
+
+    @contextmanager
+    def profile(self, name: str, cprofile: bool = True) -> Iterator[None]:
+        session = self.start(name, cprofile)
+        try:
+            yield
+        finally:
+            if session is not None:
+                session.stop()
+
+    def write(self, session: ProfileSession, elapsed: float) -> str:
+        os.makedirs(self.output_dir, exist_ok=True)
+        slug = re.sub(r"[^A-Za-z0-9]+", "_", session.name).strip("_")[:60]
+        path = os.path.join(self.output_dir, f"{time.strftime('%Y%m%d-%H%M%S')}-{elapsed * 1000:.0f}ms-{slug}")
+        if session.profile is not None:
+            session.profile.dump_stats(path + ".prof")
+        with open(path + ".folded", "w", encoding="utf-8") as f:
+            for stack, count in session.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        print(f"Profiled slow request '{session.name}' ({elapsed:.2f}s): {path}")
+        return path
+
+    def toggle(self):
+        self.enabled = not self.enabled
+        print(f"Request profiling {'enabled' if self.enabled else 'disabled'} (slower than {self.slow_seconds:.2f}s is kept)")
+
+    def install_toggle(self, signum: Optional[int] = getattr(signal, "SIGUSR2", None)) -> bool:
+        """Toggle profiling on `signum` (kill -USR2 <pid>). Signal handlers
+        can only be set from the main thread, and not on Windows."""
+        if signum is None or threading.current_thread() is not threading.main_thread():
+            return False
+        signal.signal(signum, lambda *_: self.toggle())
+        return True
+
+
+# Process-wide profiler, configured like http_client.client
+profiler = Profiler(
+    output_dir=os.getenv("PROFILE_DIR", "profiles"),
+    slow_seconds=float(os.getenv("PROFILE_SLOW_MS", "1000")) / 1000,
+    interval=float(os.getenv("PROFILE_INTERVAL_MS", "5")) / 1000,
+    enabled=os.getenv("PROFILE_REQUESTS") == "1",
+    cprofile=os.getenv("PROFILE_CPROFILE", "1") == "1",
+)
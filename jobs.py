@@ -0,0 +1,151 @@
+"""Background job queue backed by a SQLite table.
+
+Jobs are rows in the `jobs` table (created by the db migrations), so
+anything queued or interrupted by a restart is picked up again when the
+workers start. A small pool of worker threads claims queued jobs one at a
+time and runs the handler registered for the job's kind; handlers report
+progress through a callback that is written back to the row for the status
+endpoint to read.
+"""
+
+import json
+import sqlite3
+import threading
+import traceback
+from typing import Callable, Dict, Optional
+
+from db import Database
+from instrumentation import profiler, span
+
+# handler(payload, report) -> result; report(stage, progress) records progress
+JobHandler = Callable[[dict, Callable[[str, float], None]], Optional[dict]]
+
+JOB_COLUMNS = ("id", "kind", "status", "stage", "progress", "payload", "result", "error", "created_at", "updated_at")
+
+# How long a failed job keeps showing up in recent() before it ages out
+FAILED_JOB_SECONDS = 600
+
+
+class JobQueue:
+    def __init__(self, db: Database, workers: int = 2, poll_interval: float = 5.0):
+        self.db = db
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.handlers: Dict[str, JobHandler] = {}
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._threads = []
+        self._start_lock = threading.Lock()
+
+    def register(self, kind: str, handler: JobHandler):
+        self.handlers[kind] = handler
+
+    def submit(self, kind: str, payload: dict) -> int:
+        with self.db.transaction() as conn:
+            c = conn.execute("INSERT INTO jobs (kind, payload) VALUES (?, ?)", (kind, json.dumps(payload)))
+            job_id = c.lastrowid
+        self._wakeup.set()
+        return job_id
+
+    def get(self, job_id: int) -> Optional[dict]:
+        with self.db.connect() as conn:
+            row = conn.execute(f"SELECT {', '.join(JOB_COLUMNS)} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._to_dict(row) if row else None
+
+    def recent(self, limit: int = 10, include_done: bool = False, failed_seconds: int = FAILED_JOB_SECONDS) -> list:
+        """Queued and running jobs, plus those that failed in the last
+        `failed_seconds`; every job when `include_done` is set."""
+        if include_done:
+            where, params = "", ()
+        else:
+            # updated_at is CURRENT_TIMESTAMP, so compare against UTC text
+            where = (
+                "WHERE status IN ('queued', 'running') "
+                "OR (status = 'failed' AND updated_at >= datetime('now', ?))"
+            )
+            params = (f"-{int(failed_seconds)} seconds",)
+        with self.db.connect() as conn:
+            rows = conn.execute(
+                f"SELECT {', '.join(JOB_COLUMNS)} FROM jobs {where} ORDER BY id DESC LIMIT ?", (*params, limit)
+            ).fetchall()
+        return [self._to_dict(row) for row in rows]
+
+    @staticmethod
+    def _to_dict(row) -> dict:
+        job = dict(zip(JOB_COLUMNS, row))
+        job["payload"] = json.loads(job["payload"])
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def _update(self, job_id: int, **fields):
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self.db.transaction() as conn:
+            conn.execute(
+                f"UPDATE jobs SET {assignments}, updated_at = CURRENT_TIMESTAMP WHERE id = ?",
+                (*fields.values(), job_id),
+            )
+
+    def _claim(self) -> Optional[dict]:
+        """Atomically move the oldest queued job to running and return it."""
+        with self.db.transaction(immediate=True) as conn:
+            row = conn.execute(
+                f"SELECT {', '.join(JOB_COLUMNS)} FROM jobs WHERE status = 'queued' ORDER BY id LIMIT 1"
+            ).fetchone()
+            if row:
+                conn.execute(
+                    "UPDATE jobs SET status = 'running', stage = 'starting', updated_at = CURRENT_TIMESTAMP "
+                    "WHERE id = ?",
+                    (row[0],),
+                )
+        return self._to_dict(row) if row else None
+
+    def _run(self, job: dict):
+        job_id = job["id"]
+        handler = self.handlers.get(job["kind"])
+        if handler is None:
+            self._update(job_id, status="failed", error=f"No handler for job kind '{job['kind']}'")
+            return
+
+        def report(stage: str, progress: float):
+            self._update(job_id, stage=stage, progress=progress)
+
+        try:
+            # Uploads do their slow work here, not in the request that queued them
+            with span(f"job.{job['kind']}"), profiler.profile(f"job {job['kind']} {job_id}"):
+                result = handler(job["payload"], report)
+            self._update(job_id, status="done", stage="done", progress=1.0, result=json.dumps(result or {}))
+        except Exception as e:
+            traceback.print_exc()
+            self._update(job_id, status="failed", stage="failed", error=str(e))
+
+    def _worker(self):
+        while not self._stop.is_set():
+            try:
+                job = self._claim()
+            except sqlite3.Error as e:
+                print(f"Job queue error: {str(e)}")
+                job = None
+
+            if job is None:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+            self._run(job)
+
+    def start(self):
+        """Start the worker threads once, re-queueing jobs a previous process
+        left in the running state."""
+        with self._start_lock:
+            if self._threads:
+                return
+            with self.db.transaction() as conn:
+                conn.execute("UPDATE jobs SET status = 'queued', stage = 'queued' WHERE status = 'running'")
+
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._worker, name=f"job-worker-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def stop(self):
+        self._stop.set()
+        self._wakeup.set()
@@ -0,0 +1,96 @@
+"""Page-streaming PDF text extraction.
+
+Pages are yielded in order as soon as they are extracted, so callers can
+start chunking and summarizing the beginning of a document while the rest is
+still being read. Large documents are split into page batches that a process
+pool extracts in parallel.
+
+The pool's workers are spawned, not forked: callers run in threaded servers,
+and a forked child can inherit a lock some other thread held at that moment
+and wait on it forever. Spawning costs a fresh interpreter per worker, so
+one pool per worker count is kept for the life of the process.
+
+A spawned worker normally re-runs the parent's main module first, which for
+`python app.py` means the whole app's setup (database, caches, tokenizer)
+in every worker. While workers start, the main module is made to name this
+module instead, as `python -m pdf_extract` would, so they import nothing
+else. PDF_EXTRACT_WORKERS caps the pool (default: 4, or fewer cores).
+"""
+
+import multiprocessing
+import os
+import sys
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Optional
+
+import PyPDF2
+
+# Below this many pages the process pool start-up costs more than it saves
+PARALLEL_PAGE_THRESHOLD = 64
+PAGES_PER_BATCH = 16
+DEFAULT_WORKERS = int(os.getenv("PDF_EXTRACT_WORKERS", "0")) or min(os.cpu_count() or 1, 4)
+
+_pools: Dict[int, ProcessPoolExecutor] = {}
+# Held while workers may be spawned, i.e. around pool creation and submits
+_pools_lock = threading.Lock()
+
+
+@contextmanager
+def _main_is_this_module():
+    """Spawned workers run the module that __main__.__spec__ names as their
+    main module; point it here (see the module docstring)."""
+    main = sys.modules["__main__"]
+    spec = getattr(main, "__spec__", None)
+    main.__spec__ = __spec__
+    try:
+        yield
+    finally:
+        main.__spec__ = spec
+
+
+def _map_batches(workers: int, file_path: str, starts, stops) -> Iterator[List[str]]:
+    with _pools_lock, _main_is_this_module():
+        pool = _pools.get(workers)
+        if pool is None:
+            pool = _pools[workers] = ProcessPoolExecutor(
+                max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        # map() submits every batch, spawning any workers it needs, right away
+        return pool.map(_extract_page_range, [file_path] * len(starts), starts, stops)
+
+
+def _extract_page_range(file_path: str, start: int, stop: int) -> List[str]:
+    with open(file_path, "rb") as file:
+        pdf_reader = PyPDF2.PdfReader(file)
+        return [pdf_reader.pages[i].extract_text() or "" for i in range(start, stop)]
+
+
+def count_pages(file_path: str) -> int:
+    with open(file_path, "rb") as file:
+        return len(PyPDF2.PdfReader(file).pages)
+
+
+def iter_pages(
+    file_path: str,
+    workers: Optional[int] = None,
+    parallel_threshold: int = PARALLEL_PAGE_THRESHOLD,
+    pages_per_batch: int = PAGES_PER_BATCH,
+) -> Iterator[str]:
+    """Yield the text of every page of the PDF, in page order."""
+    workers = workers or DEFAULT_WORKERS
+    page_count = count_pages(file_path)
+
+    if workers < 2 or page_count < parallel_threshold:
+        with open(file_path, "rb") as file:
+            pdf_reader = PyPDF2.PdfReader(file)
+            for page in pdf_reader.pages:
+                yield page.extract_text() or ""
+        return
+
+    starts = range(0, page_count, pages_per_batch)
+    stops = [min(start + pages_per_batch, page_count) for start in starts]
+    # map() returns batches in order, each as soon as it and its predecessors are done
+    for batch in _map_batches(workers, file_path, starts, stops):
+        yield from batch
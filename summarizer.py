@@ -0,0 +1,221 @@
+"""Concurrent chunk summarization against the Groq chat completions API."""
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import requests
+
+from http_client import client
+from instrumentation import span
+from summary_cache import SummaryCache, content_hash
+
+DEFAULT_GROQ_API_URL = "https://api.groq.com/openai/v1/chat/completions"
+GROQ_MODEL = "llama3-70b-8192"
+# Bump whenever the prompts below change so cached summaries are not reused
+PROMPT_VERSION = "1"
+SYSTEM_PROMPT = "You are a professional document summarizer. Provide clear, accurate, and concise summaries."
+
+
+class GroqAPIError(Exception):
+    """Raised when a Groq request fails after all retries."""
+
+    def __init__(self, message: str, status_code: Optional[int] = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def chunk_prompt(chunk: str) -> str:
+    return f"""Please provide a concise summary of the following text. Focus on the main points and key information:
+
+{chunk}
+
+Provide the summary in a clear, professional style."""
+
+
+def reduce_prompt(combined_summary: str) -> str:
+    return f"""Please provide a unified summary of these related text segments:
+
+{combined_summary}
+
+Create a coherent, flowing summary that captures the main points from all segments."""
+
+
+def call_groq(
+    prompt: str,
+    api_key: str,
+    api_url: str = DEFAULT_GROQ_API_URL,
+    max_tokens: int = 1000,
+    temperature: float = 0.3,
+    max_retries: int = 5,
+    timeout: float = 60,
+) -> str:
+    """Send one summarization prompt to Groq, retrying on 429/5xx."""
+    headers = {
+        "Authorization": f"Bearer {api_key}",
+        "Content-Type": "application/json",
+    }
+    payload = {
+        "messages": [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": prompt},
+        ],
+        "model": GROQ_MODEL,
+        "temperature": temperature,
+        "max_tokens": max_tokens,
+    }
+
+    try:
+        with span("groq.summarize"):
+            response = client.post(
+                api_url,
+                headers=headers,
+                json=payload,
+                timeout=timeout,
+                retries=max_retries,
+                # A repeated completion only costs tokens
+                retry_errors=True,
+                endpoint="groq.chat",
+            )
+        response.raise_for_status()
+        return response.json()["choices"][0]["message"]["content"]
+    except requests.exceptions.HTTPError as e:
+        raise GroqAPIError(f"Error calling Groq API: {str(e)}", status_code=e.response.status_code)
+    except requests.exceptions.RequestException as e:
+        raise GroqAPIError(f"Error calling Groq API: {str(e)}")
+
+
+def _map_summaries(
+    kind: str,
+    texts: Iterable[str],
+    api_key: str,
+    max_workers: int,
+    cache: Optional[SummaryCache] = None,
+    **groq_kwargs,
+) -> Tuple[List[str], int, int]:
+    """Summarize `texts` concurrently, returning the replies in input order
+    and this call's cache hits and misses.
+
+    `kind` selects the prompt ("chunk" or "reduce"). `texts` may be a lazy
+    iterator: each text is submitted as soon as it is produced. With a cache,
+    only texts whose content hash has not been summarized before are sent
+    to Groq, and repeated texts are sent once.
+    """
+    build_prompt = chunk_prompt if kind == "chunk" else reduce_prompt
+    keys = []
+    pending = {}
+    cached = {}
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+        for text in texts:
+            key = SummaryCache.make_key(kind, content_hash(text), GROQ_MODEL, PROMPT_VERSION)
+            keys.append(key)
+            if key in pending or key in cached:
+                continue
+            hit = cache.get(key) if cache is not None else None
+            if hit is not None:
+                cached[key] = hit
+            else:
+                pending[key] = pool.submit(call_groq, build_prompt(text), api_key, **groq_kwargs)
+
+        fresh = [(key, future.result()) for key, future in pending.items()]
+
+    hits = len(cached)
+    cached.update(fresh)
+    if cache is not None and fresh:
+        cache.put_many(kind, fresh)
+
+    return [cached[key] for key in keys], hits, len(fresh)
+
+
+def summarize_chunks(
+    chunks: Iterable[str], api_key: str, max_workers: int = 4, cache: Optional[SummaryCache] = None, **groq_kwargs
+) -> List[str]:
+    """Summarize every chunk concurrently and return the summaries in chunk order.
+
+    At most `max_workers` requests are in flight at once; each one backs off
+    independently when Groq rate-limits it.
+    """
+    return _map_summaries("chunk", chunks, api_key, max_workers, cache=cache, **groq_kwargs)[0]
+
+
+def group_summaries(summaries: List[str], fan_in: int, max_group_chars: int) -> List[List[str]]:
+    """Split summaries into consecutive groups of at most `fan_in` items and
+    `max_group_chars` characters (a single oversized summary gets its own group)."""
+    groups = []
+    current = []
+    current_length = 0
+
+    for summary in summaries:
+        if current and (len(current) >= fan_in or current_length + len(summary) > max_group_chars):
+            groups.append(current)
+            current = []
+            current_length = 0
+        current.append(summary)
+        current_length += len(summary) + 2
+
+    if current:
+        groups.append(current)
+
+    return groups
+
+
+def summarize_hierarchical(
+    chunks: Iterable[str],
+    api_key: str,
+    fan_in: int = 4,
+    target_chars: int = 4000,
+    max_group_chars: int = 16000,
+    max_workers: int = 4,
+    max_levels: int = 8,
+    cache: Optional[SummaryCache] = None,
+    **groq_kwargs,
+) -> Tuple[str, List[Dict]]:
+    """Tree map-reduce summarization.
+
+    Level 0 summarizes every chunk. Each following level merges groups of up
+    to `fan_in` summaries into one, in parallel, until the joined result fits
+    in `target_chars`. Returns the final summary and per-level stats: timing,
+    and the cache hits and misses of this call alone.
+    """
+    if fan_in < 2:
+        raise ValueError("fan_in must be at least 2")
+
+    levels = []
+
+    start = time.perf_counter()
+    summaries, hits, misses = _map_summaries("chunk", chunks, api_key, max_workers, cache=cache, **groq_kwargs)
+    levels.append(
+        {
+            "level": 0,
+            "inputs": len(summaries),
+            "outputs": len(summaries),
+            "seconds": time.perf_counter() - start,
+            "cache_hits": hits,
+            "cache_misses": misses,
+        }
+    )
+
+    while len(summaries) > 1:
+        combined_summary = "\n\n".join(summaries)
+        if len(combined_summary) <= target_chars:
+            return combined_summary, levels
+        if len(levels) > max_levels:
+            raise GroqAPIError(f"Summary did not converge after {max_levels} reduce levels")
+
+        start = time.perf_counter()
+        groups = group_summaries(summaries, fan_in, max_group_chars)
+        merged = ["\n\n".join(group) for group in groups]
+        summaries, hits, misses = _map_summaries("reduce", merged, api_key, max_workers, cache=cache, **groq_kwargs)
+        levels.append(
+            {
+                "level": len(levels),
+                "inputs": sum(len(group) for group in groups),
+                "outputs": len(summaries),
+                "seconds": time.perf_counter() - start,
+                "cache_hits": hits,
+                "cache_misses": misses,
+            }
+        )
+
+    return (summaries[0] if summaries else ""), levels
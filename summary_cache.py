@@ -0,0 +1,140 @@
+"""Persistent, content-addressed cache for Groq summaries.
+
+Entries are keyed by a SHA-256 of their content plus the model and prompt
+version, so re-uploading a PDF (or one that shares most of its chunks with
+an earlier upload) skips the Groq calls for everything that did not change.
+The cache lives in its own SQLite file and is trimmed least-recently-used
+first once it grows past `max_bytes`.
+"""
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, Optional, Tuple
+
+
+def content_hash(data) -> str:
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    return hashlib.sha256(data).hexdigest()
+
+
+def file_hash(file_path: str) -> str:
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as file:
+        for block in iter(lambda: file.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class SummaryCache:
+    def __init__(self, path: str = "summary_cache.db", max_bytes: int = 256 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        # Totals for the life of the process, across every job worker
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._init_db()
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def _init_db(self):
+        conn = self._connect()
+        c = conn.cursor()
+        c.execute(
+            """
+            CREATE TABLE IF NOT EXISTS cache_entries (
+                key TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                last_used REAL NOT NULL
+            )
+        """
+        )
+        c.execute("CREATE INDEX IF NOT EXISTS idx_cache_entries_last_used ON cache_entries (last_used)")
+        conn.commit()
+        conn.close()
+
+    @staticmethod
+    def make_key(kind: str, content_digest: str, model: str, prompt_version: str) -> str:
+        return content_hash(f"{kind}\0{model}\0{prompt_version}\0{content_digest}")
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, str]:
+        """Return the cached values for whichever of `keys` are present."""
+        keys = list(dict.fromkeys(keys))
+        if not keys:
+            return {}
+
+        found = {}
+        conn = self._connect()
+        c = conn.cursor()
+        # Stay well below SQLite's bound-parameter limit
+        for i in range(0, len(keys), 500):
+            batch = keys[i : i + 500]
+            placeholders = ",".join("?" * len(batch))
+            c.execute(f"SELECT key, value FROM cache_entries WHERE key IN ({placeholders})", batch)
+            found.update(c.fetchall())
+        if found:
+            now = time.time()
+            c.executemany("UPDATE cache_entries SET last_used = ? WHERE key = ?", [(now, key) for key in found])
+            conn.commit()
+        conn.close()
+
+        with self._lock:
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def get(self, key: str) -> Optional[str]:
+        return self.get_many([key]).get(key)
+
+    def put_many(self, kind: str, items: Iterable[Tuple[str, str]]):
+        now = time.time()
+        rows = [(key, kind, value, len(value.encode("utf-8")), now) for key, value in items]
+        if not rows:
+            return
+
+        conn = self._connect()
+        c = conn.cursor()
+        c.executemany(
+            "INSERT OR REPLACE INTO cache_entries (key, kind, value, size, last_used) VALUES (?, ?, ?, ?, ?)",
+            rows,
+        )
+        self._evict(c)
+        conn.commit()
+        conn.close()
+
+    def put(self, kind: str, key: str, value: str):
+        self.put_many(kind, [(key, value)])
+
+    def _evict(self, c):
+        """Drop least-recently-used entries until the cache fits in max_bytes."""
+        c.execute("SELECT COALESCE(SUM(size), 0) FROM cache_entries")
+        excess = c.fetchone()[0] - self.max_bytes
+        if excess <= 0:
+            return
+
+        c.execute("SELECT key, size FROM cache_entries ORDER BY last_used")
+        victims = []
+        for key, size in c.fetchall():
+            if excess <= 0:
+                break
+            victims.append((key,))
+            excess -= size
+        c.executemany("DELETE FROM cache_entries WHERE key = ?", victims)
+
+    def get_document(self, key: str) -> Optional[Tuple[str, str]]:
+        """Return (text, summary) for a previously summarized document, if cached."""
+        value = self.get(key)
+        if value is None:
+            return None
+        document = json.loads(value)
+        return document["text"], document["summary"]
+
+    def put_document(self, key: str, text: str, summary: str):
+        self.put("document", key, json.dumps({"text": text, "summary": summary}))